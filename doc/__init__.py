@@ -1,4 +1,5 @@
 from .doc_id import *
+from .store import *
 
 
 class DocumentScoring:
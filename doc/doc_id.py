@@ -3,6 +3,8 @@ import os
 from typing import Dict
 from urllib.parse import urldefrag
 
+from .store import DocumentStore, ReopeningDocumentStore, write_document_store
+
 
 def from_document_dictionary(name):
     with open(f'{name}/doc_id.reference') as reference:
@@ -14,6 +16,18 @@ def from_document_dictionary(name):
     return dictionary
 
 
+def from_document_store(name, reopening: bool = False) -> DocumentStore or ReopeningDocumentStore:
+    """
+    Open the document store of an index. Indexes built before the store existed have it written from their
+    doc_id.reference first.
+    :param reopening: open a store that can be reopened once incremental updates rewrite it
+    """
+    store = f'{name}/doc_id.store'
+    if not os.path.exists(store) or os.path.getmtime(store) < os.path.getmtime(f'{name}/doc_id.reference'):
+        write_document_store(from_document_dictionary(name), store)
+    return ReopeningDocumentStore(store) if reopening else DocumentStore(store)
+
+
 def normalize_url(url: str):
     return urldefrag(url)[0].rstrip()
 
@@ -39,6 +53,18 @@ class DocumentIdDictionary:
         self.doc_id[t[1]] = t
         self.reverse_map[int(t[0])] = t
         self.url_map[t[2]] = t
+        self.counter = max(self.counter, t[0] + 1)
+
+    def remove_document(self, file: str) -> int:
+        """
+        Forget a document, so its file can be given a new doc_id. The doc_id is not reused.
+        :return: the doc_id of the document
+        """
+        t = self.doc_id.pop(file)
+        del self.reverse_map[t[0]]
+        if self.url_map.get(t[2]) is t:
+            del self.url_map[t[2]]
+        return t[0]
 
     def set_name(self, name: str):
         self.name = name
@@ -52,17 +78,26 @@ class DocumentIdDictionary:
         """
         if file in self.doc_id:
             return self.doc_id[file][0]
-        counter = self.counter
-        self.counter += 1
-        t = [counter, file, url]
+        return self.assign(self.counter, file, url)
+
+    def assign(self, doc_id: int, file: str, url: str) -> int:
+        """
+        Store a document under a doc_id chosen by the caller, such as one reserved for it before it was tokenized.
+        Doc_ids generated afterwards follow the largest one assigned.
+        :return: the doc_id
+        """
+        if file in self.doc_id or doc_id in self.reverse_map:
+            raise ValueError(f"{file} or doc_id {doc_id} already has a document")
+        self.counter = max(self.counter, doc_id + 1)
+        t = [doc_id, file, url]
         t.extend([None] * len(self.property_map))
         # doc_id maps the file name to the tuple
         self.doc_id[file] = t
         # reverse map maps the doc_id to the tuple
-        self.reverse_map[counter] = t
+        self.reverse_map[doc_id] = t
         # url maps the url to the tuple
         self.url_map[url] = t
-        return counter
+        return doc_id
 
     def find_doc_id(self, file: str) -> int:
         return self.doc_id[file][0]
@@ -116,6 +151,7 @@ class DocumentIdDictionary:
                 row = {element: self.doc_id[key][self.property_map[element]]
                        for element in self.property_index}
                 writer.writerow(row)
+        write_document_store(self, f'{self.name}/doc_id.store')
 
     def close(self):
         self.flush()
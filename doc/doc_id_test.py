@@ -0,0 +1,22 @@
+import unittest
+
+from .doc_id import DocumentIdDictionary
+
+
+class DocumentIdTest(unittest.TestCase):
+    def test_assign(self):
+        dictionary = DocumentIdDictionary("", ["count"])
+        self.assertEqual(dictionary.generate_doc_id("a.json", "https://example.com/a"), 0)
+        self.assertEqual(dictionary.assign(3, "b.json", "https://example.com/b"), 3)
+        self.assertEqual((dictionary.find_doc_id("b.json"), dictionary.find_url_by_id(3)), (3, "https://example.com/b"))
+        # generated doc_ids follow the assigned ones, and known documents keep theirs
+        self.assertEqual(dictionary.generate_doc_id("c.json", "https://example.com/c"), 4)
+        self.assertEqual(dictionary.generate_doc_id("b.json", "https://example.com/b"), 3)
+        self.assertEqual(dictionary.assign(1, "d.json", "https://example.com/d"), 1)
+        self.assertEqual(dictionary.counter, 5)
+        self.assertRaises(ValueError, dictionary.assign, 2, "a.json", "https://example.com/a")
+        self.assertRaises(ValueError, dictionary.assign, 3, "e.json", "https://example.com/e")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,223 @@
+import mmap
+import os
+import struct
+from threading import Lock
+from typing import List, Optional, Tuple
+
+STORE_MAGIC = b"PDOC"
+STORE_VERSION = 1
+
+# Store header: magic, format version, number of doc_ids, number of documents and number of properties. Doc_ids
+# without a document make the first two differ.
+STORE_HEADER = struct.Struct("<4sBIIH")
+# Property header: length of the utf-8 encoded name, followed by the name and the typecode of its column
+PROPERTY_HEADER = struct.Struct("<H")
+PROPERTY_TYPE = struct.Struct("<c")
+# Offset of the entry of each doc_id in the string heap, with one more offset for the end of the heap. An entry holds
+# the length of the url, the url and then the file. An empty entry is a doc_id without a document.
+ENTRY_OFFSET = struct.Struct("<Q")
+URL_LENGTH = struct.Struct("<I")
+
+# the typecodes of property columns. Missing integer properties are stored as 0 and missing floats as nan.
+INT_COLUMN = b'q'
+FLOAT_COLUMN = b'd'
+
+
+def column_type(values: List) -> bytes:
+    """
+    Choose the column type of a property from its values, which are strings when read back from doc_id.reference.
+    """
+    for value in values:
+        if value is None or value == "":
+            continue
+        try:
+            int(value)
+        except ValueError:
+            return FLOAT_COLUMN
+    return INT_COLUMN
+
+
+def write_document_store(dictionary, file_name: str):
+    """
+    Write the documents of a DocumentIdDictionary to a binary store that DocumentStore maps. The store is written
+    under a temporary name and renamed over file_name, so stores mapped by a running server are never truncated.
+    :param dictionary: the DocumentIdDictionary to write
+    :param file_name: the name of the store
+    """
+    length = max(dictionary.reverse_map) + 1 if dictionary.reverse_map else 0
+    properties = dictionary.property_index[3:]
+    rows = [dictionary.reverse_map.get(doc_id) for doc_id in range(length)]
+
+    heap = bytearray()
+    offsets = []
+    for row in rows:
+        offsets.append(len(heap))
+        if row is None:
+            continue
+        url = row[2].encode('utf-8')
+        heap += URL_LENGTH.pack(len(url))
+        heap += url
+        heap += row[1].encode('utf-8')
+    offsets.append(len(heap))
+
+    with open(f"{file_name}.tmp", 'wb') as f:
+        f.write(STORE_HEADER.pack(STORE_MAGIC, STORE_VERSION, length, len(dictionary.reverse_map), len(properties)))
+        columns = []
+        for prop in properties:
+            index = dictionary.property_map[prop]
+            values = [row[index] if row is not None and index < len(row) else None for row in rows]
+            typecode = column_type(values)
+            encoded = prop.encode('utf-8')
+            f.write(PROPERTY_HEADER.pack(len(encoded)))
+            f.write(encoded)
+            f.write(PROPERTY_TYPE.pack(typecode))
+            if typecode == INT_COLUMN:
+                columns.append((typecode, [int(value) if value not in (None, "") else 0 for value in values]))
+            else:
+                columns.append((typecode, [float(value) if value not in (None, "") else float("nan")
+                                           for value in values]))
+        # columns are aligned to 8 bytes so they can be cast in place
+        f.write(b"\0" * (-f.tell() % 8))
+        f.write(struct.pack(f"<{len(offsets)}Q", *offsets))
+        for typecode, values in columns:
+            f.write(struct.pack(f"<{len(values)}{typecode.decode()}", *values))
+        f.write(heap)
+    os.replace(f"{file_name}.tmp", file_name)
+
+
+class DocumentStore:
+    """
+    A read-only, memory mapped view of the documents of an index, written by write_document_store. Opening a store
+    does not read the documents, so one store can be opened quickly and shared by every scheme of an index.
+    """
+
+    def __init__(self, file_name: str):
+        # the map keeps its own handle on the file, so a store that is dropped without close frees both
+        with open(file_name, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.length, self.documents, count = STORE_HEADER.unpack_from(self.map, 0)
+        if magic != STORE_MAGIC:
+            raise ValueError(f"{file_name} is not a document store")
+        if version != STORE_VERSION:
+            raise ValueError(f"{file_name} has format version {version} but version {STORE_VERSION} is required")
+
+        position = STORE_HEADER.size
+        properties = []
+        for _ in range(count):
+            size, = PROPERTY_HEADER.unpack_from(self.map, position)
+            position += PROPERTY_HEADER.size
+            name = str(self.map[position:position + size], 'utf-8')
+            position += size
+            typecode, = PROPERTY_TYPE.unpack_from(self.map, position)
+            position += PROPERTY_TYPE.size
+            properties.append((name, typecode.decode()))
+        position += -position % 8
+
+        self.view = memoryview(self.map)
+        self.offsets = self.view[position:position + ENTRY_OFFSET.size * (self.length + 1)].cast('Q')
+        position += ENTRY_OFFSET.size * (self.length + 1)
+        self.columns = dict()
+        for name, typecode in properties:
+            self.columns[name] = self.view[position:position + 8 * self.length].cast(typecode)
+            position += 8 * self.length
+        self.heap = position
+
+    def __entry__(self, doc_id: int) -> Optional[memoryview]:
+        if not 0 <= doc_id < self.length:
+            return None
+        start, end = self.offsets[doc_id], self.offsets[doc_id + 1]
+        if start == end:
+            return None
+        return self.view[self.heap + start:self.heap + end]
+
+    def find_url_by_id(self, doc_id: int) -> str:
+        entry = self.__entry__(doc_id)
+        if entry is None:
+            raise KeyError(doc_id)
+        size, = URL_LENGTH.unpack_from(entry, 0)
+        return str(entry[URL_LENGTH.size:URL_LENGTH.size + size], 'utf-8')
+
+    def get_doc_file(self, doc_id: int) -> str:
+        entry = self.__entry__(doc_id)
+        if entry is None:
+            raise KeyError(doc_id)
+        size, = URL_LENGTH.unpack_from(entry, 0)
+        return str(entry[URL_LENGTH.size + size:], 'utf-8')
+
+    def __contains__(self, doc_id: int):
+        return self.__entry__(doc_id) is not None
+
+    def get_document_property(self, doc_id: int, prop: str):
+        return self.columns[prop][doc_id]
+
+    def column(self, prop: str) -> memoryview:
+        """
+        The values of a property indexed by doc_id.
+        """
+        return self.columns[prop]
+
+    def __len__(self):
+        return self.documents
+
+    def close(self):
+        for column in self.columns.values():
+            column.release()
+        self.offsets.release()
+        self.view.release()
+        self.map.close()
+
+
+def store_version(file_name: str) -> Tuple[int, int]:
+    """
+    Identify the file a store was written to, which changes every time write_document_store replaces it.
+    """
+    status = os.stat(file_name)
+    return status.st_ino, status.st_mtime_ns
+
+
+class ReopeningDocumentStore:
+    """
+    A DocumentStore that reopen replaces when its file was rewritten, as incremental updates rewrite it after adding
+    documents. The previous store is not closed, so lookups running on it finish, and it is unmapped once nothing
+    references it.
+    """
+
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+        self.lock = Lock()
+        self.version = store_version(file_name)
+        self.store = DocumentStore(file_name)
+
+    def reopen(self) -> bool:
+        """
+        Open the store again if its file was rewritten since it was opened.
+        :return: whether the store was reopened
+        """
+        with self.lock:
+            version = store_version(self.file_name)
+            if version == self.version:
+                return False
+            self.store = DocumentStore(self.file_name)
+            self.version = version
+            return True
+
+    def find_url_by_id(self, doc_id: int) -> str:
+        return self.store.find_url_by_id(doc_id)
+
+    def get_doc_file(self, doc_id: int) -> str:
+        return self.store.get_doc_file(doc_id)
+
+    def __contains__(self, doc_id: int):
+        return doc_id in self.store
+
+    def get_document_property(self, doc_id: int, prop: str):
+        return self.store.get_document_property(doc_id, prop)
+
+    def column(self, prop: str) -> memoryview:
+        return self.store.column(prop)
+
+    def __len__(self):
+        return len(self.store)
+
+    def close(self):
+        self.store.close()
@@ -0,0 +1,35 @@
+import os
+import shutil
+import unittest
+
+from .doc_id import DocumentIdDictionary, from_document_store
+
+
+class DocumentStoreTest(unittest.TestCase):
+    def setUp(self) -> None:
+        dictionary = DocumentIdDictionary("store.test", ["count", "weight"])
+        for doc_id in range(5):
+            dictionary.generate_doc_id(f"file{doc_id}.json", f"https://example.com/{doc_id}é")
+            dictionary.add_document_property(doc_id, {"count": doc_id * 3, "weight": doc_id / 2})
+        del dictionary.reverse_map[2], dictionary.doc_id["file2.json"]
+        dictionary.flush()
+        os.remove("store.test/doc_id.store")
+
+    def test_store(self):
+        store = from_document_store("store.test")
+        self.assertEqual(len(store), 4)
+        self.assertEqual(store.find_url_by_id(4), "https://example.com/4é")
+        self.assertEqual(store.get_doc_file(0), "file0.json")
+        self.assertNotIn(2, store)
+        self.assertNotIn(5, store)
+        self.assertRaises(KeyError, lambda: store.find_url_by_id(2))
+        self.assertEqual(store.get_document_property(3, "count"), 9)
+        self.assertEqual(list(store.column("weight"))[3:], [1.5, 2.0])
+        store.close()
+
+    def tearDown(self) -> None:
+        shutil.rmtree("store.test")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,34 +1,6 @@
-import os
+from typing import Callable, Dict, List, Tuple
 
-
-class FixedScoreDictionary:
-    def __init__(self, file_name: str, read=False):
-        if not os.path.exists(f'{file_name}'):
-            os.mkdir(f'{file_name}')
-        self.keys = dict()
-        if os.path.exists(f'{file_name}/fixed.reference'):
-            read = open(f'{file_name}/fixed.reference', 'r')
-            for row in read:
-                key, value = row.split(',')
-                value = float(value)
-                self.keys[key] = value
-            read.close()
-        if not read:
-            self.file = open(f'{file_name}/fixed.reference', 'w+')
-
-    def __setitem__(self, key: int, value: float):
-        self.keys[key] = value
-
-    def __getitem__(self, item: int):
-        return self.keys[item]
-
-    def flush(self):
-        self.file.seek(0)
-        self.file.writelines([f"{key},{value}\n" for key, value in self.keys.items()])
-        self.file.flush()
-
-    def close(self):
-        self.file.close()
+from .scores import *
 
 
 class FixedScorer:
@@ -37,3 +9,14 @@ class FixedScorer:
 
     def flush(self):
         raise NotImplementedError
+
+
+class BaseSetScorer:
+    def score_base_set(self, roots: List[int], stop: Callable[[], bool]) -> Tuple[Dict[int, float], bool]:
+        """
+        Score documents by the links around the results of a query.
+        :param roots: the doc_ids of the results of a query, best first
+        :param stop: checked while scoring, returning the scores so far once it is true
+        :return: the score of each document and whether scoring was stopped early
+        """
+        raise NotImplementedError
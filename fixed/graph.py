@@ -0,0 +1,345 @@
+import os
+import shutil
+import struct
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+# the link graph of the documents of an index, written by GraphWriter and mapped by LinkGraph.load
+GRAPH = "links.graph"
+GRAPH_MAGIC = b"LGRF"
+GRAPH_VERSION = 1
+# the magic, version, number of nodes and number of links of a graph file, followed by the indptr, nodes, indices and
+# weights arrays of LinkGraph in that order, so each array is aligned
+GRAPH_HEADER = struct.Struct("<4sIQQ")
+# the most links from one document to another that are counted, as weights are 16 bit
+MAX_WEIGHT = 0xFFFF
+# the L1 distance between the ranks of two iterations below which power iteration has converged
+TOLERANCE = 1e-6
+# the most iterations power iteration runs for when the ranks do not converge
+MAX_ITERATIONS = 100
+# the most documents linking to each root document that are added to a base set, Kleinberg's d
+BASE_SET_IN_LINKS = 50
+# the most documents of a base set, so HITS at query time has a bounded cost
+BASE_SET_SIZE = 5000
+
+
+class LinkGraph:
+    def __init__(self, nodes: np.ndarray, indptr: np.ndarray, indices: np.ndarray, weights: np.ndarray):
+        """
+        A directed link graph in compressed sparse row form. The links of the node at position i are
+        indices[indptr[i]:indptr[i + 1]], which are positions in nodes, and weights holds the number of links to each.
+        :param nodes: the doc_id of each node in increasing order
+        """
+        self.nodes = nodes
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+
+    @classmethod
+    def from_links(cls, links: Dict[int, Dict[int, int]]) -> "LinkGraph":
+        """
+        :param links: maps the doc_id of each document to the number of links to each document it links to. Documents
+        that are only linked to are nodes without links.
+        """
+        nodes = np.unique(np.fromiter((doc_id for source, targets in links.items() for doc_id in (source, *targets)),
+                                      dtype=np.int64))
+        sources = np.searchsorted(nodes, np.fromiter(links.keys(), dtype=np.int64, count=len(links)))
+        sources = np.repeat(sources, [len(targets) for targets in links.values()])
+        targets = np.fromiter((target for targets in links.values() for target in targets), dtype=np.int64)
+        weights = np.fromiter((count for targets in links.values() for count in targets.values()), dtype=np.float64)
+        order = np.argsort(sources, kind='stable')
+        indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=len(nodes)), out=indptr[1:])
+        indices = np.searchsorted(nodes, targets[order])
+        weights = weights[order]
+        return cls(nodes, indptr, indices, weights)
+
+    @classmethod
+    def load(cls, file_name: str) -> "LinkGraph":
+        """
+        Map a graph file written by GraphWriter into memory. Only the pages graph algorithms touch are read.
+        """
+        with open(file_name, 'rb') as f:
+            magic, version, node_count, link_count = GRAPH_HEADER.unpack(f.read(GRAPH_HEADER.size))
+        if magic != GRAPH_MAGIC:
+            raise ValueError(f"{file_name} is not a graph file")
+        if version != GRAPH_VERSION:
+            raise ValueError(f"{file_name} has format version {version} but version {GRAPH_VERSION} is required")
+        arrays = []
+        offset = GRAPH_HEADER.size
+        for dtype, length in (("<i8", node_count + 1), ("<i4", node_count), ("<i4", link_count), ("<u2", link_count)):
+            if length:
+                arrays.append(np.memmap(file_name, dtype=dtype, mode='r', offset=offset, shape=(length,)))
+            else:
+                arrays.append(np.zeros(0, dtype=dtype))
+            offset += length * np.dtype(dtype).itemsize
+        indptr, nodes, indices, weights = arrays
+        return cls(nodes, indptr, indices, weights)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def sources(self) -> np.ndarray:
+        """
+        The position of the node each link starts at, in link order.
+        """
+        return np.repeat(np.arange(len(self.nodes)), np.diff(self.indptr))
+
+    def __contains__(self, doc_id: int) -> bool:
+        position = np.searchsorted(self.nodes, doc_id)
+        return position < len(self.nodes) and self.nodes[position] == doc_id
+
+    def positions(self, doc_ids: Iterable[int]) -> np.ndarray:
+        """
+        The positions of the nodes of doc_ids, which must be in the graph.
+        """
+        return np.searchsorted(self.nodes, np.fromiter(doc_ids, dtype=np.int64))
+
+    def link_offsets(self, positions: np.ndarray, limit: Optional[int] = None) -> np.ndarray:
+        """
+        The offsets into indices and weights of the links of the nodes at positions, in the order of positions.
+        :param limit: the most links of each node, the first ones
+        """
+        starts = self.indptr[positions]
+        lengths = self.indptr[positions + 1] - starts
+        if limit is not None:
+            lengths = np.minimum(lengths, limit)
+        ends = np.cumsum(lengths)
+        return np.arange(ends[-1] if len(ends) else 0) + np.repeat(starts - (ends - lengths), lengths)
+
+    def transpose(self) -> "LinkGraph":
+        """
+        The graph with every link reversed, so the links of a node are the links to it.
+        """
+        order = np.argsort(self.indices, kind='stable')
+        indptr = np.zeros(len(self.nodes) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.indices, minlength=len(self.nodes)), out=indptr[1:])
+        return LinkGraph(self.nodes, indptr, self.sources()[order], np.asarray(self.weights)[order])
+
+    def subgraph(self, positions: np.ndarray) -> "LinkGraph":
+        """
+        The graph of the nodes at positions and the links between them.
+        :param positions: positions of nodes in increasing order
+        """
+        offsets = self.link_offsets(positions)
+        sources = np.repeat(np.arange(len(positions)), self.indptr[positions + 1] - self.indptr[positions])
+        targets = np.asarray(self.indices[offsets])
+        indices = np.searchsorted(positions, targets)
+        found = indices < len(positions)
+        found[found] = positions[indices[found]] == targets[found]
+        indptr = np.zeros(len(positions) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources[found], minlength=len(positions)), out=indptr[1:])
+        return LinkGraph(self.nodes[positions], indptr, indices[found], np.asarray(self.weights[offsets])[found])
+
+    def in_degree(self, weighted: bool = False) -> np.ndarray:
+        """
+        The number of links to each node, counting every link between two documents when weighted.
+        """
+        return np.bincount(self.indices, weights=self.weights if weighted else None, minlength=len(self.nodes))
+
+    def transition(self, weighted: bool = False) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        The random walk over the links.
+        :param weighted: follow each link in proportion to the number of links to its target, rather than following
+        each target with the same probability
+        :return: the source of each link, the probability of following each link from its source and whether each
+        node is dangling, having no links
+        """
+        sources = self.sources()
+        weights = self.weights if weighted else np.ones(len(self.indices))
+        out = np.bincount(sources, weights=weights, minlength=len(self.nodes))
+        return sources, weights / out[sources], out == 0
+
+
+class GraphWriter:
+    def __init__(self, file_name: str, nodes: Iterable[int]):
+        """
+        Write a graph file one document at a time, so the link graph is never held in memory. The links are written
+        to temporary files, which close assembles into the graph file.
+        :param nodes: the doc_id of every document links may point to
+        """
+        self.file_name = file_name
+        self.nodes = np.unique(np.fromiter(nodes, dtype=np.int64))
+        if len(self.nodes) and self.nodes[-1] > np.iinfo(np.int32).max:
+            raise ValueError("Doc_ids do not fit a graph file")
+        self.degrees = np.zeros(len(self.nodes), dtype=np.int64)
+        self.indices = open(f"{file_name}.indices.tmp", 'wb')
+        self.weights = open(f"{file_name}.weights.tmp", 'wb')
+        self.last = -1
+
+    def add(self, doc_id: int, targets: Dict[int, int]):
+        """
+        Write the links of a document. Documents must be added in increasing doc_id order.
+        :param targets: the number of links to each document. Documents that are not nodes are ignored.
+        """
+        if doc_id not in self:
+            raise ValueError(f"{doc_id} is not a node of the graph")
+        if np.searchsorted(self.nodes, doc_id) <= self.last:
+            raise ValueError("Documents must be added in increasing doc_id order")
+        self.extend(np.full(len(targets), doc_id, dtype=np.int64),
+                    np.fromiter(targets.keys(), dtype=np.int64, count=len(targets)),
+                    np.fromiter(targets.values(), dtype=np.int64, count=len(targets)))
+        self.last = int(np.searchsorted(self.nodes, doc_id))
+
+    def extend(self, sources: np.ndarray, targets: np.ndarray, counts: np.ndarray):
+        """
+        Write the links of several documents at once, such as the links a worker extracted from a shard of
+        documents. Every document must have a larger doc_id than the documents written before.
+        :param sources: the doc_id of the document each link is from, in increasing order
+        :param targets: the doc_id each link is to. Links to documents that are not nodes are ignored.
+        :param counts: the number of links from source to target
+        """
+        positions = np.searchsorted(self.nodes, sources)
+        if len(sources) and (np.any(np.diff(positions) < 0) or positions[0] <= self.last):
+            raise ValueError("Documents must be added in increasing doc_id order")
+        indices = np.searchsorted(self.nodes, targets)
+        found = indices < len(self.nodes)
+        found[found] = self.nodes[indices[found]] == targets[found]
+        positions, indices, counts = positions[found], indices[found], counts[found]
+        order = np.lexsort((indices, positions))
+        self.indices.write(indices[order].astype("<i4").tobytes())
+        self.weights.write(np.minimum(counts[order], MAX_WEIGHT).astype("<u2").tobytes())
+        np.add.at(self.degrees, positions, 1)
+        if len(sources):
+            self.last = max(self.last, int(np.searchsorted(self.nodes, sources[-1])))
+
+    def __contains__(self, doc_id: int) -> bool:
+        position = np.searchsorted(self.nodes, doc_id)
+        return position < len(self.nodes) and self.nodes[position] == doc_id
+
+    def close(self):
+        """
+        Write the graph file under a temporary name and rename it over file_name.
+        """
+        self.indices.close()
+        self.weights.close()
+        indptr = np.zeros(len(self.nodes) + 1, dtype="<i8")
+        np.cumsum(self.degrees, out=indptr[1:])
+        with open(f"{self.file_name}.tmp", 'wb') as f:
+            f.write(GRAPH_HEADER.pack(GRAPH_MAGIC, GRAPH_VERSION, len(self.nodes), int(indptr[-1])))
+            f.write(indptr.tobytes())
+            f.write(self.nodes.astype("<i4").tobytes())
+            for part in (f"{self.file_name}.indices.tmp", f"{self.file_name}.weights.tmp"):
+                with open(part, 'rb') as links:
+                    shutil.copyfileobj(links, f)
+                os.remove(part)
+        os.replace(f"{self.file_name}.tmp", self.file_name)
+
+
+def page_rank(graph: LinkGraph, alpha: float = 0.85, teleport: Optional[np.ndarray] = None,
+              tolerance: float = TOLERANCE, max_iterations: int = MAX_ITERATIONS,
+              weighted: bool = False) -> Tuple[np.ndarray, int]:
+    """
+    Rank the nodes of a graph by power iteration. Each iteration follows a link with probability alpha and teleports
+    otherwise, and dangling nodes teleport always, so their rank is not lost. Following the links is a single scatter
+    of the ranks over the links of the graph.
+    :param alpha: the probability of following a link
+    :param teleport: the probability of teleporting to each node, uniform if not given
+    :param tolerance: stop once the L1 distance between the ranks of two iterations is below tolerance
+    :return: the rank of each node, which sum to 1, and the number of iterations run
+    """
+    if not len(graph):
+        return np.zeros(0), 0
+    if teleport is None:
+        teleport = np.full(len(graph), 1.0 / len(graph))
+    sources, probability, dangling = graph.transition(weighted)
+    ranks = teleport.copy()
+    iteration = 0
+    while iteration < max_iterations:
+        iteration += 1
+        followed = np.bincount(graph.indices, weights=ranks[sources] * probability, minlength=len(graph))
+        updated = alpha * followed + (alpha * ranks[dangling].sum() + 1 - alpha) * teleport
+        distance = np.abs(updated - ranks).sum()
+        ranks = updated
+        if distance < tolerance:
+            break
+    return ranks, iteration
+
+
+def hits(graph: LinkGraph, tolerance: float = TOLERANCE, max_iterations: int = MAX_ITERATIONS,
+         weighted: bool = False, stop: Optional[Callable[[], bool]] = None) -> Tuple[np.ndarray, np.ndarray, int]:
+    """
+    Score the nodes of a graph as hubs, linking to good authorities, and as authorities, linked to by good hubs, by
+    power iteration. Each iteration is a scatter of the hub scores over the links and a gather of the authority
+    scores back, like page_rank.
+    :param weighted: count every link between two documents rather than each linked pair once
+    :param stop: checked before every iteration, ending the iteration early with the scores so far
+    :return: the hub and the authority score of each node, which each sum to 1 unless the graph has no links, and the
+    number of iterations run
+    """
+    if not len(graph):
+        return np.zeros(0), np.zeros(0), 0
+    sources = graph.sources()
+    weights = np.asarray(graph.weights, dtype=np.float64) if weighted else np.ones(len(graph.indices))
+    hubs = np.full(len(graph), 1.0 / len(graph))
+    authorities = hubs
+    iteration = 0
+    while iteration < max_iterations and not (stop and stop()):
+        iteration += 1
+        updated = np.bincount(graph.indices, weights=hubs[sources] * weights, minlength=len(graph))
+        updated_hubs = np.bincount(sources, weights=updated[graph.indices] * weights, minlength=len(graph))
+        if not updated.sum():
+            return np.zeros(len(graph)), np.zeros(len(graph)), iteration
+        updated /= updated.sum()
+        updated_hubs /= updated_hubs.sum()
+        distance = np.abs(updated - authorities).sum() + np.abs(updated_hubs - hubs).sum()
+        hubs, authorities = updated_hubs, updated
+        if distance < tolerance:
+            break
+    return hubs, authorities, iteration
+
+
+def base_set(graph: LinkGraph, reverse: LinkGraph, roots: Iterable[int], in_links: int = BASE_SET_IN_LINKS,
+             size: int = BASE_SET_SIZE) -> LinkGraph:
+    """
+    The base set of a set of root documents as Kleinberg defines it, the roots with the documents they link to and
+    up to in_links of the documents linking to each. Documents are added in that order until there are size of them.
+    :param reverse: the transpose of graph
+    :param roots: the doc_ids of the root documents, most relevant first. Documents not in the graph are ignored.
+    """
+    roots = np.fromiter(roots, dtype=np.int64)
+    positions = np.searchsorted(graph.nodes, roots)
+    found = positions < len(graph)
+    found[found] = graph.nodes[positions[found]] == roots[found]
+    positions = positions[found][:size]
+    targets = np.asarray(graph.indices[graph.link_offsets(positions)])
+    linking = np.asarray(reverse.indices[reverse.link_offsets(positions, in_links)])
+    candidates = np.concatenate((positions, targets, linking))
+    _, first = np.unique(candidates, return_index=True)
+    return graph.subgraph(np.sort(candidates[np.sort(first)[:size]]))
+
+
+def base_set_hits(graph: LinkGraph, reverse: LinkGraph, roots: Iterable[int], tolerance: float = TOLERANCE,
+                  max_iterations: int = MAX_ITERATIONS, weighted: bool = False,
+                  stop: Optional[Callable[[], bool]] = None) -> Tuple[Dict[int, float], bool]:
+    """
+    The authority scores over the base set of the roots, scaled by the number of documents of the base set.
+    :param stop: see hits
+    :return: the score of each document of the base set and whether stop ended the iteration before it converged
+    """
+    stopped = False
+
+    def checked() -> bool:
+        nonlocal stopped
+        stopped = bool(stop and stop())
+        return stopped
+
+    graph = base_set(graph, reverse, roots)
+    _, authorities, _ = hits(graph, tolerance, max_iterations, weighted, checked)
+    return dict(zip(graph.nodes.tolist(), (authorities * len(graph)).tolist())), stopped
+
+
+def personalized_page_rank(graph: LinkGraph, seeds: Dict[int, float], alpha: float = 0.85,
+                           tolerance: float = TOLERANCE, max_iterations: int = MAX_ITERATIONS,
+                           weighted: bool = False) -> Tuple[np.ndarray, int]:
+    """
+    Rank the nodes of a graph by their closeness to a set of documents, by teleporting only to those documents.
+    :param seeds: the weight of teleporting to each document. Documents that are not in the graph are ignored.
+    """
+    teleport = np.zeros(len(graph))
+    known = {doc_id: weight for doc_id, weight in seeds.items() if doc_id in graph}
+    if not known or sum(known.values()) <= 0:
+        raise ValueError("None of the seeds are in the graph")
+    teleport[graph.positions(known)] = list(known.values())
+    return page_rank(graph, alpha, teleport / teleport.sum(), tolerance, max_iterations, weighted)
@@ -0,0 +1,191 @@
+import os
+import random
+import unittest
+
+import numpy as np
+
+from .graph import MAX_ITERATIONS, MAX_WEIGHT, GraphWriter, LinkGraph, base_set, base_set_hits, hits, page_rank
+from .graph import personalized_page_rank
+
+LINKS = {
+    10: {20: 1, 30: 2},
+    20: {30: 1},
+    30: {10: 1},
+    40: {30: 3, 50: 1},
+}
+
+
+def dense_page_rank(graph: LinkGraph, alpha: float, teleport: np.ndarray) -> np.ndarray:
+    """
+    Solve the page rank equations directly over the dense transition matrix.
+    """
+    n = len(graph)
+    transition = np.zeros((n, n))
+    for source in range(n):
+        targets = graph.indices[graph.indptr[source]:graph.indptr[source + 1]]
+        if len(targets):
+            transition[source, targets] = 1.0 / len(targets)
+        else:
+            transition[source] = teleport
+    return np.linalg.solve(np.eye(n) - alpha * transition.T, (1 - alpha) * teleport)
+
+
+class LinkGraphTest(unittest.TestCase):
+    def test_csr(self):
+        graph = LinkGraph.from_links(LINKS)
+        self.assertEqual(graph.nodes.tolist(), [10, 20, 30, 40, 50])
+        self.assertEqual(graph.indptr.tolist(), [0, 2, 3, 4, 6, 6])
+        self.assertEqual(graph.nodes[graph.indices].tolist(), [20, 30, 30, 10, 30, 50])
+        self.assertEqual(graph.weights.tolist(), [1, 2, 1, 1, 3, 1])
+        self.assertIn(50, graph)
+        self.assertNotIn(60, graph)
+        _, probability, dangling = graph.transition(weighted=True)
+        self.assertEqual(probability.tolist(), [1 / 3, 2 / 3, 1, 1, 0.75, 0.25])
+        self.assertEqual(dangling.tolist(), [False, False, False, False, True])
+        self.assertEqual(graph.in_degree().tolist(), [1, 1, 3, 0, 1])
+        self.assertEqual(graph.in_degree(weighted=True).tolist(), [1, 1, 6, 0, 1])
+
+    def test_subgraph(self):
+        graph = LinkGraph.from_links(LINKS)
+        reverse = graph.transpose()
+        self.assertEqual(reverse.indptr.tolist(), [0, 1, 2, 5, 5, 6])
+        self.assertEqual(reverse.nodes[reverse.indices].tolist(), [30, 10, 10, 20, 40, 40])
+        self.assertEqual(reverse.weights.tolist(), [1, 1, 2, 1, 3, 1])
+        self.assertEqual(graph.link_offsets(np.array([3, 0]), limit=1).tolist(), [4, 0])
+        subgraph = graph.subgraph(np.array([0, 2, 3]))
+        self.assertEqual(subgraph.nodes.tolist(), [10, 30, 40])
+        self.assertEqual(subgraph.indptr.tolist(), [0, 1, 2, 3])
+        self.assertEqual(subgraph.nodes[subgraph.indices].tolist(), [30, 10, 30])
+        self.assertEqual(subgraph.weights.tolist(), [2, 1, 3])
+
+    def test_base_set(self):
+        graph = LinkGraph.from_links(LINKS)
+        reverse = graph.transpose()
+        self.assertEqual(base_set(graph, reverse, [50, 99]).nodes.tolist(), [40, 50])
+        self.assertEqual(base_set(graph, reverse, [30], in_links=2).nodes.tolist(), [10, 20, 30])
+        # the roots come first, then the documents they link to
+        self.assertEqual(base_set(graph, reverse, [40, 20], size=3).nodes.tolist(), [20, 30, 40])
+        self.assertEqual(len(base_set(graph, reverse, [])), 0)
+
+    def test_base_set_hits(self):
+        graph = LinkGraph.from_links(LINKS)
+        reverse = graph.transpose()
+        checks = []
+        scores, stopped = base_set_hits(graph, reverse, [30], stop=lambda: checks.append(1) or False)
+        self.assertFalse(stopped)
+        self.assertEqual(sorted(scores), [10, 20, 30, 40])
+        _, authorities, iterations = hits(base_set(graph, reverse, [30]))
+        self.assertEqual(list(scores.values()), (authorities * 4).tolist())
+        # stop is not checked once the scores converged, so a deadline passing afterwards does not make them partial
+        self.assertEqual(len(checks), iterations)
+        checks = iter(range(MAX_ITERATIONS))
+        scores, stopped = base_set_hits(graph, reverse, [30], tolerance=0.0, stop=lambda: next(checks) == 2)
+        self.assertTrue(stopped)
+        self.assertAlmostEqual(sum(scores.values()), 4.0)
+
+    def test_file(self):
+        writer = GraphWriter("graph.test", [50, 10, 20, 30, 40, 60])
+        for doc_id, targets in LINKS.items():
+            writer.add(doc_id, {**targets, 99: 1})
+        with self.assertRaises(ValueError):
+            writer.add(20, {})
+        writer.close()
+        graph = LinkGraph.load("graph.test")
+        expected = LinkGraph.from_links({**LINKS, 60: {}})
+        for array in ("nodes", "indptr", "indices", "weights"):
+            self.assertEqual(getattr(graph, array).tolist(), getattr(expected, array).tolist())
+        np.testing.assert_allclose(page_rank(graph)[0], page_rank(expected)[0])
+        del graph
+        os.remove("graph.test")
+
+    def test_extend(self):
+        writer = GraphWriter("graph.test", [10, 20, 30, 40, 50, 60])
+        writer.extend(np.array([10, 10, 20]), np.array([30, 20, 30]), np.array([2, 1, 1]))
+        with self.assertRaises(ValueError):
+            writer.extend(np.array([20]), np.array([10]), np.array([1]))
+        writer.extend(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+        writer.extend(np.array([30, 40, 40, 40]), np.array([10, 99, 50, 30]), np.array([1, 1, 1, 3]))
+        writer.add(60, {})
+        writer.close()
+        graph = LinkGraph.load("graph.test")
+        expected = LinkGraph.from_links({**LINKS, 60: {}})
+        for array in ("nodes", "indptr", "indices", "weights"):
+            self.assertEqual(getattr(graph, array).tolist(), getattr(expected, array).tolist())
+        del graph
+        os.remove("graph.test")
+
+    def test_weights(self):
+        writer = GraphWriter("graph.test", [1, 2])
+        writer.add(1, {2: MAX_WEIGHT + 10})
+        writer.close()
+        self.assertEqual(LinkGraph.load("graph.test").weights.tolist(), [MAX_WEIGHT])
+        writer = GraphWriter("graph.test", [1])
+        writer.close()
+        self.assertEqual(len(LinkGraph.load("graph.test").indices), 0)
+        os.remove("graph.test")
+
+
+class PageRankTest(unittest.TestCase):
+    def test_converges(self):
+        graph = LinkGraph.from_links(LINKS)
+        ranks, iterations = page_rank(graph, 0.85, tolerance=1e-10)
+        self.assertLess(iterations, 200)
+        self.assertAlmostEqual(ranks.sum(), 1.0)
+        np.testing.assert_allclose(ranks, dense_page_rank(graph, 0.85, np.full(5, 0.2)), atol=1e-9)
+        self.assertEqual(int(np.argmax(ranks)), 2)
+
+    def test_random(self):
+        generator = random.Random(5)
+        links = {source: {target: 1 for target in generator.sample(range(200), generator.randrange(0, 6))}
+                 for source in generator.sample(range(200), 150)}
+        graph = LinkGraph.from_links(links)
+        ranks, _ = page_rank(graph, 0.5, tolerance=1e-12)
+        np.testing.assert_allclose(ranks, dense_page_rank(graph, 0.5, np.full(len(graph), 1 / len(graph))),
+                                   atol=1e-10)
+
+    def test_alpha(self):
+        graph = LinkGraph.from_links(LINKS)
+        ranks, iterations = page_rank(graph, 0.0)
+        np.testing.assert_allclose(ranks, np.full(5, 0.2))
+        self.assertLessEqual(iterations, 2)
+        _, iterations = page_rank(graph, 0.99, tolerance=0.0, max_iterations=7)
+        self.assertEqual(iterations, 7)
+
+    def test_hits(self):
+        graph = LinkGraph.from_links(LINKS)
+        hubs, authorities, iterations = hits(graph, tolerance=1e-12, max_iterations=1000)
+        self.assertLess(iterations, 1000)
+        # the authorities are the principal eigenvector of the co-citation matrix, and the hubs of the co-reference one
+        adjacency = np.zeros((5, 5))
+        adjacency[graph.sources(), graph.indices] = 1
+        for scores, matrix in ((authorities, adjacency.T @ adjacency), (hubs, adjacency @ adjacency.T)):
+            vector = np.abs(np.linalg.eigh(matrix)[1][:, -1])
+            np.testing.assert_allclose(scores, vector / vector.sum(), atol=1e-8)
+        self.assertEqual(int(np.argmax(authorities)), 2)
+        # 10 and 40 both link to 30 and to one other document
+        self.assertAlmostEqual(hubs[0], hubs[3])
+        _, weighted, _ = hits(graph, weighted=True)
+        self.assertGreater(weighted[2] / weighted[4], authorities[2] / authorities[4])
+
+    def test_hits_stop(self):
+        graph = LinkGraph.from_links(LINKS)
+        checks = iter(range(MAX_ITERATIONS))
+        hubs, authorities, iterations = hits(graph, tolerance=0.0, stop=lambda: next(checks) == 3)
+        self.assertEqual(iterations, 3)
+        self.assertAlmostEqual(authorities.sum(), 1.0)
+        hubs, authorities, _ = hits(LinkGraph.from_links({1: {}, 2: {}}))
+        self.assertEqual((hubs.tolist(), authorities.tolist()), ([0, 0], [0, 0]))
+
+    def test_personalized(self):
+        graph = LinkGraph.from_links(LINKS)
+        ranks, _ = personalized_page_rank(graph, {40: 1.0, 99: 5.0}, 0.85, tolerance=1e-10)
+        teleport = np.array([0, 0, 0, 1.0, 0])
+        np.testing.assert_allclose(ranks, dense_page_rank(graph, 0.85, teleport), atol=1e-9)
+        # 20 is only reachable from 40 through 30 and 10
+        self.assertGreater(ranks[3], ranks[1])
+        with self.assertRaises(ValueError):
+            personalized_page_rank(graph, {99: 1.0})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import os
+from threading import Lock
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import fixed
+from doc import DocumentIdDictionary
+from fixed.graph import GRAPH, MAX_ITERATIONS, TOLERANCE, LinkGraph, base_set_hits, hits
+from fixed.page_rank import extract_graph
+
+
+class HITS(fixed.FixedScorer, fixed.BaseSetScorer):
+    def __init__(self, dictionary: DocumentIdDictionary, fixed_id: Optional[fixed.FixedScoreDictionary],
+                 hubs: Optional[fixed.FixedScoreDictionary] = None, tolerance: float = TOLERANCE,
+                 max_iterations: int = MAX_ITERATIONS, graph_file: str = f"indexes/page_rank/{GRAPH}",
+                 workers: Optional[int] = None, weighted: bool = False):
+        """
+        Score documents by Kleinberg's hubs and authorities over the link graph PageRank ranks. process scores every
+        document at once, and score_base_set scores the documents around the results of a query.
+        :param fixed_id: the authority score of each document, or None when only scoring base sets
+        :param hubs: the hub score of each document, not stored if not given
+        :param tolerance: the L1 distance between the scores of two iterations at which scoring stops
+        :param graph_file: the link graph written by indexer.processor, which is extracted if it does not exist
+        :param workers: the number of processes links are extracted by, one per core if not given
+        :param weighted: count every link between two documents rather than each linked pair once
+        """
+        self.dictionary = dictionary
+        self.fixed_id = fixed_id
+        self.hubs = hubs
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+        self.graph_file = graph_file
+        self.workers = workers
+        self.weighted = weighted
+        # the number of iterations the last scoring took to converge
+        self.iterations = 0
+        self.graph: Optional[LinkGraph] = None
+        # the links to each document, found by open
+        self.reverse: Optional[LinkGraph] = None
+        self.lock = Lock()
+
+    def process(self):
+        """
+        Score every document of the link graph, extracting the graph first if an earlier build did not. Scores are
+        scaled by the number of documents, so the average document scores 1 as with PageRank.
+        """
+        if not os.path.exists(self.graph_file):
+            extract_graph(self.dictionary, self.graph_file, self.workers)
+        self.graph = LinkGraph.load(self.graph_file)
+        hubs, authorities, self.iterations = hits(self.graph, self.tolerance, self.max_iterations, self.weighted)
+        nodes = np.asarray(self.graph.nodes)
+        self.fixed_id.update(nodes, authorities * len(self.graph))
+        if self.hubs is not None:
+            self.hubs.update(nodes, hubs * len(self.graph))
+
+    def open(self):
+        """
+        Load the link graph and find the links to each document, which base sets need. It is done the first time a
+        base set is scored otherwise, which takes that query past its budget.
+        """
+        with self.lock:
+            if self.graph is None:
+                self.graph = LinkGraph.load(self.graph_file)
+            if self.reverse is None:
+                self.reverse = self.graph.transpose()
+
+    def score_base_set(self, roots: List[int], stop: Callable[[], bool]) -> Tuple[Dict[int, float], bool]:
+        """
+        The authority scores over the base set of the roots, which is at most BASE_SET_SIZE documents with
+        BASE_SET_IN_LINKS documents linking to each root, so the cost of a query is bounded. Scores are scaled by the
+        number of documents of the base set.
+        """
+        self.open()
+        return base_set_hits(self.graph, self.reverse, roots, self.tolerance, self.max_iterations, self.weighted, stop)
+
+    def flush(self):
+        for scores in (self.fixed_id, self.hubs):
+            if scores is not None:
+                scores.flush()
+
+    def close(self):
+        self.flush()
+        for scores in (self.fixed_id, self.hubs):
+            if scores is not None:
+                scores.close()
@@ -1,83 +1,161 @@
 import json
 import os
-import pickle
 from collections import defaultdict
+from multiprocessing import Pool
+from typing import Dict, Iterable, List, Optional, Tuple
 from urllib.parse import urljoin
 
-from bs4 import BeautifulSoup
+import numpy as np
 
 import fixed
 from doc import DocumentIdDictionary, normalize_url
+from fixed.graph import GRAPH, MAX_ITERATIONS, TOLERANCE, GraphWriter, LinkGraph, page_rank, personalized_page_rank
+from posting.tokenizer.document import PERMITTED_ENCODINGS
+from posting.tokenizer.link import find_hrefs
+
+# the number of documents each link extraction worker is given at a time
+LINK_SHARD_SIZE = 256
+
+
+def document_links(file_name: str, dictionary: DocumentIdDictionary) -> Dict[int, int]:
+    """
+    Find the documents a crawled document links to, see resolve_links. The hrefs are read by find_hrefs, as analyze
+    reads them for the graph indexer.processor builds, so both build the same graph.
+    :return: no links if the document is not in a permitted encoding
+    """
+    links = read_links(file_name)
+    return resolve_links(*links, dictionary) if links is not None else dict()
+
+
+def resolve_links(url: str, hrefs: Iterable[str], dictionary: DocumentIdDictionary) -> Dict[int, int]:
+    """
+    Find the documents the hrefs of a document link to. Each href is looked up both as written and resolved against
+    the url of the document.
+    :return: maps the doc_id of each target to the number of links to it
+    """
+    targets = defaultdict(int)
+    for link in hrefs:
+        normalized_url = normalize_url(link)
+        secondary_check = normalize_url(urljoin(url, link, allow_fragments=False))
+        if dictionary.contains_url(normalized_url):
+            targets[dictionary.find_doc_id_by_url(normalized_url)] += 1
+        if dictionary.contains_url(secondary_check):
+            targets[dictionary.find_doc_id_by_url(secondary_check)] += 1
+    return targets
+
+
+def read_links(file_name: str) -> Optional[Tuple[str, List[str]]]:
+    """
+    Read the url and the hrefs of a crawled document without parsing the rest of it.
+    :return: None if the document is not in a permitted encoding, as analyze
+    """
+    with open(file_name, 'r') as f:
+        obj = json.load(f)
+    if obj["encoding"].lower() not in PERMITTED_ENCODINGS:
+        return None
+    return obj["url"], find_hrefs(obj["content"])
+
+
+# the documents of a link extraction worker, set once per process by initialize_link_worker
+LINK_WORKER_DICTIONARY: Optional[DocumentIdDictionary] = None
+
+
+def initialize_link_worker(rows: List[Tuple[int, str, str]]):
+    """
+    :param rows: the doc_id, file and url of every document
+    """
+    global LINK_WORKER_DICTIONARY
+    LINK_WORKER_DICTIONARY = DocumentIdDictionary("", [])
+    for row in rows:
+        LINK_WORKER_DICTIONARY.add_row(list(row))
+
+
+def extract_links(documents: List[Tuple[int, str]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Extract the links of a shard of documents in a worker.
+    :param documents: the doc_id and file of each document, in doc_id order
+    :return: the source, target and number of links of every pair of linked documents, in source order
+    """
+    sources, targets, counts = [], [], []
+    for doc_id, file_name in documents:
+        for target, count in document_links(file_name, LINK_WORKER_DICTIONARY).items():
+            sources.append(doc_id)
+            targets.append(target)
+            counts.append(count)
+    return np.array(sources, dtype=np.int32), np.array(targets, dtype=np.int32), np.array(counts, dtype=np.int32)
+
+
+def extract_graph(dictionary: DocumentIdDictionary, graph_file: str, workers: Optional[int] = None):
+    """
+    Find the links of every document and write them to graph_file. Shards of LINK_SHARD_SIZE documents are read by a
+    pool of workers, which only look for the hrefs of each document and return its links as arrays. Shards are
+    written in order as they finish, so the graph is the same for any number of workers.
+    :param workers: the number of processes, one per core if not given
+    """
+    rows = sorted((doc_id, row[1], row[2]) for doc_id, row in dictionary.reverse_map.items())
+    shards = [[(doc_id, file_name) for doc_id, file_name, _ in rows[start:start + LINK_SHARD_SIZE]]
+              for start in range(0, len(rows), LINK_SHARD_SIZE)]
+    writer = GraphWriter(graph_file, [doc_id for doc_id, _, _ in rows])
+    with Pool(workers, initializer=initialize_link_worker, initargs=(rows,)) as pool:
+        for sources, targets, counts in pool.imap(extract_links, shards):
+            writer.extend(sources, targets, counts)
+    writer.close()
 
 
 class PageRank(fixed.FixedScorer):
-    def __init__(self, dictionary: DocumentIdDictionary, fixed_id: fixed.FixedScoreDictionary, alpha=0.85):
+    def __init__(self, dictionary: DocumentIdDictionary, fixed_id: fixed.FixedScoreDictionary, alpha=0.85,
+                 tolerance: float = TOLERANCE, max_iterations: int = MAX_ITERATIONS,
+                 graph_file: str = f"indexes/page_rank/{GRAPH}", workers: Optional[int] = None):
+        """
+        :param alpha: the probability of following a link rather than teleporting
+        :param tolerance: the L1 distance between the ranks of two iterations at which ranking stops
+        :param graph_file: the link graph written by indexer.processor, which is extracted if it does not exist
+        :param workers: the number of processes links are extracted by, one per core if not given
+        """
         self.dictionary = dictionary
+        self.graph_file = graph_file
+        self.workers = workers
         self.fixed_id = fixed_id
-        self.iterations = 20
-        self.alpha = 0.85
+        self.alpha = alpha
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+        # the number of iterations the last ranking took to converge
+        self.iterations = 0
+        self.graph: Optional[LinkGraph] = None
 
     def process(self):
         """
-        There are two phases to this processing. We first need to find the connections and store them in a dictionary.
-        The dictionary should map each id to the set of ids they link to. Finally, we need to store the settled values
-        into the file.
+        There are two phases to this processing. We first need the link graph of the documents, which is extracted
+        and written to graph_file if an earlier build did not. Then the documents are ranked and the settled values
+        are stored into the file.
+        """
+        if not os.path.exists(self.graph_file):
+            self.extract()
+        self.rank(LinkGraph.load(self.graph_file))
+
+    def extract(self):
+        extract_graph(self.dictionary, self.graph_file, self.workers)
+
+    def rank(self, graph: LinkGraph):
+        """
+        Rank the documents of the link graph until the ranks converge. Ranks are scaled by the number of documents,
+        so the average document scores 1 as it did when ranks were summed over a fixed number of iterations.
+        """
+        self.graph = graph
+        ranks, self.iterations = page_rank(self.graph, self.alpha, tolerance=self.tolerance,
+                                           max_iterations=self.max_iterations)
+        self.fixed_id.update(np.asarray(self.graph.nodes), ranks * len(self.graph))
+
+    def personalized(self, seeds: Dict[int, float]) -> Dict[int, float]:
+        """
+        Rank the documents of the link graph by their closeness to the seed documents, such as the results of a query
+        or the documents a user visited. Call process first.
+        :param seeds: the weight of each seed document
+        :return: the rank of each document, scaled like rank
         """
-        if os.path.exists("indexes/page_rank/graph"):
-            links = pickle.load(open('indexes/page_rank/graph', 'rb'))
-            link_count = pickle.load(open('indexes/page_rank/link_count', 'rb'))
-        else:
-            links = defaultdict(lambda: defaultdict(int))
-            link_count = defaultdict(int)
-            for key, value in self.dictionary.reverse_map.items():
-                file = value[1]
-                with open(file, 'r') as f:
-                    response = json.load(f)
-                    count = 0
-                    doc = BeautifulSoup(response['content'], from_encoding=response['encoding'], features='lxml')
-                    for element in doc.find_all('a', href=True):
-                        if not element.has_attr('href'):
-                            continue
-                        link = element['href']
-                        normalized_url = normalize_url(link)
-                        secondary_check = normalize_url(urljoin(response['url'], link, allow_fragments=False))
-                        if self.dictionary.contains_url(normalized_url):
-                            count += 1
-                            associated_id = self.dictionary.find_doc_id_by_url(normalized_url)
-                            links[self.dictionary.find_doc_id(file)][associated_id] += 1
-                        if self.dictionary.contains_url(secondary_check):
-                            count += 1
-                            associated_id = self.dictionary.find_doc_id_by_url(secondary_check)
-                            links[self.dictionary.find_doc_id(file)][associated_id] += 1
-                    link_count[key] = count
-                    print(response['url'], link_count[key])
-
-            with open(f'indexes/page_rank/graph', 'wb+') as g:
-                pickle.dump(dict(links), g)
-            with open(f'indexes/page_rank/link_count', 'wb+') as lc:
-                pickle.dump(dict(link_count), lc)
-
-        incoming_links = defaultdict(lambda: defaultdict(int))
-        for key, value in links.items():
-            for outgoing, count in value.items():
-                incoming_links[outgoing][key] += count
-
-        prev_weights = defaultdict(float)
-        weights = defaultdict(float)
-        for key in links:
-            prev_weights[key] = 1
-
-        for _ in range(self.iterations):
-            for key in incoming_links:
-                for incoming, count in incoming_links[key].items():
-                    weights[key] += self.alpha * 1 / len(links[incoming]) * prev_weights[incoming]
-            for key in links:
-                weights[key] += 1 - self.alpha
-            prev_weights = weights
-            weights = defaultdict(float)
-
-        for key in prev_weights:
-            self.fixed_id[key] = prev_weights[key]
+        assert self.graph is not None, "Did not process the link graph"
+        ranks, _ = personalized_page_rank(self.graph, seeds, self.alpha, self.tolerance, self.max_iterations)
+        return dict(zip(self.graph.nodes.tolist(), (ranks * len(self.graph)).tolist()))
 
     def flush(self):
         self.fixed_id.flush()
@@ -0,0 +1,128 @@
+import os
+import struct
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+
+# the query independent score of each doc_id as a float32 array, nan for doc_ids without a score
+FIXED_SCORES = "fixed.scores"
+FIXED_MAGIC = b"FSCR"
+FIXED_VERSION = 1
+# the magic, version and number of doc_ids of a scores file, followed by the score of each doc_id
+FIXED_HEADER = struct.Struct("<4sIQ")
+# the text file of "doc_id,score" lines scores were kept in before, read if there is no scores file
+FIXED_REFERENCE = "fixed.reference"
+
+
+class FixedScoreDictionary:
+    def __init__(self, file_name: str, read=False):
+        """
+        The query independent score of each document, such as its PageRank, kept in an array indexed by doc_id.
+        :param file_name: the directory of the scores
+        :param read: map the scores file read-only, as queries do, rather than loading it to be updated and written by
+        flush
+        """
+        if not os.path.exists(f'{file_name}'):
+            os.mkdir(f'{file_name}')
+        self.file_name = os.path.join(file_name, FIXED_SCORES)
+        self.scores = np.zeros(0, dtype=np.float32)
+        # the number of doc_ids scores holds, as it grows by doubling
+        self.length = 0
+        # the smallest and the largest score, found by bounds
+        self.extremes: Optional[Tuple[float, float]] = None
+        if os.path.exists(self.file_name):
+            self.scores = self.__map__()
+            self.length = len(self.scores)
+            if not read:
+                self.scores = np.array(self.scores)
+        elif os.path.exists(os.path.join(file_name, FIXED_REFERENCE)):
+            with open(os.path.join(file_name, FIXED_REFERENCE), 'r') as f:
+                rows = [row.split(',') for row in f if row.strip()]
+            self.update(np.array([int(key) for key, _ in rows], dtype=np.int64),
+                        np.array([float(value) for _, value in rows]))
+
+    def __map__(self) -> np.ndarray:
+        with open(self.file_name, 'rb') as f:
+            magic, version, length = FIXED_HEADER.unpack(f.read(FIXED_HEADER.size))
+        if magic != FIXED_MAGIC:
+            raise ValueError(f"{self.file_name} is not a scores file")
+        if version != FIXED_VERSION:
+            raise ValueError(f"{self.file_name} has format version {version} but version {FIXED_VERSION} is required")
+        if not length:
+            return np.zeros(0, dtype=np.float32)
+        return np.memmap(self.file_name, dtype="<f4", mode='r', offset=FIXED_HEADER.size, shape=(length,))
+
+    def __reserve__(self, length: int):
+        if length <= len(self.scores):
+            self.length = max(self.length, length)
+            return
+        scores = np.full(max(length, 2 * len(self.scores)), np.nan, dtype=np.float32)
+        scores[:self.length] = self.scores[:self.length]
+        self.scores = scores
+        self.length = length
+
+    def __setitem__(self, key: int, value: float):
+        self.__reserve__(key + 1)
+        self.scores[key] = value
+        self.extremes = None
+
+    def update(self, doc_ids: np.ndarray, values: np.ndarray):
+        """
+        Set the scores of many documents at once.
+        """
+        if len(doc_ids):
+            self.__reserve__(int(doc_ids.max()) + 1)
+            self.scores[doc_ids] = values
+            self.extremes = None
+
+    def __getitem__(self, item: int) -> float:
+        if item not in self:
+            raise KeyError(item)
+        return float(self.scores[item])
+
+    def __contains__(self, item: int) -> bool:
+        return 0 <= item < self.length and not np.isnan(self.scores[item])
+
+    def __len__(self):
+        return self.length
+
+    def get(self, doc_id: int, default: float = 0.0) -> float:
+        if 0 <= doc_id < self.length:
+            score = self.scores[doc_id]
+            if not np.isnan(score):
+                return float(score)
+        return default
+
+    def scores_for(self, doc_ids: Iterable[int]) -> np.ndarray:
+        """
+        The scores of many documents at once, 0 for documents without a score, such as the candidates of a query.
+        """
+        doc_ids = np.fromiter(doc_ids, dtype=np.int64)
+        scores = np.zeros(len(doc_ids))
+        known = (doc_ids >= 0) & (doc_ids < self.length)
+        scores[known] = self.scores[doc_ids[known]]
+        return np.nan_to_num(scores, nan=0.0)
+
+    def bounds(self) -> Tuple[float, float]:
+        """
+        The smallest and the largest score, found once for every change of the scores.
+        """
+        if self.extremes is None:
+            scores = np.asarray(self.scores[:self.length])
+            scores = scores[~np.isnan(scores)]
+            self.extremes = (float(scores.min()), float(scores.max())) if len(scores) else (0.0, 0.0)
+        return self.extremes
+
+    def flush(self):
+        """
+        Write the scores file under a temporary name and rename it over the scores file.
+        """
+        with open(f"{self.file_name}.tmp", 'wb') as f:
+            f.write(FIXED_HEADER.pack(FIXED_MAGIC, FIXED_VERSION, self.length))
+            f.write(np.asarray(self.scores[:self.length], dtype="<f4").tobytes())
+        os.replace(f"{self.file_name}.tmp", self.file_name)
+
+    def close(self):
+        self.scores = np.zeros(0, dtype=np.float32)
+        self.length = 0
+        self.extremes = None
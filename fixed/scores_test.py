@@ -0,0 +1,56 @@
+import os
+import shutil
+import unittest
+
+import numpy as np
+
+from .scores import FIXED_REFERENCE, FIXED_SCORES, FixedScoreDictionary
+
+
+class FixedScoreDictionaryTest(unittest.TestCase):
+    def test_scores(self):
+        scores = FixedScoreDictionary("scores.test")
+        scores[3] = 1.5
+        scores.update(np.array([7, 0]), np.array([0.25, 2.0]))
+        self.assertEqual(len(scores), 8)
+        self.assertEqual((scores[3], scores[7], scores[0]), (1.5, 0.25, 2.0))
+        self.assertIn(3, scores)
+        self.assertNotIn(4, scores)
+        self.assertNotIn(100, scores)
+        with self.assertRaises(KeyError):
+            _ = scores[4]
+        self.assertEqual((scores.get(4), scores.get(100, -1.0)), (0.0, -1.0))
+        self.assertEqual(scores.scores_for([7, 4, 3, 100]).tolist(), [0.25, 0.0, 1.5, 0.0])
+        self.assertEqual(scores.bounds(), (0.25, 2.0))
+        scores[4] = 5.0
+        self.assertEqual(scores.bounds(), (0.25, 5.0))
+        scores.flush()
+        scores.close()
+
+        mapped = FixedScoreDictionary("scores.test", read=True)
+        self.assertIsInstance(mapped.scores, np.memmap)
+        self.assertEqual((len(mapped), mapped[4], mapped.get(1)), (8, 5.0, 0.0))
+        self.assertEqual(mapped.scores_for([0, 3]).tolist(), [2.0, 1.5])
+        # scores are updated by writing them again
+        scores = FixedScoreDictionary("scores.test")
+        scores[20] = 1.0
+        scores.flush()
+        self.assertEqual(len(FixedScoreDictionary("scores.test", read=True)), 21)
+        self.assertEqual(len(mapped), 8)
+        shutil.rmtree("scores.test")
+
+    def test_reference(self):
+        # scores written as text before are read by doc_id
+        os.mkdir("reference.test")
+        with open(f"reference.test/{FIXED_REFERENCE}", 'w') as f:
+            f.write("2,0.5\n10,1.25\n")
+        scores = FixedScoreDictionary("reference.test", read=True)
+        self.assertEqual((scores[2], scores[10], len(scores)), (0.5, 1.25, 11))
+        self.assertFalse(os.path.exists(f"reference.test/{FIXED_SCORES}"))
+        self.assertEqual(len(FixedScoreDictionary("empty.test", read=True)), 0)
+        shutil.rmtree("reference.test")
+        shutil.rmtree("empty.test")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,90 +1,502 @@
 from posting.tokenizer import Tokenizer
-from posting.tokenizer.ngram import WordTokenizer, BigramTokenizer, TrigramTokenizer
+from posting.tokenizer.ngram import WordTokenizer, BigramTokenizer
+from posting.tokenizer.document import PERMITTED_ENCODINGS, analyze
 from posting.tokenizer.bold import BoldTokenizer
-from posting.tokenizer.anchor import AnchorTokenizer, PositionalTokenizer
+from posting.tokenizer.anchor import AnchorTokenizer
+from posting.tokenizer.position import PositionTokenizer
 from doc import DocumentIdDictionary, normalize_url, from_document_dictionary
-from posting import PostingDictionary, merge, PostingWriter, PostingReader
+from posting import PostingDictionary, merge_tree, PostingWriter, PostingReader
 from posting.score import QueryScoringScheme
 from fixed import FixedScoreDictionary
-from fixed.page_rank import PageRank
+from fixed.graph import GRAPH, GraphWriter
+from fixed.hits import HITS
+from fixed.page_rank import PageRank, resolve_links
+from posting.score.positional import PositionalScoring
 from posting.score.tf_idf import TfIdfScoring
+from posting.segment import MAIN, Manifest, commit_lock, load_tombstones, new_segment, read_manifest, read_statistics
+from posting.segment import recover, save_tombstones, segment_sizes, tiered_merge, write_manifest, write_statistics
+from posting.text import convert
+import csv
 import glob
+import hashlib
+import json
+import os
+import shutil
+from heapq import nlargest
 from multiprocessing import Pool
+from threading import Thread
+from typing import Dict, List, Optional, Tuple, Type
 
 ROOT_DIR = "/home/lopes/Datasets/IR/DEV"
+# the number of processes used to build an index and the number of documents each of them tokenizes at a time
+BUILD_WORKERS = os.cpu_count()
+SHARD_SIZE = 1000
+# the number of postings per key kept in the champion tier
+CHAMPION_SIZE = 500
+# the doc_id, modification time and sha1 digest of every indexed file, used to find the files that changed. The
+# digest is only computed for files indexed incrementally and is empty for the others.
+FILE_STATE = "files.reference"
 
 
 def merge_files(name: str, posting, query_scheme):
-    writer = PostingWriter(f"{name}/finalized")
-    total_count = len(glob.glob(f"{name}/partials/*.index"))
-    merge(writer, *[PostingReader(f"{name}/partials/{file}", posting) for file in range(total_count)])
-    writer.flush()
-    writer.close()
+    partials = sorted(file[:-len(".index")] for file in glob.glob(f"{name}/partials/*.index"))
+    merge_tree(f"{name}/finalized", partials, posting)
     scheme(name, posting, query_scheme)
 
 
-def scheme(name: str, posting, query_scheme):
+def replace_postings(source: str, destination: str):
+    """
+    Rename a posting file and its position table over another, so a reader opening it does not see a partial file.
+    """
+    os.replace(f"{source}.index.position", f"{destination}.index.position")
+    os.replace(f"{source}.index", f"{destination}.index")
+
+
+def scheme(name: str, posting, query_scheme, weighted: bool = True):
+    """
+    Write the schemed postings of an index from its finalized postings.
+    :param weighted: weight the postings by idf, see QueryScoringScheme.finalize_posting. Only weighted indexes get
+    statistics here, segments written unweighted write their own.
+    """
     reader = PostingReader(f"{name}/finalized", posting)
-    writer = PostingWriter(f"{name}/schemed")
+    writer = PostingWriter(f"{name}/schemed.next")
     for key in reader.keys:
         reader.seek(key)
         writer.write_key(key)
-        writer.write(*query_scheme.finalize_posting(reader.get_iterator()))
+        writer.write_postings(query_scheme.finalize_posting(reader.get_iterator(), weighted))
     writer.flush()
     writer.close()
+    reader.close()
+    replace_postings(f"{name}/schemed.next", f"{name}/schemed")
+    if weighted:
+        write_statistics(name, len(query_scheme.dictionary))
+    # the order of the postings of a key does not depend on idf, so unweighted segments get a champion tier too
     if type(query_scheme) is TfIdfScoring:
         champion(name, posting)
 
 
-def champion(name: str, posting):
-    writer = PostingWriter(f"{name}/champion")
+def champion(name: str, posting, size: int = CHAMPION_SIZE):
+    """
+    Write the champion tier: the size postings of each key with the highest tf_idf, kept in doc_id order so they can be
+    searched like the full postings.
+    """
+    writer = PostingWriter(f"{name}/champion.next")
     reader = PostingReader(f"{name}/schemed", posting)
     for key in sorted(reader.keys.keys()):
         writer.write_key(key)
-        writer.write(*sorted(list(reader.get_iterator()),
-                             key=lambda x: x.get_property("tf_idf"),
-                             reverse=True))
+        postings = reader.get_iterator(key).read_block()
+        tf_idf = postings.column("tf_idf")
+        writer.write_postings(postings.take(sorted(nlargest(size, range(len(postings)), key=tf_idf.__getitem__))))
     writer.flush()
     writer.close()
+    replace_postings(f"{name}/champion.next", f"{name}/champion")
+    reader.close()
 
 
-def processor(name: str, identifier: DocumentIdDictionary, tokenizer: Tokenizer, query_scheme: QueryScoringScheme):
-    postings = PostingDictionary(name)
-    identifier.set_name(name)
-    encountered = set()
-    posting = query_scheme.get_posting_type()
+def convert_files(name: str, posting):
+    """
+    Convert the finalized, schemed and champion files of an index built with the text posting format.
+    """
+    for file in ("finalized", "schemed", "champion"):
+        if os.path.exists(f"{name}/{file}.index"):
+            convert(f"{name}/{file}", posting)
+
+
+def convert_indexes(*names: str):
+    """
+    Convert tf-idf indexes built before postings were stored in the binary format, so they can be queried without
+    being rebuilt. Indexes already in the binary format are left as they are.
+    """
+    posting = TfIdfScoring([], None).get_posting_type()
+    for name in names:
+        convert_files(name, posting)
+
+
+def read_url(document: str) -> Optional[str]:
+    """
+    Read the normalized url of a document, or None if the tokenizers would skip the document.
+    """
+    with open(document, 'r') as f:
+        obj = json.load(f)
+    if obj["encoding"].lower() not in PERMITTED_ENCODINGS:
+        return None
+    return normalize_url(obj["url"])
+
+
+# the state of a build worker, set once per process by initialize_worker
+WORKER_DICTIONARY: Optional[DocumentIdDictionary] = None
+WORKER_INDEXES: List[Tuple[str, Tokenizer, QueryScoringScheme]] = []
+
+
+def initialize_worker(assigned: List[Tuple[int, str, str]],
+                      indexes: List[Tuple[str, Tokenizer, Type[QueryScoringScheme]]]):
+    """
+    Set up a build worker with the doc_ids of every document and a scoring scheme for each index.
+    :param assigned: the doc_id, file and url of each document
+    :param indexes: the name, tokenizer and scoring scheme of each index
+    """
+    global WORKER_DICTIONARY, WORKER_INDEXES
+    WORKER_DICTIONARY = DocumentIdDictionary("", [])
+    for doc_id, document, url in assigned:
+        WORKER_DICTIONARY.add_row([doc_id, document, url])
+    WORKER_INDEXES = [(name, tokenizer, scheme_type(WORKER_DICTIONARY, None))
+                      for name, tokenizer, scheme_type in indexes]
+
 
-    for document in glob.glob(f"{ROOT_DIR}/**/*"):
-        token_result = tokenizer.tokenize(document)
-        if not token_result:
+def process_shard(shard: int, documents: List[Tuple[int, str, str]],
+                  graph: bool) -> Tuple[List[List[Tuple[int, Dict]]], Dict[int, Dict[int, int]]]:
+    """
+    Parse a shard of documents in a worker and write the postings of every index as partials prefixed by the shard
+    number. Each document is parsed once and its result is given to every tokenizer and to the link graph, whose
+    hrefs are found as fixed.page_rank.extract_graph finds them.
+    :param documents: the doc_id, file and url of each document in the shard, in doc_id order
+    :param graph: also find the documents each document links to
+    :return: the doc_id and properties of each document tokenized for each index, and the links of each document
+    """
+    postings = [PostingDictionary(name, prefix=f"{shard}.") for name, _, _ in WORKER_INDEXES]
+    properties = [[] for _ in WORKER_INDEXES]
+    links = dict()
+    for doc_id, document, url in documents:
+        parsed = analyze(document)
+        if parsed is None:
             continue
-        if len(postings) > 200000:
-            postings.flush()
-        print(token_result.url)
+        if graph:
+            links[doc_id] = resolve_links(parsed.url, parsed.hrefs, WORKER_DICTIONARY)
+        for (_, tokenizer, query_scheme), dictionary, index_properties in zip(WORKER_INDEXES, postings, properties):
+            token_result = tokenizer.tokenize_document(parsed)
+            if not token_result:
+                continue
+            for token, post in query_scheme.create_posting(document, token_result):
+                dictionary.add_posting(token, post)
+            token_result.properties['count'] = token_result.total_count
+            index_properties.append((doc_id, token_result.properties))
+    for dictionary in postings:
+        dictionary.close()
+    return properties, links
+
+
+def process_shard_arguments(arguments: Tuple[int, List[Tuple[int, str, str]], bool]):
+    return process_shard(*arguments)
+
+
+def register_documents(identifier: DocumentIdDictionary, documents: Dict[int, Tuple[str, str]],
+                       properties: List[Tuple[int, Dict]]):
+    """
+    Give the documents the tokenizer of an index accepted the doc_ids reserved for them, with their properties.
+    Documents it skipped are left out of the index, so they do not count towards its idf.
+    :param documents: the file and url of each reserved doc_id
+    :param properties: the doc_id and properties of each accepted document, as process_shard returns them
+    """
+    for doc_id, document_properties in properties:
+        identifier.assign(doc_id, *documents[doc_id])
+        identifier.add_document_property(doc_id, document_properties)
+
+
+def processor(indexes: List[Tuple[str, Tokenizer, QueryScoringScheme]], graph: Optional[str] = None,
+              workers: int = BUILD_WORKERS):
+    """
+    Build indexes over ROOT_DIR in a single pass. Documents are split into shards of SHARD_SIZE that are parsed by a
+    pool of workers, each writing its own partials for every index, which are then merged. Doc_ids are assigned up front
+    in sorted file order so the indexes share them and do not depend on the number of workers or the order in which
+    shards finish.
+    :param indexes: the name, tokenizer and scoring scheme of each index. The scoring scheme must have been created
+    with the DocumentIdDictionary the index is written to.
+    :param graph: the name of the page rank index to write the link graph of the documents to
+    """
+    for name, _, _ in indexes:
+        for partial in glob.glob(f"{name}/partials/*"):
+            os.remove(partial)
+
+    documents = sorted(glob.glob(f"{ROOT_DIR}/**/*"))
+    encountered = set()
+    assigned = []
+    with Pool(workers) as pool:
+        for document, url in zip(documents, pool.imap(read_url, documents, chunksize=64)):
+            if url is None or url in encountered:
+                continue
+            encountered.add(url)
+            assigned.append((document, url))
+
+    # doc_ids are reserved in file order so every index shares them, and are only given to a document once the
+    # tokenizer of an index accepted it
+    identifiers = [query_scheme.dictionary for _, _, query_scheme in indexes]
+    for (name, _, _), identifier in zip(indexes, identifiers):
+        identifier.set_name(name)
+    first = max(identifier.counter for identifier in identifiers)
+    assigned = [(first + i, document, url) for i, (document, url) in enumerate(assigned)]
+    files = {doc_id: (document, url) for doc_id, document, url in assigned}
+
+    links = None
+    if graph is not None:
+        os.makedirs(graph, exist_ok=True)
+        links = GraphWriter(f"{graph}/{GRAPH}", [doc_id for doc_id, _, _ in assigned])
+    scheme_types = [(name, tokenizer, type(query_scheme)) for name, tokenizer, query_scheme in indexes]
+    shards = [(shard, assigned[start:start + SHARD_SIZE], graph is not None)
+              for shard, start in enumerate(range(0, len(assigned), SHARD_SIZE))]
+    with Pool(workers, initializer=initialize_worker, initargs=(assigned, scheme_types)) as pool:
+        # shards are returned in order, so the links of each shard are written to the graph as it finishes
+        for properties, shard_links in pool.imap(process_shard_arguments, shards):
+            for identifier, index_properties in zip(identifiers, properties):
+                register_documents(identifier, files, index_properties)
+            if links is not None:
+                for doc_id, targets in shard_links.items():
+                    links.add(doc_id, targets)
+
+    if links is not None:
+        links.close()
+    state = {document: (doc_id, os.path.getmtime(document), "") for doc_id, document, _ in assigned}
+    for (name, _, query_scheme), identifier in zip(indexes, identifiers):
+        # the doc_ids of skipped documents are not reused
+        identifier.counter = first + len(assigned)
+        identifier.flush()
+        identifier.close()
+        merge_files(name, query_scheme.get_posting_type(), query_scheme)
+        write_file_state(name, state)
+        # a full build replaces every segment and the deleted documents
+        with commit_lock(name):
+            generation = read_manifest(name).generation + 1
+            write_manifest(name, Manifest(generation, [MAIN], None, identifier.counter))
+        recover(name)
+
+
+def file_digest(file: str) -> str:
+    digest = hashlib.sha1()
+    with open(file, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
 
-        if normalize_url(token_result.url) in encountered:
+def read_file_state(name: str) -> Dict[str, Tuple[int, float, str]]:
+    """
+    :return: the doc_id, modification time and digest of each file indexed in an index
+    """
+    if not os.path.exists(f"{name}/{FILE_STATE}"):
+        return dict()
+    with open(f"{name}/{FILE_STATE}", newline='') as f:
+        return {file: (int(doc_id), float(mtime), digest) for file, doc_id, mtime, digest in csv.reader(f)}
+
+
+def write_file_state(name: str, state: Dict[str, Tuple[int, float, str]]):
+    with open(f"{name}/{FILE_STATE}.tmp", 'w', newline='') as f:
+        writer = csv.writer(f)
+        for file, (doc_id, mtime, digest) in sorted(state.items()):
+            writer.writerow([file, doc_id, repr(mtime), digest])
+    os.replace(f"{name}/{FILE_STATE}.tmp", f"{name}/{FILE_STATE}")
+
+
+def changed_files(state: Dict[str, Tuple[int, float, str]],
+                  documents: List[str]) -> Tuple[List[str], List[str]]:
+    """
+    Compare the files under ROOT_DIR with the files of an index. A file whose modification time changed is only
+    considered changed when its digest changed too, and the state of the others is updated in place.
+    :return: the files to add and the files to remove. Changed files are in both.
+    """
+    present = set(documents)
+    removed = [document for document in state if document not in present]
+    added = []
+    for document in documents:
+        mtime = os.path.getmtime(document)
+        if document not in state:
+            added.append(document)
             continue
-        encountered.add(normalize_url(token_result.url))
-        token_result.url = normalize_url(token_result.url)
+        doc_id, known, digest = state[document]
+        if mtime == known:
+            continue
+        current = file_digest(document)
+        if current == digest:
+            state[document] = (doc_id, mtime, digest)
+            continue
+        removed.append(document)
+        added.append(document)
+    return added, removed
+
+
+# the thread merging the segments of each index in the background, so each index is merged by one thread at a time
+MERGES: Dict[str, Thread] = dict()
 
-        doc_id = identifier.generate_doc_id(document, normalize_url(token_result.url))
-        posts = query_scheme.create_posting(document, token_result)
-        for token, post in posts:
-            postings.add_posting(token, post)
 
-        token_result.properties['count'] = token_result.total_count
-        identifier.add_document_property(doc_id, token_result.properties)
+def incremental(indexes: List[Tuple[str, Tokenizer, Type[QueryScoringScheme]]],
+                workers: int = BUILD_WORKERS) -> List[Thread]:
+    """
+    Update indexes built by processor with the files under ROOT_DIR that were added, changed or deleted since, without
+    rebuilding them. New and changed files get new doc_ids and are indexed into a new segment of each index. Deleted and
+    changed files are marked in the tombstones of each index. Both are committed by a new manifest, after which the
+    segments of each index are merged in the background, see merge_segments.
+    :param indexes: the name, tokenizer and scoring scheme type of each index. The indexes must have been built
+    together, so they share doc_ids.
+    :return: the merges that were started
+    """
+    for name, _, _ in indexes:
+        if name not in MERGES or not MERGES[name].is_alive():
+            recover(name)
+    state = read_file_state(indexes[0][0])
+    added, removed = changed_files(state, sorted(glob.glob(f"{ROOT_DIR}/**/*")))
 
-    identifier.flush()
-    postings.flush()
-    identifier.close()
-    merge_files(name, posting, query_scheme)
+    schemes = [(name, scheme_type(from_document_dictionary(name), None)) for name, _, scheme_type in indexes]
+    deleted = [[] for _ in schemes]
+    for document in removed:
+        for (_, query_scheme), doc_ids in zip(schemes, deleted):
+            if document in query_scheme.dictionary.doc_id:
+                doc_ids.append(query_scheme.dictionary.remove_document(document))
+        del state[document]
+
+    # doc_ids of deleted documents are not reused, even when they were the largest
+    counter = max([query_scheme.dictionary.counter for _, query_scheme in schemes] +
+                  [read_manifest(name).counter for name, _ in schemes])
+    first = counter
+    encountered = set()
+    assigned = []
+    with Pool(workers) as pool:
+        for document, url in zip(added, pool.imap(read_url, added, chunksize=64)):
+            if url is None or url in encountered or schemes[0][1].dictionary.contains_url(url):
+                continue
+            encountered.add(url)
+            assigned.append((counter, document, url))
+            state[document] = (counter, os.path.getmtime(document), file_digest(document))
+            counter += 1
+
+    segments = [new_segment(name) for name, _ in schemes]
+    names = [(f"{name}/{segment}", tokenizer, scheme_type)
+             for (name, tokenizer, scheme_type), segment in zip(indexes, segments)]
+    shards = [(shard, assigned[start:start + SHARD_SIZE], False)
+              for shard, start in enumerate(range(0, len(assigned), SHARD_SIZE))]
+    files = {doc_id: (document, url) for doc_id, document, url in assigned}
+    tokenized = [0] * len(schemes)
+    if shards:
+        with Pool(workers, initializer=initialize_worker, initargs=(assigned, names)) as pool:
+            for properties, _ in pool.starmap(process_shard, shards):
+                for i, ((_, query_scheme), index_properties) in enumerate(zip(schemes, properties)):
+                    tokenized[i] += len(index_properties)
+                    register_documents(query_scheme.dictionary, files, index_properties)
+    for _, query_scheme in schemes:
+        query_scheme.dictionary.counter = counter
+
+    merges = []
+    for (name, query_scheme), segment, doc_ids, documents in zip(schemes, segments, deleted, tokenized):
+        if documents:
+            write_segment(f"{name}/{segment}", query_scheme, documents, first)
+        else:
+            shutil.rmtree(f"{name}/{segment}")
+        with commit_lock(name):
+            manifest = read_manifest(name)
+            tombstones = load_tombstones(name, manifest)
+            for doc_id in doc_ids:
+                tombstones.add(doc_id)
+            generation = manifest.generation + 1
+            write_manifest(name, Manifest(generation, manifest.segments + ([segment] if documents else []),
+                                          save_tombstones(name, generation, tombstones), counter))
+        query_scheme.dictionary.flush()
+        write_file_state(name, state)
+        if name not in MERGES or not MERGES[name].is_alive():
+            MERGES[name] = Thread(target=merge_segments, args=(name, query_scheme), daemon=True)
+            MERGES[name].start()
+            merges.append(MERGES[name])
+    return merges
+
+
+def write_segment(name: str, query_scheme: QueryScoringScheme, documents: int, first: int):
+    """
+    Merge the partials written by incremental into a segment and write its unweighted schemed postings.
+    :param name: the directory of the segment
+    :param documents: the number of documents in the partials
+    :param first: the first doc_id of the segment
+    """
+    posting = query_scheme.get_posting_type()
+    partials = sorted(file[:-len(".index")] for file in glob.glob(f"{name}/partials/*.index"))
+    merge_tree(f"{name}/finalized", partials, posting)
+    shutil.rmtree(f"{name}/partials")
+    scheme(name, posting, query_scheme, weighted=False)
+    write_statistics(name, documents, weighted=False, first=first)
 
 
-def tf_idf_processor(name: str, tokenizer: Tokenizer):
-    dictionary = DocumentIdDictionary(name, ["count"])
-    scheme = TfIdfScoring(dictionary, None)
-    processor(name, dictionary, tokenizer, scheme)
+def merge_segments(name: str, query_scheme: QueryScoringScheme):
+    """
+    Merge the segments of an index picked by the tiered merge policy until it is balanced. Each merge is committed on
+    its own, so queries see the index change one merge at a time.
+    """
+    while True:
+        manifest = read_manifest(name)
+        merge = tiered_merge(segment_sizes(name, manifest))
+        if merge is None:
+            return
+        merge_segment(name, query_scheme, manifest.segments[merge[0]:merge[1]])
+
+
+def merge_segment(name: str, query_scheme: QueryScoringScheme, segments: List[str], weighted: bool = False) -> str:
+    """
+    Merge adjacent segments of an index into a new segment without their deleted documents, and commit a manifest
+    naming it in their place. The merged segments stay on disk for the queries still reading them until the next
+    update of the index removes them. Nothing is committed if the merge fails, so a crash leaves the index at the last
+    generation.
+    :param segments: the directories of the segments relative to the index, in manifest order
+    :param weighted: weight the postings by idf over every document of the index, when every segment is merged
+    :return: the directory of the new segment relative to the index
+    """
+    posting = query_scheme.get_posting_type()
+    deleted = load_tombstones(name, read_manifest(name))
+    statistics = read_statistics(os.path.join(name, segments[0]))
+    segment = new_segment(name)
+    merge_tree(f"{name}/{segment}/merged", [os.path.join(name, source, "finalized") for source in segments], posting)
+
+    reader = PostingReader(f"{name}/{segment}/merged", posting)
+    writer = PostingWriter(f"{name}/{segment}/finalized")
+    documents, dropped = set(), set()
+    for key in reader.keys:
+        postings = reader.get_iterator(key).read_block()
+        live = [i for i, doc_id in enumerate(postings.doc_ids) if doc_id not in deleted]
+        documents.update(postings.doc_ids[i] for i in live)
+        dropped.update(doc_id for doc_id in postings.doc_ids if doc_id in deleted)
+        if live:
+            writer.write_key(key)
+            writer.write_postings(postings.take(live))
+    writer.flush()
+    writer.close()
+    reader.close()
+    for file in glob.glob(f"{name}/{segment}/merged.index*"):
+        os.remove(file)
+    scheme(f"{name}/{segment}", posting, query_scheme, weighted)
+    write_statistics(f"{name}/{segment}", len(query_scheme.dictionary) if weighted else len(documents), weighted,
+                     statistics.get("first", 0) if statistics else 0)
+
+    with commit_lock(name):
+        manifest = read_manifest(name)
+        # updates only append segments and merges of an index do not overlap, so the merged segments are still there
+        start = manifest.segments.index(segments[0])
+        assert manifest.segments[start:start + len(segments)] == segments, "Segments changed during the merge"
+        tombstones = load_tombstones(name, manifest)
+        for doc_id in dropped:
+            tombstones.remove(doc_id)
+        generation = manifest.generation + 1
+        write_manifest(name, Manifest(generation, manifest.segments[:start] + [segment] +
+                                      manifest.segments[start + len(segments):],
+                                      save_tombstones(name, generation, tombstones), manifest.counter))
+    return segment
+
+
+def compact(name: str, query_scheme: QueryScoringScheme) -> str:
+    """
+    Merge every segment of an index into one without the deleted documents, and weight the postings over the live
+    documents again.
+    :return: the directory of the new segment relative to the index
+    """
+    if name in MERGES:
+        MERGES[name].join()
+    return merge_segment(name, query_scheme, read_manifest(name).segments, weighted=True)
+
+
+def tf_idf_processor(*indexes: Tuple[str, Tokenizer], graph: Optional[str] = None,
+                     positional: Optional[Tuple[str, Tokenizer]] = None):
+    """
+    Build tf-idf indexes in a single pass.
+    :param positional: the name and tokenizer of a positional index to build in the same pass
+    """
+    schemes = [(name, tokenizer, TfIdfScoring(DocumentIdDictionary(name, ["count"]), None))
+               for name, tokenizer in indexes]
+    if positional is not None:
+        name, tokenizer = positional
+        schemes.append((name, tokenizer, PositionalScoring(DocumentIdDictionary(name, ["count"]), None)))
+    processor(schemes, graph)
 
 
 def page_rank(name: str):
@@ -94,19 +506,35 @@ def page_rank(name: str):
     ranker.flush()
 
 
-TOKENIZER_LIST = {("indexes/default", WordTokenizer()), ("indexes/bigram", BigramTokenizer()),
-                  ("indexes/trigram", TrigramTokenizer())}
-OTHER_TOKENIZER_LIST = {("indexes/position", PositionalTokenizer), ("indexes/anchor", AnchorTokenizer)}
+def hits(name: str, graph: str = "indexes/page_rank"):
+    """
+    Score the authority of every document over the link graph page_rank ranks, and their hubs under {name}/hubs.
+    """
+    scorer = HITS(from_document_dictionary("indexes/default"), FixedScoreDictionary(name),
+                  FixedScoreDictionary(f"{name}/hubs"), graph_file=f"{graph}/{GRAPH}")
+    scorer.process()
+    scorer.flush()
+
+
+TOKENIZER_LIST = {("indexes/default", WordTokenizer()), ("indexes/bigram", BigramTokenizer())}
+# phrases longer than a bigram are matched in the positional index, which replaced the trigram index
+POSITIONAL_INDEX = ("indexes/position", PositionTokenizer())
+OTHER_TOKENIZER_LIST = {("indexes/anchor", AnchorTokenizer)}
 
 RUN_CONFIG = 1
 
 if __name__ == "__main__":
     if RUN_CONFIG == 0:
-        with Pool(len(TOKENIZER_LIST)) as pool:
-            pool.starmap(tf_idf_processor, TOKENIZER_LIST)
+        # every index and the link graph are built from a single parse of each document
+        tf_idf_processor(*TOKENIZER_LIST, ("indexes/bold", BoldTokenizer()), graph="indexes/page_rank",
+                         positional=POSITIONAL_INDEX)
     elif RUN_CONFIG == 1:
         page_rank("indexes/page_rank")
+        hits("indexes/hits")
     elif RUN_CONFIG == 2:
         tf_idf_processor("indexes/bold", BoldTokenizer())
+    elif RUN_CONFIG == 3:
+        # the positional index was never written in the text format
+        convert_indexes(*(name for name, _ in TOKENIZER_LIST), "indexes/bold")
     else:
         pass
@@ -0,0 +1,86 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from doc import DocumentIdDictionary, from_document_dictionary
+from fixed.graph import GRAPH, LinkGraph
+from posting import PostingReader
+from posting.score.tf_idf import TfIdfScoring
+
+try:
+    import indexer
+    from posting.tokenizer.bold import BoldTokenizer
+    from posting.tokenizer.ngram import WordTokenizer
+except ImportError:
+    # the HTML parser and the stemmer are not installed
+    indexer = None
+
+PAGES = [
+    ("https://example.com/a", "<p><b>apple</b> banana <a href='b'>b</a> <a href='/c'>c</a></p>", "utf-8"),
+    ("https://example.com/b", "<p>banana cherry <a href='https://example.com/a'>a</a></p>", "utf-8"),
+    ("https://example.com/c", "<p>cherry apple apple</p>", "utf-8"),
+    ("https://example.com/d", "<p>skipped</p>", "shift_jis"),
+    ("https://example.com/b#duplicate", "<p>duplicate</p>", "utf-8"),
+    ("https://example.com/e", "<h1>date</h1> apple <a href='a'>a</a>", "utf-8"),
+    ("https://example.com/f", "<script>var x;</script>", "utf-8"),
+    ("https://example.com/g", "<p>grape banana</p>", "utf-8"),
+]
+
+
+@unittest.skipIf(indexer is None, "bs4, lxml and nltk are required to parse documents")
+class ProcessorTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.mkdtemp()
+        os.makedirs(f"{self.directory}/documents/site")
+        for i, (url, content, encoding) in enumerate(PAGES):
+            with open(f"{self.directory}/documents/site/{i}.json", 'w') as f:
+                json.dump({"url": url, "content": content, "encoding": encoding}, f)
+        self.settings = indexer.ROOT_DIR, indexer.SHARD_SIZE
+        # several shards, so two workers finish them in any order
+        indexer.ROOT_DIR, indexer.SHARD_SIZE = f"{self.directory}/documents", 2
+
+    def build(self, workers: int) -> str:
+        name = f"{self.directory}/{workers}"
+        schemes = [(f"{name}/{index}", tokenizer,
+                    TfIdfScoring(DocumentIdDictionary(f"{name}/{index}", ["count"]), None))
+                   for index, tokenizer in (("default", WordTokenizer()), ("bold", BoldTokenizer()))]
+        indexer.processor(schemes, f"{name}/page_rank", workers)
+        return name
+
+    @staticmethod
+    def postings(name: str, file: str):
+        posting = TfIdfScoring([], None).get_posting_type()
+        reader = PostingReader(f"{name}/{file}", posting)
+        postings = {key: [str(post) for post in reader.get_iterator(key).read_block()] for key in reader.keys}
+        reader.close()
+        return postings
+
+    def test_workers(self):
+        first, second = self.build(1), self.build(2)
+        for index in ("default", "bold"):
+            rows = from_document_dictionary(f"{first}/{index}").reverse_map
+            self.assertEqual(from_document_dictionary(f"{second}/{index}").reverse_map, rows)
+            for file in ("finalized", "schemed", "champion"):
+                self.assertEqual(self.postings(f"{second}/{index}", file), self.postings(f"{first}/{index}", file))
+        # doc_ids follow the sorted files, without the skipped encoding and the duplicate url
+        rows = from_document_dictionary(f"{first}/default").reverse_map
+        self.assertEqual({doc_id: row[2] for doc_id, row in rows.items()},
+                         {0: PAGES[0][0], 1: PAGES[1][0], 2: PAGES[2][0], 3: PAGES[5][0], 4: PAGES[6][0],
+                          5: PAGES[7][0]})
+        self.assertEqual(int(rows[2][3]), 3)
+        graphs = [LinkGraph.load(f"{name}/page_rank/{GRAPH}") for name in (first, second)]
+        for column in ("nodes", "indptr", "indices", "weights"):
+            np.testing.assert_array_equal(getattr(graphs[0], column), getattr(graphs[1], column))
+        self.assertEqual(graphs[0].indices.tolist(), [1, 2, 0, 0])
+
+    def tearDown(self) -> None:
+        indexer.ROOT_DIR, indexer.SHARD_SIZE = self.settings
+        shutil.rmtree(self.directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
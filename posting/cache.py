@@ -0,0 +1,365 @@
+import sys
+from collections import OrderedDict
+from heapq import nlargest
+from threading import Lock
+from time import time
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .io import PostingIterator, PostingReader
+from .post import Posting, PostingBlock
+
+# the number of keys whose hits are counted by a PostingCache. When more keys are looked up, the least looked up half
+# is forgotten.
+TERM_STATISTICS = 10000
+# the estimated number of bytes of a decoded posting of each posting type
+POSTING_SIZES: Dict[type, int] = dict()
+# odd multipliers that spread the hash of a key over each row of a TinyLFU sketch. The rows take the top bits of
+# different products, so keys that share a counter in one row rarely share it in the others.
+ROW_SEEDS = (0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0xD6E8FEB86659FD93)
+
+
+class LRUCache:
+    """
+    A thread safe cache that evicts the least recently used entries once the total weight of its entries exceeds its
+    capacity. Entries can also expire a fixed time after they were added.
+    """
+
+    def __init__(self, capacity: int, ttl: Optional[float] = None, weigh: Callable[[Any], int] = None,
+                 admission: Optional["TinyLFU"] = None):
+        """
+        :param capacity: the largest total weight of the entries
+        :param ttl: the number of seconds an entry is kept, or None to keep entries until they are evicted
+        :param weigh: the weight of a value, 1 for every value if not given
+        :param admission: decides whether a new entry may evict the entries it would replace. Without it every new
+        entry is added.
+        """
+        self.capacity = capacity
+        self.ttl = ttl
+        self.weigh = weigh if weigh else lambda value: 1
+        self.admission = admission
+        self.rejections = 0
+        self.entries: "OrderedDict[Hashable, Tuple[Any, int, float]]" = OrderedDict()
+        self.weight = 0
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        if self.admission is not None:
+            self.admission.increment(key)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, weight, added = entry
+            if self.ttl is not None and time() - added > self.ttl:
+                del self.entries[key]
+                self.weight -= weight
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any, weight: Optional[int] = None) -> bool:
+        """
+        Add an entry, evicting the least recently used entries to make room for it.
+        :param weight: the weight of the value, if it is already known
+        :return: whether the entry was added
+        """
+        weight = self.weigh(value) if weight is None else weight
+        with self.lock:
+            if not self.__admits__(key, weight):
+                self.rejections += 1
+                return False
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.weight -= previous[1]
+            self.entries[key] = (value, weight, time())
+            self.weight += weight
+            while self.weight > self.capacity:
+                _, (_, evicted, _) = self.entries.popitem(last=False)
+                self.weight -= evicted
+                self.evictions += 1
+        return True
+
+    def would_admit(self, key: Hashable, weight: int) -> bool:
+        """
+        Whether an entry of the given weight would be added by put, if nothing changes the cache in between.
+        """
+        with self.lock:
+            return self.__admits__(key, weight)
+
+    def __admits__(self, key: Hashable, weight: int) -> bool:
+        """
+        Whether put would add an entry, while holding the lock.
+        """
+        if weight > self.capacity:
+            return False
+        if self.admission is None:
+            return True
+        victims = []
+        free = self.capacity - self.weight
+        for victim, (_, victim_weight, _) in self.entries.items():
+            if free >= weight:
+                break
+            if victim != key:
+                victims.append(victim)
+            free += victim_weight
+        return self.admission.admit(key, victims)
+
+    def invalidate(self):
+        with self.lock:
+            self.entries.clear()
+            self.weight = 0
+
+    def __contains__(self, key: Hashable):
+        with self.lock:
+            return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def to_dict(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self.entries), "weight": self.weight, "capacity": self.capacity,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "expirations": self.expirations, "rejections": self.rejections,
+                    "hit_rate": self.hits / lookups if lookups else 0.0}
+
+
+class TinyLFU:
+    """
+    An admission policy that only lets a new entry into a full cache when it was used more often recently than every
+    entry it would evict, so a burst of keys used once cannot flush the working set. Use is counted approximately in
+    a count-min sketch of 4 bit counters that are halved every sample lookups, so old use is forgotten.
+    """
+
+    def __init__(self, width: int = 1 << 16, sample: Optional[int] = None, minimum: int = 1):
+        """
+        :param width: the number of counters per row of the sketch, a power of two
+        :param sample: the number of lookups after which every counter is halved, 10 times width if not given
+        :param minimum: the number of recent uses below which a key is never admitted, even into free space
+        """
+        self.width = width
+        self.rows = np.zeros((len(ROW_SEEDS), width), dtype=np.uint8)
+        self.shift = 64 - (width.bit_length() - 1)
+        self.sample = sample if sample else 10 * width
+        self.minimum = minimum
+        self.additions = 0
+        self.lock = Lock()
+
+    def __indexes__(self, key: Hashable) -> List[int]:
+        hashed = hash(key) & 0xFFFFFFFFFFFFFFFF
+        return [(hashed * seed & 0xFFFFFFFFFFFFFFFF) >> self.shift for seed in ROW_SEEDS]
+
+    def increment(self, key: Hashable):
+        with self.lock:
+            indexes = self.__indexes__(key)
+            current = min(row[index] for row, index in zip(self.rows, indexes))
+            if current < 15:
+                # only the smallest counters are incremented, which keeps overestimates low
+                for row, index in zip(self.rows, indexes):
+                    if row[index] == current:
+                        row[index] += 1
+            self.additions += 1
+            if self.additions >= self.sample:
+                self.additions //= 2
+                self.rows >>= 1
+
+    def estimate(self, key: Hashable) -> int:
+        return int(min(row[index] for row, index in zip(self.rows, self.__indexes__(key))))
+
+    def admit(self, key: Hashable, victims: List[Hashable]) -> bool:
+        frequency = self.estimate(key)
+        return frequency >= self.minimum and all(frequency > self.estimate(victim) for victim in victims)
+
+
+class DecodedBlock:
+    def __init__(self, postings: List[Posting], last_doc_id: int, block_max: float):
+        """
+        A block of a posting file that has already been decoded.
+        :param postings: the postings of the block
+        :param last_doc_id: the doc_id of the last posting, as stored in the block header
+        :param block_max: the largest impact in the block, as stored in the block header
+        """
+        self.postings = postings
+        self.last_doc_id = last_doc_id
+        self.block_max = block_max
+
+
+class CachedPostingIterator(PostingIterator):
+    """
+    A PostingIterator over the decoded blocks of a key kept by a PostingCache. Blocks keep their skip pointers and
+    impact bounds, so the iterator can be used wherever the iterators of a reader are. The cached postings are shared
+    by every iterator and must not be modified.
+    """
+
+    def __init__(self, key: str, blocks: List[DecodedBlock], posting: type, count: int):
+        self.blocks = blocks
+        self.posting = posting
+        self.index = 0
+
+        self.posting_buffer: List[Posting] = []
+        self.offset = 0
+        self.last_doc_id = 0
+        self.block_max = 0.0
+        self.count = count
+
+        self.current = key
+        self.end = False
+
+    def __header__(self) -> Tuple[int, int, int, float]:
+        if self.index >= len(self.blocks):
+            return 0, 0, 0, 0.0
+        block = self.blocks[self.index]
+        return len(block.postings), 0, block.last_doc_id, block.block_max
+
+    def __read__(self):
+        if self.index >= len(self.blocks):
+            self.end = True
+            return
+        block = self.blocks[self.index]
+        self.index += 1
+        self.posting_buffer = block.postings
+        self.offset = 0
+        self.last_doc_id = block.last_doc_id
+        self.block_max = block.block_max
+
+    def next_block(self):
+        raise NotImplementedError("Cached postings are already decoded")
+
+    def read_block(self) -> PostingBlock:
+        """
+        Read the remaining postings into a PostingBlock, copying them out of the cached blocks.
+        """
+        block = PostingBlock.from_postings(self.posting, self.posting_buffer[self.offset:])
+        for decoded in self.blocks[self.index:]:
+            for posting in decoded.postings:
+                block.append(posting)
+        self.posting_buffer = []
+        self.offset = 0
+        self.index = len(self.blocks)
+        self.end = True
+        return block
+
+    def __skip__(self, doc_id: int):
+        while self.index < len(self.blocks) and self.blocks[self.index].last_doc_id < doc_id:
+            self.last_doc_id = self.blocks[self.index].last_doc_id
+            self.index += 1
+        if self.index >= len(self.blocks):
+            self.end = True
+
+
+class PostingCache:
+    """
+    Decoded posting lists of hot keys, which can be shared by the readers of several schemes. The capacity is in
+    bytes of decoded postings. Keys are admitted by TinyLFU: a key is only decoded into the cache once it has been
+    looked up admit times recently, and only evicts keys that were looked up less often, so a long list that is
+    looked up once neither pays for decoding nor evicts the hot lists.
+    """
+
+    def __init__(self, capacity: int, admit: int = 2, ttl: Optional[float] = None, width: int = 1 << 16):
+        """
+        :param capacity: the largest number of bytes of decoded postings kept
+        :param admit: the number of recent lookups after which a key can be cached
+        :param ttl: the number of seconds a key is kept, or None to keep keys until they are evicted
+        :param width: the number of counters per row of the frequency sketch
+        """
+        self.cache = LRUCache(capacity, ttl, weigh=lambda value: value[2], admission=TinyLFU(width, minimum=admit))
+        # the number of hits and lookups of each key, over every reader
+        self.terms: Dict[str, List[int]] = dict()
+        self.lock = Lock()
+
+    def get_iterator(self, reader: PostingReader, key: str) -> PostingIterator:
+        """
+        Create an iterator over the postings of a key, from the cache when the key is cached.
+        """
+        cached = self.cache.get((reader.file_name, key))
+        self.__record__(key, cached is not None)
+        if cached is not None:
+            blocks, count, _ = cached
+            return CachedPostingIterator(key, blocks, reader.posting_type, count)
+        count = reader.count(key)
+        weight = count * posting_size(reader.posting_type)
+        if not count or not self.cache.would_admit((reader.file_name, key), weight):
+            return reader.get_iterator(key)
+        blocks = decode(reader.get_iterator(key))
+        self.cache.put((reader.file_name, key), (blocks, count, weight), weight)
+        return CachedPostingIterator(key, blocks, reader.posting_type, count)
+
+    def __record__(self, key: str, hit: bool):
+        with self.lock:
+            counts = self.terms.get(key)
+            if counts is None:
+                if len(self.terms) >= TERM_STATISTICS:
+                    # keep the most looked up half
+                    kept = sorted(self.terms.items(), key=lambda item: item[1][1])[len(self.terms) // 2:]
+                    self.terms = dict(kept)
+                counts = self.terms[key] = [0, 0]
+            counts[0] += hit
+            counts[1] += 1
+
+    def hit_rate(self, key: str) -> float:
+        """
+        The fraction of the lookups of a key that were served from the cache.
+        """
+        with self.lock:
+            hits, lookups = self.terms.get(key, (0, 0))
+        return hits / lookups if lookups else 0.0
+
+    def term_statistics(self, limit: int = 20) -> Dict[str, dict]:
+        """
+        The hits, lookups and hit rate of the most looked up keys.
+        """
+        with self.lock:
+            top = nlargest(limit, self.terms.items(), key=lambda item: item[1][1])
+        return {key: {"hits": hits, "lookups": lookups, "hit_rate": hits / lookups} for key, (hits, lookups) in top}
+
+    def warm(self, reader: PostingReader, keys: Iterable[str]) -> int:
+        """
+        Look up keys, such as the words of logged queries, so the hot ones are cached before the first query. Keys
+        are admitted as they would be while serving, so a key has to be looked up admit times to be cached.
+        :return: the number of keys of the reader that are cached afterwards
+        """
+        keys = [key for key in keys if key in reader]
+        for key in keys:
+            self.get_iterator(reader, key)
+        return sum((reader.file_name, key) in self.cache for key in set(keys))
+
+    def invalidate(self):
+        self.cache.invalidate()
+
+    def to_dict(self):
+        return {**self.cache.to_dict(), "terms": self.term_statistics()}
+
+
+def posting_size(posting: type) -> int:
+    """
+    Estimate the number of bytes a decoded posting of a posting type takes, including its reference in a block.
+    """
+    size = POSTING_SIZES.get(posting)
+    if size is None:
+        sample = posting(1 << 20, [value_type() for _, value_type in posting.REVERSE_MAP])
+        size = POSTING_SIZES[posting] = sum(map(sys.getsizeof, [sample, sample.properties, *sample.properties])) + 8
+    return size
+
+
+def decode(iterator: PostingIterator) -> List[DecodedBlock]:
+    """
+    Decode every block of the key of an iterator that has not been read yet.
+    """
+    blocks = []
+    while True:
+        count, _, last, block_max = iterator.__header__()
+        if count == 0:
+            return blocks
+        iterator.__read__()
+        blocks.append(DecodedBlock(iterator.posting_buffer, last, block_max))
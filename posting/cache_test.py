@@ -0,0 +1,162 @@
+import glob
+import os
+import random
+import time
+import unittest
+
+from .cache import CachedPostingIterator, LRUCache, PostingCache, TinyLFU, posting_size
+from .io import PostingReader, PostingWriter
+from .post import create_posting_type
+from .wand import Cursor, block_max_wand
+
+CACHE_POSTING = create_posting_type("cache_type", {"count": int, "weight": float}, impact="weight")
+
+
+class LRUCacheTest(unittest.TestCase):
+    def test_eviction(self):
+        cache = LRUCache(3, weigh=len)
+        cache.put("a", "x")
+        cache.put("b", "yy")
+        self.assertEqual(cache.get("a"), "x")
+        cache.put("c", "z")
+        # b is the least recently used
+        self.assertNotIn("b", cache)
+        self.assertEqual(cache.get("b"), None)
+        cache.put("d", "long")
+        self.assertNotIn("d", cache)
+        self.assertEqual(cache.to_dict()["evictions"], 1)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_ttl(self):
+        cache = LRUCache(10, ttl=0.01)
+        cache.put("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+        time.sleep(0.02)
+        self.assertEqual(cache.get("a"), None)
+        self.assertEqual(cache.expirations, 1)
+        self.assertEqual(len(cache), 0)
+
+    def test_invalidate(self):
+        cache = LRUCache(10)
+        cache.put("a", 1)
+        cache.invalidate()
+        self.assertEqual(cache.get("a"), None)
+        self.assertEqual(cache.weight, 0)
+
+    def test_admission(self):
+        cache = LRUCache(2, admission=TinyLFU(64))
+        for key in ("a", "b", "a", "b"):
+            if cache.get(key) is None:
+                self.assertTrue(cache.put(key, 1))
+        # c is used less often than the entry it would evict
+        cache.get("c")
+        self.assertFalse(cache.would_admit("c", 1))
+        self.assertFalse(cache.put("c", 1))
+        self.assertEqual(cache.rejections, 1)
+        for _ in range(3):
+            cache.get("c")
+        self.assertTrue(cache.would_admit("c", 1))
+        self.assertTrue(cache.put("c", 1))
+        self.assertNotIn("a", cache)
+
+
+class TinyLFUTest(unittest.TestCase):
+    def test_aging(self):
+        sketch = TinyLFU(64, sample=100)
+        # integer keys hash the same in every run, so the counters they share do not change between runs
+        for _ in range(20):
+            sketch.increment(1000)
+        self.assertEqual(sketch.estimate(1000), 15)
+        for key in range(80):
+            sketch.increment(key)
+        # the counters were halved after the 100th increment
+        self.assertLessEqual(sketch.estimate(1000), 8)
+        self.assertTrue(sketch.admit(1000, [1, 2]))
+        self.assertFalse(sketch.admit(1, [1000]))
+
+
+class PostingCacheTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        generator = random.Random(11)
+        writer = PostingWriter("cache.test")
+        for key, size in (("a", 2000), ("b", 500)):
+            writer.write_key(key)
+            writer.write(*[CACHE_POSTING(doc, [1, generator.random()])
+                           for doc in sorted(generator.sample(range(4000), size))])
+        writer.close()
+
+    def setUp(self) -> None:
+        self.reader = PostingReader("cache.test", CACHE_POSTING, memory_map=True)
+
+    def search(self, cache: PostingCache, limit: int, conjunctive: bool):
+        cursors = [Cursor(cache.get_iterator(self.reader, key), 1.0, self.reader.impact(key)) for key in ("a", "b")]
+        return block_max_wand(cursors, limit, conjunctive)
+
+    def test_cached(self):
+        size = posting_size(CACHE_POSTING)
+        cache = PostingCache(10000 * size)
+        expected = [self.search(PostingCache(10000 * size, admit=100), 10, conjunctive)
+                    for conjunctive in (False, True)]
+        for _ in range(3):
+            self.assertEqual([self.search(cache, 10, conjunctive) for conjunctive in (False, True)], expected)
+        self.assertEqual(cache.cache.weight, 2500 * size)
+        self.assertGreater(cache.cache.hits, 0)
+        iterator = cache.get_iterator(self.reader, "b")
+        self.assertEqual(iterator.count, 500)
+        self.assertEqual(list(iterator), list(self.reader.get_iterator("b")))
+        # a was decoded on its second lookup and hit on the four after it
+        self.assertEqual(cache.term_statistics()["a"], {"hits": 4, "lookups": 6, "hit_rate": 4 / 6})
+        self.assertEqual(cache.hit_rate("b"), 5 / 7)
+
+    def test_read_block(self):
+        cache = PostingCache(10000 * posting_size(CACHE_POSTING), admit=1)
+        cache.get_iterator(self.reader, "a")
+        iterator = cache.get_iterator(self.reader, "a")
+        self.assertIsInstance(iterator, CachedPostingIterator)
+        expected = self.reader.get_iterator("a")
+        for _ in range(300):
+            self.assertEqual(next(iterator), next(expected))
+        block = iterator.read_block()
+        self.assertEqual(list(block), list(expected.read_block()))
+        self.assertEqual(len(block), 1700)
+        self.assertTrue(iterator.end)
+        self.assertEqual(list(iterator), [])
+
+    def test_capacity(self):
+        cache = PostingCache(1000 * posting_size(CACHE_POSTING), admit=1)
+        cache.get_iterator(self.reader, "a")
+        cache.get_iterator(self.reader, "b")
+        self.assertEqual(cache.cache.weight, 500 * posting_size(CACHE_POSTING))
+
+    def test_admission(self):
+        cache = PostingCache(2000 * posting_size(CACHE_POSTING))
+        for _ in range(3):
+            cache.get_iterator(self.reader, "b")
+        # a long list looked up twice does not evict the hot list
+        for _ in range(2):
+            cache.get_iterator(self.reader, "a")
+        self.assertIn(("cache.test", "b"), cache.cache)
+        self.assertNotIn(("cache.test", "a"), cache.cache)
+        for _ in range(3):
+            cache.get_iterator(self.reader, "a")
+        self.assertIn(("cache.test", "a"), cache.cache)
+        self.assertNotIn(("cache.test", "b"), cache.cache)
+
+    def test_warm(self):
+        cache = PostingCache(10000 * posting_size(CACHE_POSTING))
+        self.assertEqual(cache.warm(self.reader, ["a", "b", "a", "missing"]), 1)
+        self.assertIn(("cache.test", "a"), cache.cache)
+        self.assertEqual(cache.get_iterator(self.reader, "a").count, 2000)
+
+    def tearDown(self) -> None:
+        self.reader.close()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        for g in glob.glob("cache.test.*"):
+            os.remove(g)
+
+
+if __name__ == '__main__':
+    unittest.main()
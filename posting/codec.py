@@ -0,0 +1,185 @@
+import struct
+from typing import List, Sequence, Tuple, Type
+
+from .post import Posting
+
+MAGIC = b"PIDX"
+VERSION = 3
+
+# File header: magic and format version
+HEADER = struct.Struct("<4sB")
+# Key header: length of the utf-8 encoded key
+KEY_HEADER = struct.Struct("<H")
+# Block header: number of postings in the block, the size of the payload in bytes, the doc_id of the last posting and
+# the largest impact in the block. The last doc_id acts as a skip pointer: a reader can jump over the payload of blocks
+# that end before its target. A count of 0 ends a key.
+BLOCK_HEADER = struct.Struct("<HIIf")
+
+BLOCK_SIZE = 128
+
+
+def write_varint(out: bytearray, value: int):
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(buffer, position: int) -> Tuple[int, int]:
+    result = 0
+    shift = 0
+    while True:
+        byte = buffer[position]
+        position += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, position
+        shift += 7
+
+
+def zigzag(value: int) -> int:
+    return -2 * value - 1 if value < 0 else 2 * value
+
+
+def unzigzag(value: int) -> int:
+    return (value >> 1) ^ -(value & 1)
+
+
+def encode_int(out: bytearray, values: List[int]):
+    for value in values:
+        write_varint(out, zigzag(int(value)))
+
+
+def decode_int(buffer, position: int, count: int) -> Tuple[List[int], int]:
+    values = []
+    for _ in range(count):
+        value, position = read_varint(buffer, position)
+        values.append(unzigzag(value))
+    return values, position
+
+
+def encode_float(out: bytearray, values: List[float]):
+    out += struct.pack(f"<{len(values)}f", *values)
+
+
+def decode_float(buffer, position: int, count: int) -> Tuple[List[float], int]:
+    return list(struct.unpack_from(f"<{count}f", buffer, position)), position + 4 * count
+
+
+def encode_str(out: bytearray, values: List[str]):
+    for value in values:
+        encoded = value.encode('utf-8')
+        write_varint(out, len(encoded))
+        out += encoded
+
+
+def decode_str(buffer, position: int, count: int) -> Tuple[List[str], int]:
+    values = []
+    for _ in range(count):
+        length, position = read_varint(buffer, position)
+        values.append(str(buffer[position:position + length], 'utf-8'))
+        position += length
+    return values, position
+
+
+def encode_positions(out: bytearray, values: List[List[int]]):
+    """
+    Encode sorted position lists as the number of positions followed by the gaps between them.
+    """
+    for positions in values:
+        write_varint(out, len(positions))
+        previous = 0
+        for position in positions:
+            write_varint(out, position - previous)
+            previous = position
+
+
+def decode_positions(buffer, position: int, count: int) -> Tuple[List[List[int]], int]:
+    values = []
+    for _ in range(count):
+        length, position = read_varint(buffer, position)
+        positions = []
+        previous = 0
+        for _ in range(length):
+            gap, position = read_varint(buffer, position)
+            previous += gap
+            positions.append(previous)
+        values.append(positions)
+    return values, position
+
+
+COLUMNS = {
+    int: (encode_int, decode_int),
+    float: (encode_float, decode_float),
+    str: (encode_str, decode_str),
+    # the sorted positions of a term in a document
+    list: (encode_positions, decode_positions),
+}
+
+
+def get_column(kind: type):
+    if kind not in COLUMNS:
+        raise TypeError(f"Properties of type {kind.__name__} cannot be stored in a binary posting file")
+    return COLUMNS[kind]
+
+
+def encode_block(postings: List[Posting], previous: int) -> Tuple[bytes, int]:
+    """
+    Encode a block of postings. The doc_ids are stored as deltas from the previous doc_id, followed by one column per
+    property in the order of REVERSE_MAP.
+    :param postings: the postings to encode, all of the same type
+    :param previous: the doc_id of the last posting of the previous block in the same key or 0
+    :return: the payload and the doc_id of the last posting
+    """
+    columns = [[posting.properties[idx] for posting in postings] for idx in range(len(type(postings[0]).REVERSE_MAP))]
+    return encode_columns(type(postings[0]), [posting.doc_id for posting in postings], columns, previous)
+
+
+def encode_columns(posting: Type[Posting], doc_ids: Sequence[int], columns: List[Sequence],
+                   previous: int) -> Tuple[bytes, int]:
+    """
+    Encode a block of postings given column by column, as encode_block does.
+    :param columns: the values of each property in the order of REVERSE_MAP
+    """
+    out = bytearray()
+    for doc_id in doc_ids:
+        write_varint(out, zigzag(doc_id - previous))
+        previous = doc_id
+    for (_, kind), column in zip(posting.REVERSE_MAP, columns):
+        encode, _ = get_column(kind)
+        encode(out, column)
+    return bytes(out), previous
+
+
+def decode_block(posting: Type[Posting], buffer, count: int, previous: int) -> Tuple[List[Posting], int]:
+    """
+    Decode a block of postings written by encode_block.
+    :param posting: the posting type to construct
+    :param buffer: the payload of the block
+    :param count: the number of postings in the block
+    :param previous: the doc_id of the last posting of the previous block in the same key or 0
+    :return: the postings and the doc_id of the last posting
+    """
+    doc_ids, columns, previous = decode_columns(posting, buffer, count, previous)
+    if columns:
+        return [posting(doc_id, list(properties)) for doc_id, properties in zip(doc_ids, zip(*columns))], previous
+    return [posting(doc_id) for doc_id in doc_ids], previous
+
+
+def decode_columns(posting: Type[Posting], buffer, count: int, previous: int) -> Tuple[List[int], List[List], int]:
+    """
+    Decode a block of postings written by encode_block column by column, without creating postings.
+    :return: the doc_ids, the values of each property in the order of REVERSE_MAP and the doc_id of the last posting
+    """
+    doc_ids = []
+    position = 0
+    for _ in range(count):
+        delta, position = read_varint(buffer, position)
+        previous += unzigzag(delta)
+        doc_ids.append(previous)
+    columns = []
+    for _, kind in posting.REVERSE_MAP:
+        _, decode = get_column(kind)
+        column, position = decode(buffer, position, count)
+        columns.append(column)
+    return doc_ids, columns, previous
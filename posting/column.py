@@ -0,0 +1,173 @@
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, List, Tuple, Type
+
+import numpy as np
+
+from .io import PostingIterator, PostingReader
+from .post import Posting
+
+DTYPES = {int: np.int32, float: np.float32}
+
+
+def ranges(starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """
+    Concatenate np.arange(start, start + length) for each start and length without a Python loop.
+    """
+    total = int(lengths.sum())
+    offsets = np.cumsum(lengths) - lengths
+    return np.arange(total) - np.repeat(offsets - starts, lengths)
+
+
+def unzigzag(values: np.ndarray) -> np.ndarray:
+    return (values >> 1) ^ -(values & 1)
+
+
+def decode_blocks(posting: Type[Posting], blocks: List[Tuple[int, Any, int]]) -> Tuple[np.ndarray, List[np.ndarray]]:
+    """
+    Decode consecutive blocks of a key, as returned by PostingIterator.next_block, straight into arrays. The blocks
+    are decoded together so the number of array operations does not grow with the number of blocks.
+    :return: the doc_ids and one array per property in the order of REVERSE_MAP
+    """
+    counts = np.array([count for count, _, _ in blocks], dtype=np.int64)
+    sizes = np.array([len(payload) for _, payload, _ in blocks], dtype=np.int64)
+    buffer = np.frombuffer(b"".join(payload for _, payload, _ in blocks), dtype=np.uint8)
+    terminators = np.flatnonzero(buffer < 0x80)
+    position = np.cumsum(sizes) - sizes
+
+    # the doc_id deltas are followed by the columns. Adjacent integer columns form a single run of varints.
+    runs = []
+    for kind in [int] + [kind for _, kind in posting.REVERSE_MAP]:
+        if kind is int and runs and runs[-1][0] is int:
+            runs[-1][1] += 1
+        elif kind in DTYPES:
+            runs.append([kind, 1])
+        else:
+            raise TypeError(f"Properties of type {kind.__name__} cannot be loaded into columns")
+
+    columns = []
+    for kind, width in runs:
+        if kind is float:
+            for _ in range(width):
+                index = ranges(position, 4 * counts)
+                columns.append(buffer[index].view('<f4'))
+                position = position + 4 * counts
+            continue
+        # find the terminating byte of every varint in the run of each block
+        lengths = width * counts
+        block_offsets = np.cumsum(lengths) - lengths
+        ends = terminators[ranges(np.searchsorted(terminators, position), lengths)]
+        starts = np.empty_like(ends)
+        starts[1:] = ends[:-1] + 1
+        starts[block_offsets] = position
+        if len(ends) == 0 or np.array_equal(starts, ends):
+            # every varint is a single byte
+            values = buffer[ends].astype(np.int64)
+        else:
+            widths = ends - starts + 1
+            offsets = np.cumsum(widths) - widths
+            index = ranges(starts, widths)
+            shifts = 7 * (np.arange(len(index)) - np.repeat(offsets, widths))
+            values = np.add.reduceat((buffer[index] & 0x7f).astype(np.int64) << shifts, offsets)
+        values = unzigzag(values)
+        for column in range(width):
+            columns.append(values[ranges(block_offsets + column * counts, counts)])
+        position = ends[block_offsets + lengths - 1] + 1
+
+    # the deltas of each block start from the last doc_id of the block before it, which may not have been decoded
+    deltas = columns[0]
+    total = np.cumsum(deltas)
+    first = np.cumsum(counts) - counts
+    previous = np.array([previous for _, _, previous in blocks], dtype=np.int64)
+    doc_ids = total + np.repeat(previous - (total[first] - deltas[first]), counts)
+    return doc_ids, columns[1:]
+
+
+class PostingColumns:
+    """
+    A posting list held as parallel arrays: doc_ids and one array per property.
+    """
+
+    def __init__(self, doc_ids: np.ndarray, columns: Dict[str, np.ndarray]):
+        self.doc_ids = doc_ids
+        self.columns = columns
+
+    @classmethod
+    def read(cls, iterator: PostingIterator, candidates: List[int] = None) -> "PostingColumns":
+        """
+        Load the remaining postings of an iterator without creating Posting objects.
+        :param candidates: sorted doc_ids. If given, blocks that cannot contain any of them are not decoded.
+        """
+        posting = iterator.posting
+        blocks = []
+        block = iterator.next_block()
+        while block is not None:
+            if candidates is None or bisect_left(candidates, block[2]) < bisect_right(candidates, iterator.last_doc_id):
+                blocks.append(block)
+            block = iterator.next_block()
+        if not blocks:
+            return cls(np.zeros(0, dtype=np.int32),
+                       {key: np.zeros(0, dtype=DTYPES[kind]) for key, kind in posting.REVERSE_MAP})
+        doc_ids, columns = decode_blocks(posting, blocks)
+        return cls(doc_ids.astype(np.int32),
+                   {key: column.astype(DTYPES[kind]) for (key, kind), column in zip(posting.REVERSE_MAP, columns)})
+
+    @classmethod
+    def from_reader(cls, reader: PostingReader, key: str) -> "PostingColumns":
+        return cls.read(reader.get_iterator(key))
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def __getitem__(self, key: str) -> np.ndarray:
+        return self.columns[key]
+
+    def take(self, index: np.ndarray) -> "PostingColumns":
+        return PostingColumns(self.doc_ids[index], {key: column[index] for key, column in self.columns.items()})
+
+
+def intersect_columns(*postings: PostingColumns) -> Tuple[np.ndarray, List[np.ndarray]]:
+    """
+    Intersect posting lists by doc_id. The doc_ids of each list must be sorted and unique. The shortest list is binary
+    searched in each of the others, so the cost grows with the length of the shortest list.
+    :return: the common doc_ids and, for each list, the index of each common doc_id in that list
+    """
+    if not postings:
+        return np.zeros(0, dtype=np.int32), []
+    doc_ids = min(postings, key=len).doc_ids
+    for posting in sorted(postings, key=len):
+        index = np.searchsorted(posting.doc_ids, doc_ids)
+        found = index < len(posting)
+        found[found] = posting.doc_ids[index[found]] == doc_ids[found]
+        doc_ids = doc_ids[found]
+    return doc_ids, [np.searchsorted(posting.doc_ids, doc_ids) for posting in postings]
+
+
+def read_intersecting(reader: PostingReader, keys: List[str]) -> List[PostingColumns]:
+    """
+    Load the posting lists of keys for intersect_columns. Lists are read from the shortest and each later list only
+    decodes the blocks that can hold a doc_id common to the lists read before it.
+    :return: the lists in the order of keys
+    """
+    postings: List[PostingColumns] = [None] * len(keys)
+    common = None
+    for i in sorted(range(len(keys)), key=lambda idx: reader.count(keys[idx])):
+        postings[i] = PostingColumns.read(reader.get_iterator(keys[i]), common.tolist() if common is not None else None)
+        if common is None:
+            common = postings[i].doc_ids
+        else:
+            common = intersect_columns(PostingColumns(common, {}), postings[i])[0]
+    return postings
+
+
+def top_k(doc_ids: np.ndarray, scores: np.ndarray, limit: int) -> List[Tuple[int, float]]:
+    """
+    Select the limit highest scores with argpartition and return them as (doc_id, score) in descending order.
+    """
+    if limit <= 0:
+        return []
+    if len(scores) > limit:
+        index = np.argpartition(-scores, limit - 1)[:limit]
+    else:
+        index = np.arange(len(scores))
+    index = index[np.argsort(-scores[index], kind='stable')]
+    return list(zip(doc_ids[index].tolist(), scores[index].tolist()))
@@ -0,0 +1,63 @@
+import glob
+import os
+import unittest
+
+import numpy as np
+
+from .column import PostingColumns, intersect_columns, read_intersecting, top_k
+from .io import PostingReader, PostingWriter
+from .post import create_posting_type
+
+COLUMN_POSTING = create_posting_type("column_type", {"count": int, "tf": float, "tf_idf": float})
+
+
+class ColumnTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        writer = PostingWriter("column.test")
+        writer.write_key("common")
+        writer.write(*[COLUMN_POSTING(i * 2, [i * 1000, i / 8, i / 4]) for i in range(1000)])
+        writer.write_key("rare")
+        writer.write_posting(COLUMN_POSTING(0, [1, 0.5, 0.25]))
+        writer.write_posting(COLUMN_POSTING(1500, [2, 1.0, 0.75]))
+        writer.write_posting(COLUMN_POSTING(1501, [3, 1.5, 1.25]))
+        writer.flush()
+        writer.close()
+
+    def setUp(self) -> None:
+        self.reader = PostingReader("column.test", COLUMN_POSTING, memory_map=True)
+
+    def test_read(self):
+        columns = PostingColumns.from_reader(self.reader, "common")
+        postings = list(self.reader.get_iterator("common"))
+        self.assertEqual(len(columns), 1000)
+        self.assertEqual(columns.doc_ids.tolist(), [posting.doc_id for posting in postings])
+        self.assertEqual(columns["count"].tolist(), [posting.get_property("count") for posting in postings])
+        self.assertEqual(columns["tf_idf"].tolist(), [posting.get_property("tf_idf") for posting in postings])
+        self.assertEqual(columns["count"].dtype, np.int32)
+        self.assertEqual(columns["tf"].dtype, np.float32)
+
+    def test_intersect(self):
+        common, rare = read_intersecting(self.reader, ["common", "rare"])
+        doc_ids, index = intersect_columns(common, rare)
+        self.assertEqual(doc_ids.tolist(), [0, 1500])
+        self.assertEqual(common["count"][index[0]].tolist(), [0, 750000])
+        self.assertEqual(rare["count"][index[1]].tolist(), [1, 2])
+        self.assertLess(len(common), 1000)
+
+    def test_top_k(self):
+        result = top_k(np.array([4, 5, 6, 7]), np.array([0.1, 0.9, 0.5, 0.7]), 2)
+        self.assertEqual(result, [(5, 0.9), (7, 0.7)])
+        self.assertEqual(len(top_k(np.array([4]), np.array([0.1]), 10)), 1)
+
+    def tearDown(self) -> None:
+        self.reader.close()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        for g in glob.glob("column.test.*"):
+            os.remove(g)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,35 +1,96 @@
 from .io import PostingWriter
-from collections import defaultdict
-from typing import Dict, List
-from .post import Posting
+from array import array
+from threading import Thread
+from typing import Dict, Optional, Type
+from .post import Posting, PostingBlock
 import os
+import sys
+
+# the number of bytes of buffered postings at which a PostingDictionary writes a partial
+SPILL_BUDGET = 64 << 20
 
 
 class PostingDictionary:
-    def __init__(self, name: str):
-        self.dictionary: Dict[str, List[Posting]] = defaultdict(list)
+    def __init__(self, name: str, prefix: str = "", budget: int = SPILL_BUDGET):
+        """
+        Buffer postings in memory and write them as sorted partials. A partial is written whenever the buffered
+        postings take more than budget bytes. Partials are written on a background thread while new postings are
+        buffered, so up to twice the budget may be used. Call close to wait for the last partial.
+        :param name: the directory of the index
+        :param prefix: prepended to the names of the partials, so several dictionaries can flush to one index
+        :param budget: the number of bytes of buffered postings at which a partial is written
+        """
+        self.dictionary: Dict[str, PostingBlock] = dict()
+        self.posting_type: Optional[Type[Posting]] = None
         self.counter = 0
         self.total_count = 0
+        # the estimated number of bytes taken by the buffered postings
+        self.size = 0
+        self.budget = budget
         self.name = name
+        self.prefix = prefix
+        self.writer: Optional[Thread] = None
+        self.error: Optional[BaseException] = None
 
     def add_posting(self, key: str, posting: Posting):
+        if self.posting_type is None:
+            self.posting_type = type(posting)
+        block = self.dictionary.get(key)
+        if block is None:
+            block = self.dictionary[key] = PostingBlock(self.posting_type)
+            self.size += sum(map(sys.getsizeof, [key, block, block.doc_ids, *block.columns]))
+        block.append(posting)
+        self.size += block.doc_ids.itemsize
+        for column, value in zip(block.columns, posting.properties):
+            self.size += column.itemsize if type(column) is array else sys.getsizeof(value) + 8
         self.total_count += 1
-        self.dictionary[key].append(posting)
+        if self.size >= self.budget:
+            self.flush()
 
     def __len__(self):
         return self.total_count
 
     def flush(self):
-        if not os.path.exists(f"{self.name}/partials"):
-            if not os.path.exists(f"{self.name}"):
-                os.mkdir(f"{self.name}")
-            os.mkdir(f"{self.name}/partials")
-        writer = PostingWriter(f"{self.name}/partials/{self.counter}")
-        for key in sorted(self.dictionary):
-            writer.write_key(key)
-            writer.write(*self.dictionary[key])
-        writer.flush()
-        writer.close()
-        self.dictionary.clear()
+        """
+        Write the buffered postings as a partial on a background thread. Waits for the previous partial first.
+        """
+        self.join()
+        if not self.dictionary:
+            return
+        os.makedirs(f"{self.name}/partials", exist_ok=True)
+        self.writer = Thread(target=self.__write__,
+                             args=(f"{self.name}/partials/{self.prefix}{self.counter}", self.dictionary))
+        self.writer.start()
+        self.dictionary = dict()
         self.counter += 1
         self.total_count = 0
+        self.size = 0
+
+    def __write__(self, file_name: str, dictionary: Dict[str, PostingBlock]):
+        try:
+            writer = PostingWriter(file_name)
+            for key in sorted(dictionary):
+                writer.write_key(key)
+                writer.write_postings(dictionary[key])
+            writer.flush()
+            writer.close()
+        except BaseException as e:
+            self.error = e
+
+    def join(self):
+        """
+        Wait for the partial being written, raising any error it failed with.
+        """
+        if self.writer is not None:
+            self.writer.join()
+            self.writer = None
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def close(self):
+        """
+        Write the remaining postings and wait for every partial to be written.
+        """
+        self.flush()
+        self.join()
@@ -0,0 +1,51 @@
+import glob
+import os
+import shutil
+import unittest
+
+from .dictionary import PostingDictionary
+from .io import PostingReader
+from .post import create_posting_type
+
+DICTIONARY_POSTING = create_posting_type("dictionary_type", {"count": int, "tf": float, "url": str})
+
+
+class PostingDictionaryTest(unittest.TestCase):
+    def test_flush(self):
+        dictionary = PostingDictionary("dictionary.test", prefix="a.")
+        dictionary.add_posting("b", DICTIONARY_POSTING(3, {"count": 2, "tf": 0.5, "url": "x"}))
+        dictionary.add_posting("a", DICTIONARY_POSTING(1, {"count": 1, "tf": 0.25, "url": "y"}))
+        dictionary.add_posting("b", DICTIONARY_POSTING(4, {"count": 7, "tf": 1.0, "url": "z"}))
+        self.assertEqual(len(dictionary), 3)
+        dictionary.close()
+        self.assertEqual(len(dictionary), 0)
+
+        reader = PostingReader("dictionary.test/partials/a.0", DICTIONARY_POSTING)
+        self.assertEqual(sorted(reader.keys.keys()), ["a", "b"])
+        postings = list(reader.get_iterator("b"))
+        self.assertEqual([posting.doc_id for posting in postings], [3, 4])
+        self.assertEqual([posting.properties for posting in postings], [[2, 0.5, "x"], [7, 1.0, "z"]])
+        reader.close()
+
+    def test_budget(self):
+        dictionary = PostingDictionary("dictionary.test", budget=4096)
+        for doc_id in range(1000):
+            dictionary.add_posting(str(doc_id % 13), DICTIONARY_POSTING(doc_id, [1, 0.5, "u"]))
+        self.assertLess(dictionary.size, 4096)
+        dictionary.close()
+        partials = sorted(file[:-len(".index")] for file in glob.glob("dictionary.test/partials/*.index"))
+        self.assertGreater(len(partials), 1)
+        doc_ids = []
+        for partial in partials:
+            reader = PostingReader(partial, DICTIONARY_POSTING)
+            doc_ids.extend(posting.doc_id for key in reader.keys.keys() for posting in reader.get_iterator(key))
+            reader.close()
+        self.assertEqual(sorted(doc_ids), list(range(1000)))
+
+    def tearDown(self) -> None:
+        if os.path.exists("dictionary.test"):
+            shutil.rmtree("dictionary.test")
+
+
+if __name__ == '__main__':
+    unittest.main()
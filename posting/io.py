@@ -1,29 +1,44 @@
+import heapq
+import math
+import mmap
+import os
 from collections import defaultdict
+from operator import attrgetter
 from threading import RLock
-from typing import Iterator
+from typing import Any, Iterator, List, Optional, Tuple
 from typing import Type, IO
 
-from .post import Posting, IntersectPosting
+from .codec import (MAGIC, VERSION, HEADER, KEY_HEADER, BLOCK_HEADER, BLOCK_SIZE, encode_block, decode_block,
+                    encode_columns, decode_columns)
+from .post import Posting, IntersectPosting, PostingBlock
+from .terms import TermTable, write_term_table
 
-TOKENS = {'\n', '\t', '\v', '\f'}
+# the largest number of files merged at a time by merge_tree and the read buffer of each file being merged
+MERGE_FAN_IN = 64
+MERGE_BUFFER = 1 << 20
 
 
 class PostingWriter:
     """
     PostingWriter enables you to write postings to a file and keep track of their indexes. Do not write to the file
-    the same key multiple times.
+    the same key multiple times. Postings are written in the binary block format described in posting.codec.
     """
 
-    def __init__(self, file_name: str):
+    def __init__(self, file_name: str, buffering: int = -1):
         """
         Initialize the writer pointed at the file name. This will be opened with w+ permissions so ensure that the file
         is unique or disposable.
         :param file_name: the base name of the file.
+        :param buffering: the write buffer size in bytes, as for open
         """
-        self.open = open(f"{file_name}.index", 'w+')
-        self.index = open(f"{file_name}.index.position", 'w+')
-        self.keys = defaultdict(lambda: list([0, 0]))
+        self.file_name = file_name
+        self.open = open(f"{file_name}.index", 'w+b', buffering=buffering)
+        self.index = open(f"{file_name}.index.position", 'w+b')
+        self.keys = defaultdict(lambda: list([0, 0, 0.0]))
         self.curr_key = None
+        self.pending: List[Posting] = []
+        self.last_doc_id = 0
+        self.open.write(HEADER.pack(MAGIC, VERSION))
 
     def write_key(self, key: str):
         """
@@ -31,120 +46,280 @@ class PostingWriter:
         :param key:
         :return:
         """
+        self.end_key()
         self.curr_key = key
-        if len(self.keys) > 0:
-            self.open.write('\n')
         self.keys[key][0] = self.open.tell()
-        self.open.write(f"{key}")
+        encoded = key.encode('utf-8')
+        self.open.write(KEY_HEADER.pack(len(encoded)))
+        self.open.write(encoded)
+
+    def write_block(self):
+        if not self.pending:
+            return
+        payload, self.last_doc_id = encode_block(self.pending, self.last_doc_id)
+        impact = type(self.pending[0]).IMPACT
+        if impact:
+            index = type(self.pending[0]).INDEX[impact]
+            block_max = max(posting.properties[index] for posting in self.pending)
+        else:
+            block_max = 0.0
+        self.keys[self.curr_key][2] = max(self.keys[self.curr_key][2], block_max)
+        self.open.write(BLOCK_HEADER.pack(len(self.pending), len(payload), self.last_doc_id, block_max))
+        self.open.write(payload)
+        self.pending.clear()
+
+    def end_key(self):
+        if self.curr_key is None:
+            return
+        self.write_block()
+        self.open.write(BLOCK_HEADER.pack(0, 0, 0, 0.0))
+        self.curr_key = None
+        self.last_doc_id = 0
 
     def write_posting(self, posting: Posting):
         self.keys[self.curr_key][1] += 1
-        self.open.write(f"\f{str(posting)}")
+        self.pending.append(posting)
+        if len(self.pending) >= BLOCK_SIZE:
+            self.write_block()
 
     def write(self, *postings: Posting):
-        partition = "\f"
-        partition += "\f".join([str(posting) for posting in postings])
-        self.keys[self.curr_key][1] += len(postings)
-        self.open.write(partition)
+        for posting in postings:
+            self.write_posting(posting)
+
+    def write_postings(self, block: PostingBlock):
+        """
+        Write a block of postings straight from its columns, without creating a Posting for each of them.
+        """
+        self.write_block()
+        impact = block.posting.IMPACT
+        impacts = block.column(impact) if impact else None
+        self.keys[self.curr_key][1] += len(block)
+        for start in range(0, len(block), BLOCK_SIZE):
+            end = min(start + BLOCK_SIZE, len(block))
+            payload, self.last_doc_id = encode_columns(block.posting, block.doc_ids[start:end],
+                                                       [column[start:end] for column in block.columns],
+                                                       self.last_doc_id)
+            block_max = max(impacts[start:end]) if impact else 0.0
+            self.keys[self.curr_key][2] = max(self.keys[self.curr_key][2], block_max)
+            self.open.write(BLOCK_HEADER.pack(end - start, len(payload), self.last_doc_id, block_max))
+            self.open.write(payload)
 
     def flush(self):
+        self.write_block()
         self.open.flush()
 
     def close(self):
-        for key in sorted(self.keys):
-            self.index.write(f"{key}\t{self.keys[key][0]}\t{self.keys[key][1]}\n")
+        if self.open.closed:
+            return
+        self.end_key()
+        write_term_table(self.index, self.keys)
         self.keys.clear()
         self.index.close()
         self.open.close()
 
 
 class PostingIterator:
-    BUFFER_SIZE = 16384
-
     def __init__(self, lock: RLock, file: IO, posting: Type[Posting]):
         self.lock = lock
 
         self.file = file
         self.posting = posting
 
-        self.posting_buffer = []
-
-        self.buffer = file.readline(PostingIterator.BUFFER_SIZE)
+        self.posting_buffer: List[Posting] = []
+        self.offset = 0
+        self.last_doc_id = 0
+        # the largest impact of the last block read
+        self.block_max = 0.0
+        # the number of postings under the key, filled in by the reader
+        self.count: Optional[int] = None
 
+        with self.lock:
+            length, = KEY_HEADER.unpack(file.read(KEY_HEADER.size))
+            self.current = file.read(length).decode('utf-8')
+            self.position = file.tell()
         self.end = False
+
+    def __header__(self) -> Tuple[int, int, int, float]:
         with self.lock:
-            buffer = self.buffer
-            while '\f' not in buffer and not buffer.endswith('\n') and not self.end:
-                buffer = self.file.readline(PostingIterator.BUFFER_SIZE)
-                if buffer.endswith('\n'):
-                    self.end = True
-                self.buffer += buffer
-            if self.buffer.endswith('\n'):
-                self.buffer = self.buffer.rstrip('\n')
-                self.end = True
-        self.position = file.tell()
+            self.file.seek(self.position)
+            return BLOCK_HEADER.unpack(self.file.read(BLOCK_HEADER.size))
 
-        parsed = self.buffer.split('\f')
-        self.current = parsed[0]
-        parsed = parsed[1:]
-        if self.end:
-            self.posting_buffer.extend([self.posting.parse(segment) for segment in parsed])
-        else:
-            self.buffer = parsed[-1]
-            parsed = parsed[:-1]
-            self.posting_buffer.extend([self.posting.parse(segment) for segment in parsed])
+    def __payload__(self, size: int):
+        with self.lock:
+            self.file.seek(self.position + BLOCK_HEADER.size)
+            return self.file.read(size)
 
     def __read__(self):
-        with self.lock:
-            buffer = self.buffer
-            self.file.seek(self.position)
-            while '\f' not in buffer and not buffer.endswith('\n') and not self.end:
-                buffer = self.file.readline(8096)
-                if buffer.endswith('\n') or len(buffer) == 0:
-                    self.end = True
-                self.buffer += buffer
-
-            self.position = self.file.tell()
-            if self.buffer.endswith('\n'):
-                self.buffer = self.buffer.rstrip('\n')
+        block = self.next_block()
+        if block is None:
+            return
+        count, payload, previous = block
+        self.posting_buffer, _ = decode_block(self.posting, payload, count, previous)
+        self.offset = 0
+
+    def next_block(self) -> Optional[Tuple[int, Any, int]]:
+        """
+        Read the next block without decoding it, for callers that decode blocks themselves. Postings that were already
+        decoded by next() or advance_to are not part of the block.
+        :return: the number of postings, the payload and the doc_id the block's deltas start from, or None at the end
+        """
+        count, size, last, self.block_max = self.__header__()
+        if count == 0:
+            self.end = True
+            return None
+        payload = self.__payload__(size)
+        self.position += BLOCK_HEADER.size + size
+        previous, self.last_doc_id = self.last_doc_id, last
+        return count, payload, previous
+
+    def __skip__(self, doc_id: int):
+        """
+        Jump over the blocks that end before doc_id without decoding them.
+        """
+        while not self.end:
+            count, size, last, _ = self.__header__()
+            if count == 0:
                 self.end = True
-            if not self.buffer:
                 return
-            parsed = self.buffer.split('\f')
-            if self.end:
-                self.posting_buffer.extend([self.posting.parse(segment) for segment in parsed])
-            else:
-                self.buffer = parsed[-1]
-                parsed = parsed[:-1]
-                self.posting_buffer.extend([self.posting.parse(segment) for segment in parsed])
+            if last >= doc_id:
+                return
+            self.position += BLOCK_HEADER.size + size
+            self.last_doc_id = last
 
     def current_key(self):
         return self.current
 
+    def read_block(self) -> PostingBlock:
+        """
+        Read the remaining postings into a PostingBlock, decoding each block column by column.
+        """
+        block = PostingBlock.from_postings(self.posting, self.posting_buffer[self.offset:])
+        self.posting_buffer = []
+        self.offset = 0
+        while not self.end:
+            read = self.next_block()
+            if read is None:
+                break
+            count, payload, previous = read
+            doc_ids, columns, _ = decode_columns(self.posting, payload, count, previous)
+            block.extend(doc_ids, columns)
+        return block
+
+    def block_bound(self, doc_id: int) -> Optional[Tuple[int, float]]:
+        """
+        Find the block that would hold doc_id without decoding it. Blocks that end before doc_id are skipped, so
+        postings before doc_id may no longer be returned afterwards.
+        :return: the last doc_id and the largest impact of the block, or None if no block holds doc_id
+        """
+        if self.posting_buffer and self.posting_buffer[-1].doc_id >= doc_id:
+            return self.posting_buffer[-1].doc_id, self.block_max
+        self.posting_buffer = []
+        self.offset = 0
+        self.__skip__(doc_id)
+        if self.end:
+            return None
+        _, _, last, block_max = self.__header__()
+        return last, block_max
+
+    def advance_to(self, doc_id: int) -> Optional[Posting]:
+        """
+        Move to the first posting with a doc_id of at least doc_id. Whole blocks are skipped through their headers and
+        the decoded block is searched by galloping, so this requires the postings to be in doc_id order.
+        :param doc_id: the doc_id to advance to
+        :return: the posting, consumed as if it was returned by next(), or None if there are no more postings
+        """
+        if self.offset >= len(self.posting_buffer) or self.posting_buffer[-1].doc_id < doc_id:
+            self.posting_buffer = []
+            self.offset = 0
+            self.__skip__(doc_id)
+            if self.end:
+                return None
+            self.__read__()
+            if not self.posting_buffer:
+                return None
+        buffer = self.posting_buffer
+        low = high = self.offset
+        step = 1
+        while buffer[high].doc_id < doc_id:
+            low = high + 1
+            high = min(high + step, len(buffer) - 1)
+            step *= 2
+        while low < high:
+            middle = (low + high) // 2
+            if buffer[middle].doc_id < doc_id:
+                low = middle + 1
+            else:
+                high = middle
+        self.offset = low + 1
+        return buffer[low]
+
     def __iter__(self):
         return self
 
     def __next__(self) -> Posting:
-        if self.posting_buffer:
-            return self.posting_buffer.pop(0)
-        if not self.end:
+        if self.offset >= len(self.posting_buffer) and not self.end:
             self.__read__()
-            if self.posting_buffer:
-                return self.posting_buffer.pop(0)
+        if self.offset < len(self.posting_buffer):
+            self.offset += 1
+            return self.posting_buffer[self.offset - 1]
         raise StopIteration
 
 
-class PostingReader:
-    def __init__(self, file_name: str, posting: Type[Posting]):
-        self.open = open(f"{file_name}.index", 'r')
-        self.index = open(f"{file_name}.index.position", 'r')
-        keys = dict()
-        for row in self.index:
-            s = row.split('\t')
-            keys[s[0]] = [int(s[1]), int(s[2])]
-        self.index.close()
+class MappedPostingIterator(PostingIterator):
+    """
+    A PostingIterator over a memory mapped posting file. Each iterator keeps its own offset into the mapping, so
+    iterators can be used concurrently without a lock, and blocks are decoded straight from the mapped memory.
+    """
+
+    def __init__(self, view: memoryview, position: int, posting: Type[Posting]):
+        self.view = view
+        self.posting = posting
 
-        self.keys = keys
+        self.posting_buffer: List[Posting] = []
+        self.offset = 0
+        self.last_doc_id = 0
+        self.block_max = 0.0
+        self.count: Optional[int] = None
+
+        length, = KEY_HEADER.unpack_from(view, position)
+        position += KEY_HEADER.size
+        self.current = str(view[position:position + length], 'utf-8')
+        self.position = position + length
+        self.end = False
+
+    def __header__(self) -> Tuple[int, int, int, float]:
+        return BLOCK_HEADER.unpack_from(self.view, self.position)
+
+    def __payload__(self, size: int):
+        start = self.position + BLOCK_HEADER.size
+        return self.view[start:start + size]
+
+
+class PostingReader:
+    def __init__(self, file_name: str, posting: Type[Posting], memory_map: bool = False):
+        """
+        Open a posting file for reading.
+        :param file_name: the base name of the file
+        :param posting: the posting type stored in the file
+        :param memory_map: map the posting file into memory instead of reading it through a shared file handle.
+        Iterators over a mapped file do not need to lock. The position table is always mapped, see TermTable.
+        """
+        self.file_name = file_name
+        self.open = open(f"{file_name}.index", 'rb')
+        magic, version = HEADER.unpack(self.open.read(HEADER.size))
+        if magic != MAGIC:
+            self.open.close()
+            raise ValueError(f"{file_name}.index is not a binary posting file. Convert it with posting.text.convert")
+        if version != VERSION:
+            self.open.close()
+            raise ValueError(f"{file_name}.index has format version {version} but version {VERSION} is required")
+
+        self.memory_map = memory_map
+        if memory_map:
+            self.map = mmap.mmap(self.open.fileno(), 0, access=mmap.ACCESS_READ)
+            self.view = memoryview(self.map)
+        self.keys = TermTable(f"{file_name}.index.position")
+        self.position = HEADER.size
 
         self.posting_type = posting
         self.read_lock = RLock()
@@ -155,108 +330,200 @@ class PostingReader:
     def count(self, key: str):
         return self.keys[key][1]
 
-    def get_iterator(self):
-        return PostingIterator(self.read_lock, self.open, self.posting_type)
+    def impact(self, key: str) -> float:
+        """
+        The largest impact of the postings of a key, for posting types that declare an impact property.
+        """
+        return self.keys[key][2]
+
+    def prefix(self, prefix: str) -> List[str]:
+        """
+        The keys starting with prefix in key order, for wildcard queries.
+        """
+        return [key for key, _ in self.keys.prefix(prefix)]
+
+    def get_iterator(self, key: str = None):
+        """
+        Create an iterator over the postings of a key.
+        :param key: the key to iterate over. If not given, the iterator starts at the last position passed to seek.
+        """
+        if self.memory_map:
+            iterator = MappedPostingIterator(self.view, self.keys[key][0] if key is not None else self.position,
+                                             self.posting_type)
+        else:
+            with self.read_lock:
+                if key is not None:
+                    self.seek(key)
+                iterator = PostingIterator(self.read_lock, self.open, self.posting_type)
+        iterator.count = self.count(iterator.current_key())
+        return iterator
 
     def seek(self, position: int or str):
-        if type(position) is int:
-            self.open.seek(position)
+        if type(position) is not int:
+            position = self.keys[position][0]
+        if self.memory_map:
+            self.position = position
         else:
-            self.open.seek(self.keys[position][0])
+            self.open.seek(position)
 
     def close(self):
+        if self.memory_map:
+            self.view.release()
+            self.map.close()
+        self.keys.close()
         self.open.close()
 
 
 def intersect(*postings: PostingIterator, limit=None) -> Iterator[IntersectPosting]:
+    """
+    Intersect postings by doc_id. The shortest list leads and the others gallop to each of its doc_ids with
+    advance_to, so the cost depends on the rarest key rather than the most common one. Missing keys may be passed as
+    None and are None in the resulting IntersectPostings.
+    """
     if len(postings) == 0:
         return []
 
-    final = []
-
-    postings = list(postings)
-    try:
-        heads = [next(posting) if posting else None for posting in postings]
-    except StopIteration:
+    order = sorted((i for i in range(len(postings)) if postings[i] is not None),
+                   key=lambda i: postings[i].count if postings[i].count is not None else math.inf)
+    if not order:
         return
+    lead, others = postings[order[0]], order[1:]
+    heads: List[Optional[Posting]] = [None] * len(postings)
 
-    running = True
+    head = next(lead, None)
+    if head is None:
+        return
+    target = head.doc_id
     counter = 0
-    while running:
-        maximum = max((head for head in heads if head))
-        all_equal = True
-        for i in range(len(heads)):
-            if heads[i] is None:
-                final.append(None)
-                continue
-            try:
-                while heads[i] is not None and heads[i] < maximum:
-                    heads[i] = next(postings[i])
-            except StopIteration:
-                return
-            if heads[i] != maximum:
-                all_equal = False
-            else:
-                final.append(heads[i])
-        if running and all_equal:
+    while True:
+        for i in others:
+            if heads[i] is None or heads[i].doc_id < target:
+                heads[i] = postings[i].advance_to(target)
+                if heads[i] is None:
+                    return
+            if heads[i].doc_id > target:
+                target = heads[i].doc_id
+                break
+        else:
+            heads[order[0]] = head
             counter += 1
-            yield IntersectPosting(*final)
-            try:
-                heads = [next(posting) for posting in postings]
-            except StopIteration:
+            yield IntersectPosting(*heads)
+            if limit and counter == limit:
                 return
-        final.clear()
-        if limit and counter == limit:
+            head = next(lead, None)
+            if head is None:
+                return
+            target = head.doc_id
+            continue
+        head = lead.advance_to(target)
+        if head is None:
             return
+        target = head.doc_id
+
+
+class MergeCursor:
+    """
+    Reads the keys of a posting file front to back for merge. The file is read through its own handle with a large
+    buffer, so a merge streams each file sequentially instead of seeking for every key.
+    """
+
+    def __init__(self, reader: PostingReader, buffering: int = MERGE_BUFFER):
+        self.posting_type = reader.posting_type
+        self.open = open(f"{reader.file_name}.index", 'rb', buffering=buffering)
+        self.lock = RLock()
+        # the position table is in key order
+        self.keys = [(key, value[0]) for key, value in reader.keys.items()]
+        self.index = 0
+
+    def current_key(self) -> Optional[str]:
+        return self.keys[self.index][0] if self.index < len(self.keys) else None
+
+    def get_iterator(self) -> PostingIterator:
+        """
+        Create an iterator over the postings of the current key and move to the next key.
+        """
+        _, position = self.keys[self.index]
+        self.index += 1
+        # files written in key order never seek here, and a seek within the buffer does not read again
+        if self.open.tell() != position:
+            self.open.seek(position)
+        return PostingIterator(self.lock, self.open, self.posting_type)
+
+    def close(self):
+        self.open.close()
 
 
 def merge(merged: PostingWriter, *files: PostingReader):
-    keys = [iter(sorted(file.keys.keys())) for file in files]
-    readers = [file for file in files]
-    heads = dict()
-
-    def update_heads(elements):
-        nonlocal keys
-        for idx in elements:
-            if idx in heads:
-                del heads[idx]
-            if not keys[idx]:
-                continue
-            try:
-                heads[idx] = (idx, next(keys[idx]))
-            except StopIteration:
-                keys[idx] = None
-
-    update_heads(range(len(keys)))
+    """
+    Merge posting files into merged in a single pass. The files are read sequentially and their current keys are kept
+    in a heap, so each key costs O(log files) rather than a scan of every file. The postings of a key are merged by
+    doc_id, also through a heap.
+    """
+    cursors = [MergeCursor(file) for file in files]
+    heads = [(cursor.current_key(), i) for i, cursor in enumerate(cursors) if cursor.current_key() is not None]
+    heapq.heapify(heads)
     while heads:
-        minimum = min(heads.values(), key=lambda x: x[1])[1]
-        minimum_keys = []
-        for i, head in heads.values():
-            if head == minimum:
-                minimum_keys.append(i)
+        minimum, i = heapq.heappop(heads)
+        minimum_cursors = [i]
+        while heads and heads[0][0] == minimum:
+            minimum_cursors.append(heapq.heappop(heads)[1])
         merged.write_key(minimum)
-        for i in minimum_keys:
-            readers[i].seek(minimum)
-        for posting in merge_postings(*[readers[i].get_iterator() for i in minimum_keys]):
+        for posting in merge_postings(*[cursors[i].get_iterator() for i in sorted(minimum_cursors)]):
             merged.write_posting(posting)
-        update_heads(minimum_keys)
-
-
-def merge_postings(*postings) -> Iterator[Posting]:
-    iterations = postings
-    current_heads = [next(it) for it in iterations]
-    running = True
-    while running:
-        running = False
-        try:
-            minimum = min(x for x in current_heads if x)
-        except ValueError:
-            return
-        for i, head in enumerate(current_heads):
-            if head and head == minimum:
-                yield head
-                try:
-                    current_heads[i] = next(iterations[i])
-                except StopIteration:
-                    current_heads[i] = None
-                running = True
+        for i in minimum_cursors:
+            key = cursors[i].current_key()
+            if key is not None:
+                heapq.heappush(heads, (key, i))
+    for cursor in cursors:
+        cursor.close()
+
+
+def merge_tree(destination: str, files: List[str], posting: Type[Posting], fan_in: int = MERGE_FAN_IN):
+    """
+    Merge posting files that may be too many to open at once. No more than fan_in files are merged at a time, which
+    bounds the open files and read buffers to fan_in. When there are more files, groups of fan_in are merged into
+    temporary files next to destination in passes until one pass can merge the rest.
+    :param destination: the base name of the merged file
+    :param files: the base names of the files to merge
+    :param fan_in: the largest number of files merged at a time, at least 2
+    """
+    if fan_in < 2:
+        raise ValueError("fan_in must be at least 2")
+    level = 0
+    while len(files) > fan_in:
+        merged_files = []
+        for group, start in enumerate(range(0, len(files), fan_in)):
+            name = f"{destination}.pass{level}.{group}"
+            _merge_files(name, files[start:start + fan_in], posting)
+            merged_files.append(name)
+        if level > 0:
+            _remove_files(files)
+        files = merged_files
+        level += 1
+    _merge_files(destination, files, posting)
+    if level > 0:
+        _remove_files(files)
+
+
+def _merge_files(destination: str, files: List[str], posting: Type[Posting]):
+    writer = PostingWriter(destination, buffering=MERGE_BUFFER)
+    readers = [PostingReader(file, posting) for file in files]
+    merge(writer, *readers)
+    writer.flush()
+    writer.close()
+    for reader in readers:
+        reader.close()
+
+
+def _remove_files(files: List[str]):
+    for file in files:
+        os.remove(f"{file}.index")
+        os.remove(f"{file}.index.position")
+
+
+def merge_postings(*postings: Iterator[Posting]) -> Iterator[Posting]:
+    """
+    Merge iterators of postings in doc_id order. Postings with the same doc_id are all returned, in the order of the
+    iterators.
+    """
+    return heapq.merge(*postings, key=attrgetter("doc_id"))
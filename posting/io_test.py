@@ -1,10 +1,12 @@
 import unittest
 import os
-from .io import PostingReader, PostingWriter, intersect, merge
-from .post import create_posting_type
+from .io import PostingReader, PostingWriter, intersect, merge, merge_tree
+from .post import PostingBlock, create_posting_type
+from .text import TextPostingWriter, convert
 import glob
 
 TEST_POSTING = create_posting_type("test_type", {"count": int, "property": int})
+FLOAT_POSTING = create_posting_type("float_type", {"count": int, "tf": float})
 
 
 class WritingTest(unittest.TestCase):
@@ -251,6 +253,34 @@ class MergeTest(unittest.TestCase):
         self.assertEqual(len(list(reader.get_iterator())), 2)
         reader.close()
 
+    def test_merge_tree(self):
+        self.writer.close()
+        merge_tree("merge.test.out", ["merge.test", "merge2.test", "merge3.test", "merge.test"], TEST_POSTING,
+                   fan_in=2)
+        reader = PostingReader("merge.test.out", TEST_POSTING)
+        self.assertEqual(sorted(reader.keys.keys()), ["hello a", "hello b", "hello c"])
+        self.assertEqual([posting.doc_id for posting in reader.get_iterator("hello a")], [2, 2, 3, 4, 4, 7])
+        self.assertEqual([posting.doc_id for posting in reader.get_iterator("hello b")],
+                         [2, 2, 3, 5, 5, 7, 7, 10, 11, 12])
+        self.assertEqual(reader.count("hello c"), 2)
+        reader.close()
+        # only the merged file is left behind
+        self.assertEqual(sorted(glob.glob("merge.test.out*")),
+                         ["merge.test.out.index", "merge.test.out.index.position"])
+
+    def test_merge_blocks(self):
+        self.writer.close()
+        for i in range(3):
+            writer = PostingWriter(f"merge.test.block{i}")
+            writer.write_key("key")
+            writer.write(*[TEST_POSTING(doc, [doc, i]) for doc in range(i, 1000, 3)])
+            writer.flush()
+            writer.close()
+        merge_tree("merge.test.out", [f"merge.test.block{i}" for i in range(3)], TEST_POSTING, fan_in=2)
+        reader = PostingReader("merge.test.out", TEST_POSTING)
+        self.assertEqual([posting.doc_id for posting in reader.get_iterator("key")], list(range(1000)))
+        reader.close()
+
     def tearDown(self) -> None:
         self.writer.close()
         self.reader.close()
@@ -265,5 +295,226 @@ class MergeTest(unittest.TestCase):
             os.remove(g)
 
 
+class BinaryFormatTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        writer = PostingWriter("binary.test")
+        writer.write_key("long")
+        writer.write(*[FLOAT_POSTING(i * 3, [i, i / 4]) for i in range(1000)])
+        writer.write_key("short")
+        writer.write_posting(FLOAT_POSTING(5, [-2, 0.5]))
+        writer.flush()
+        writer.close()
+
+    def setUp(self) -> None:
+        self.reader = PostingReader("binary.test", FLOAT_POSTING)
+
+    def test_blocks(self):
+        self.assertEqual(self.reader.count("long"), 1000)
+        self.reader.seek("long")
+        iterator = self.reader.get_iterator()
+        self.assertEqual(iterator.current_key(), "long")
+        elements = list(iterator)
+        self.assertEqual([element.doc_id for element in elements], [i * 3 for i in range(1000)])
+        self.assertEqual(elements[999].get_property("count"), 999)
+        self.assertAlmostEqual(elements[998].get_property("tf"), 998 / 4)
+
+    def test_negative(self):
+        self.reader.seek("short")
+        elements = list(self.reader.get_iterator())
+        self.assertEqual(len(elements), 1)
+        self.assertEqual(elements[0].get_property("count"), -2)
+        self.assertEqual(elements[0].get_property("tf"), 0.5)
+
+    def test_text_rejected(self):
+        writer = TextPostingWriter("text.test")
+        writer.write_key("hello")
+        writer.write_posting(FLOAT_POSTING(1, [1, 0.5]))
+        writer.close()
+        self.assertRaises(ValueError, PostingReader, "text.test", FLOAT_POSTING)
+
+    def tearDown(self) -> None:
+        self.reader.close()
+        for g in glob.glob("text.test.*"):
+            os.remove(g)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        for g in glob.glob("binary.test.*"):
+            os.remove(g)
+
+
+class MappedReaderTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        writer = PostingWriter("mapped.test")
+        writer.write_key("common")
+        writer.write(*[FLOAT_POSTING(i, [i, i / 2]) for i in range(500)])
+        writer.write_key("rare")
+        writer.write_posting(FLOAT_POSTING(7, [1, 0.5]))
+        writer.write_key("\u00e9t\u00e9")
+        writer.write_posting(FLOAT_POSTING(3, [2, 1.0]))
+        writer.flush()
+        writer.close()
+
+    def setUp(self) -> None:
+        self.reader = PostingReader("mapped.test", FLOAT_POSTING, memory_map=True)
+
+    def test_keys(self):
+        self.assertEqual(len(self.reader.keys), 3)
+        self.assertEqual(list(self.reader.keys.keys()), sorted(["common", "rare", "\u00e9t\u00e9"]))
+        self.assertIn("rare", self.reader)
+        self.assertNotIn("missing", self.reader)
+        self.assertNotIn("comm", self.reader)
+        self.assertEqual(self.reader.count("common"), 500)
+        self.assertEqual(self.reader.count("\u00e9t\u00e9"), 1)
+
+    def test_independent_iterators(self):
+        first = self.reader.get_iterator("common")
+        second = self.reader.get_iterator("common")
+        self.assertEqual(next(first).doc_id, 0)
+        self.assertEqual(next(first).doc_id, 1)
+        self.assertEqual(next(second).doc_id, 0)
+        self.assertEqual(len(list(first)), 498)
+        self.assertEqual(list(second)[-1].get_property("tf"), 249.5)
+
+    def test_seek(self):
+        self.reader.seek("rare")
+        elements = list(self.reader.get_iterator())
+        self.assertEqual(len(elements), 1)
+        self.assertEqual(elements[0].doc_id, 7)
+
+    def tearDown(self) -> None:
+        self.reader.close()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        for g in glob.glob("mapped.test.*"):
+            os.remove(g)
+
+
+class SkipTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        writer = PostingWriter("skip.test")
+        writer.write_key("common")
+        writer.write(*[TEST_POSTING(i, [i, 0]) for i in range(0, 5000, 2)])
+        writer.write_key("rare")
+        writer.write_posting(TEST_POSTING(10, [1, 1]))
+        writer.write_posting(TEST_POSTING(3001, [2, 1]))
+        writer.write_posting(TEST_POSTING(4000, [3, 1]))
+        writer.flush()
+        writer.close()
+
+    def setUp(self) -> None:
+        self.reader = PostingReader("skip.test", TEST_POSTING, memory_map=True)
+
+    def test_advance(self):
+        iterator = self.reader.get_iterator("common")
+        self.assertEqual(iterator.advance_to(7).doc_id, 8)
+        self.assertEqual(iterator.advance_to(8).doc_id, 10)
+        self.assertEqual(iterator.advance_to(3001).doc_id, 3002)
+        self.assertEqual(next(iterator).doc_id, 3004)
+        self.assertEqual(iterator.advance_to(4998).doc_id, 4998)
+        self.assertIsNone(iterator.advance_to(5000))
+
+    def test_advance_locked(self):
+        reader = PostingReader("skip.test", TEST_POSTING)
+        iterator = reader.get_iterator("common")
+        self.assertEqual(iterator.advance_to(2561).doc_id, 2562)
+        self.assertEqual(next(iterator).get_property("count"), 2564)
+        reader.close()
+
+    def test_intersect(self):
+        postings = list(intersect(self.reader.get_iterator("common"), self.reader.get_iterator("rare")))
+        self.assertEqual([posting.doc_id for posting in postings], [10, 4000])
+        self.assertEqual(postings[1].get_properties("count"), [4000, 3])
+
+    def test_intersect_missing(self):
+        postings = list(intersect(None, self.reader.get_iterator("rare")))
+        self.assertEqual(len(postings), 3)
+        self.assertIsNone(postings[0].postings[0])
+
+    def tearDown(self) -> None:
+        self.reader.close()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        for g in glob.glob("skip.test.*"):
+            os.remove(g)
+
+
+class ConvertTest(unittest.TestCase):
+    def setUp(self) -> None:
+        writer = TextPostingWriter("convert.test")
+        writer.write_key("hello a")
+        writer.write_posting(FLOAT_POSTING(2, [2, 0.25]))
+        writer.write_posting(FLOAT_POSTING(4, [1, 0.75]))
+        writer.write_key("hello b")
+        writer.write_posting(FLOAT_POSTING(3, [5, 1.5]))
+        writer.flush()
+        writer.close()
+
+    def test_convert(self):
+        convert("convert.test", FLOAT_POSTING)
+        reader = PostingReader("convert.test", FLOAT_POSTING)
+        self.assertEqual(reader.count("hello a"), 2)
+        reader.seek("hello a")
+        elements = list(reader.get_iterator())
+        self.assertEqual([element.doc_id for element in elements], [2, 4])
+        self.assertEqual(elements[1].get_property("tf"), 0.75)
+        reader.seek("hello b")
+        self.assertEqual(list(reader.get_iterator())[0].get_property("count"), 5)
+        reader.close()
+
+    def tearDown(self) -> None:
+        for g in glob.glob("convert.test.*"):
+            os.remove(g)
+
+
+class PostingTest(unittest.TestCase):
+    def test_compare(self):
+        self.assertEqual(TEST_POSTING(1, [2, 3]), TEST_POSTING(1, [4, 5]))
+        self.assertLess(TEST_POSTING(1, [2, 3]), FLOAT_POSTING(2, [1, 0.5]))
+        # postings only compare with postings
+        self.assertNotEqual(TEST_POSTING(1, [2, 3]), 1)
+        self.assertNotEqual(TEST_POSTING(1, [2, 3]), None)
+        with self.assertRaises(TypeError):
+            TEST_POSTING(1, [2, 3]) < 2
+
+
+class PostingBlockTest(unittest.TestCase):
+    def test_accessors(self):
+        posting = FLOAT_POSTING(3, [2, 0.5])
+        self.assertEqual((posting.count, posting.tf), (2, 0.5))
+        posting.tf = 0.25
+        self.assertEqual(posting.get_property("tf"), 0.25)
+        self.assertFalse(hasattr(posting, "__dict__"))
+
+    def test_round_trip(self):
+        block = PostingBlock(FLOAT_POSTING, range(0, 600, 2), [range(300), [i / 4 for i in range(300)]])
+        writer = PostingWriter("block.test")
+        writer.write_key("a")
+        writer.write_postings(block)
+        writer.write_posting(FLOAT_POSTING(1000, [7, 0.5]))
+        writer.close()
+
+        reader = PostingReader("block.test", FLOAT_POSTING)
+        self.assertEqual(reader.count("a"), 301)
+        iterator = reader.get_iterator("a")
+        self.assertEqual(iterator.advance_to(297).doc_id, 298)
+        rest = iterator.read_block()
+        self.assertEqual(len(rest), 301 - 150)
+        self.assertEqual(rest.doc_ids[0], 300)
+        self.assertEqual(rest[-1].count, 7)
+        self.assertEqual(list(rest.column("tf"))[:2], [37.5, 37.75])
+        self.assertEqual([posting.doc_id for posting in rest.take([2, 0])], [304, 300])
+        reader.close()
+
+    def tearDown(self) -> None:
+        for g in glob.glob("block.test.*"):
+            os.remove(g)
+
+
 if __name__ == '__main__':
     unittest.main()
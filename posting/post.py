@@ -1,4 +1,9 @@
-from typing import List, Dict, Tuple, Any, Type
+from array import array
+from typing import Iterable, Iterator, List, Dict, Tuple, Any, Type, Optional
+
+# the array typecode each property type is stored as in a PostingBlock. Floats are stored as float32 in posting files,
+# so they are kept as float32 in memory too. Other types are kept in lists.
+TYPECODES = {int: 'q', float: 'f'}
 
 
 def dirty_string(segment):
@@ -8,8 +13,14 @@ def dirty_string(segment):
 
 
 class Posting:
+    __slots__ = ("doc_id", "properties")
+
     SORTED_PROPERTIES: Dict[str, Tuple[type, int]] = None
     REVERSE_MAP: List[Tuple[str, type]] = None
+    # maps each property to its index in properties
+    INDEX: Dict[str, int] = None
+    # the property bounded per block and per key when written, used to prune top-k retrieval
+    IMPACT: Optional[str] = None
 
     def __init__(self, doc_id: int, properties: Dict[str, int or float] or [float or int] = None):
         self.doc_id = int(doc_id)
@@ -23,7 +34,7 @@ class Posting:
         self.properties = properties if properties else [None] * len(type(self).SORTED_PROPERTIES)
 
     def get_index(self, key: str) -> int:
-        return type(self).SORTED_PROPERTIES[key][1]
+        return self.INDEX[key]
 
     def get_type(self, key: str) -> type:
         return type(self).SORTED_PROPERTIES[key][0]
@@ -42,35 +53,130 @@ class Posting:
         return f"{self.doc_id}\v{property_string}"
 
     def __eq__(self, other: "Posting"):
-        if type(other) is not type(self):
-            raise TypeError
+        if not isinstance(other, Posting):
+            return NotImplemented
         return self.doc_id == other.doc_id
 
     def __lt__(self, other: "Posting"):
-        if type(other) is not type(self):
-            raise TypeError
+        if not isinstance(other, Posting):
+            return NotImplemented
         return self.doc_id < other.doc_id
 
     def set_property(self, key: str, value: Any):
-        self.properties[self.get_index(key)] = value
+        self.properties[self.INDEX[key]] = value
 
     def get_property(self, key: str):
-        return self.properties[self.get_index(key)]
+        return self.properties[self.INDEX[key]]
 
 
 class IntersectPosting:
+    __slots__ = ("doc_id", "postings")
+
     def __init__(self, *postings: Posting):
-        self.doc_id = postings[0].doc_id
+        self.doc_id = next(posting.doc_id for posting in postings if posting is not None)
         self.postings = postings
 
     def get_properties(self, key: str):
-        return [posting.get_property(key) for posting in self.postings]
+        return [posting.get_property(key) if posting is not None else None for posting in self.postings]
+
+
+class PostingBlock:
+    """
+    A list of postings of one type stored column by column in typed arrays instead of as Posting objects. Postings are
+    only created when they are indexed or iterated over.
+    """
+    __slots__ = ("posting", "doc_ids", "columns")
+
+    def __init__(self, posting: Type[Posting], doc_ids: Iterable[int] = (), columns: List[Iterable] = None):
+        """
+        :param posting: the posting type of the block
+        :param doc_ids: the doc_ids of the postings
+        :param columns: the values of each property in the order of REVERSE_MAP
+        """
+        self.posting = posting
+        self.doc_ids = array('q', doc_ids)
+        self.columns = [array(TYPECODES[kind]) if kind in TYPECODES else [] for _, kind in posting.REVERSE_MAP]
+        if columns is not None:
+            for column, values in zip(self.columns, columns):
+                column.extend(values)
+
+    @classmethod
+    def from_postings(cls, posting: Type[Posting], postings: Iterable[Posting]) -> "PostingBlock":
+        block = cls(posting)
+        for element in postings:
+            block.append(element)
+        return block
+
+    def append(self, posting: Posting):
+        self.doc_ids.append(posting.doc_id)
+        for column, value in zip(self.columns, posting.properties):
+            column.append(value)
+
+    def extend(self, doc_ids: Iterable[int], columns: List[Iterable]):
+        self.doc_ids.extend(doc_ids)
+        for column, values in zip(self.columns, columns):
+            column.extend(values)
+
+    def column(self, key: str):
+        return self.columns[self.posting.INDEX[key]]
+
+    def set_column(self, key: str, values: Iterable):
+        index = self.posting.INDEX[key]
+        kind = self.posting.REVERSE_MAP[index][1]
+        self.columns[index] = array(TYPECODES[kind], values) if kind in TYPECODES else list(values)
+
+    def take(self, indices: Iterable[int]) -> "PostingBlock":
+        """
+        :return: a block of the postings at indices, in the order given
+        """
+        indices = list(indices)
+        return PostingBlock(self.posting, [self.doc_ids[i] for i in indices],
+                            [[column[i] for i in indices] for column in self.columns])
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def __getitem__(self, index: int) -> Posting:
+        return self.posting(self.doc_ids[index], [column[index] for column in self.columns])
+
+    def __iter__(self) -> Iterator[Posting]:
+        posting = self.posting
+        if not self.columns:
+            return (posting(doc_id) for doc_id in self.doc_ids)
+        return (posting(doc_id, list(properties)) for doc_id, properties in zip(self.doc_ids, zip(*self.columns)))
+
+
+def accessor(index: int) -> property:
+    """
+    A property reading and writing properties[index], so a posting type can expose each of its properties as an
+    attribute without a lookup by name.
+    """
+
+    def get(self: Posting):
+        return self.properties[index]
+
+    def set(self: Posting, value: Any):
+        self.properties[index] = value
+
+    return property(get, set)
 
 
 # noinspection PyTypeChecker
-def create_posting_type(name: str, map_properties: Dict[str, type]) -> Type[Posting]:
-    posting: Type[Posting] = type(name, (Posting,), {})
+def create_posting_type(name: str, map_properties: Dict[str, type], impact: str = None) -> Type[Posting]:
+    """
+    Create a posting type. Instances only hold a doc_id and a list of properties. Each property whose name is an
+    identifier that Posting does not already use can also be read and written as an attribute.
+    :param impact: the float property to bound per block and per key, see Posting.IMPACT
+    """
+    if impact is not None and map_properties.get(impact) is not float:
+        raise ValueError(f"The impact property {impact} must be a float property")
     sorted_list = list(sorted(map_properties))
-    posting.SORTED_PROPERTIES = {key: (map_properties[key], idx) for idx, key in enumerate(sorted_list)}
-    posting.REVERSE_MAP = [(x, map_properties[x]) for x in sorted_list]
+    attributes = {"__slots__": (), "IMPACT": impact,
+                  "SORTED_PROPERTIES": {key: (map_properties[key], idx) for idx, key in enumerate(sorted_list)},
+                  "REVERSE_MAP": [(x, map_properties[x]) for x in sorted_list],
+                  "INDEX": {key: idx for idx, key in enumerate(sorted_list)}}
+    for idx, key in enumerate(sorted_list):
+        if key.isidentifier() and not hasattr(Posting, key):
+            attributes[key] = accessor(idx)
+    posting: Type[Posting] = type(name, (Posting,), attributes)
     return posting
@@ -1,85 +1,494 @@
 import math
-from collections import defaultdict
+import os
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, as_completed
 from heapq import nlargest
+from threading import Event, Lock
 from time import time
-from typing import Callable, List, Tuple, Type, Iterator
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Type, Iterator, Union
 
-from doc import DocumentIdDictionary
-from fixed import FixedScoreDictionary
+import numpy as np
+
+from doc import DocumentIdDictionary, ReopeningDocumentStore
+from fixed import BaseSetScorer, FixedScoreDictionary
+from posting.cache import LRUCache
 from posting.io import PostingReader, PostingIterator
-from posting.post import Posting
+from posting.post import Posting, PostingBlock
+from posting.segment import Snapshot
 from posting.tokenizer import TokenizeResult, Tokenizer
+from posting.wand import AND, OR, Cursor, QueryMode, block_max_wand, minimum_match
+
+# multiplies the weight of each term of a query
+TermWeights = Dict[str, float]
+# the weight of each query independent score added to the score of a document
+FixedScores = List[Tuple[float, FixedScoreDictionary]]
 
 
 class QueryScoringScheme:
     def get_posting_type(self) -> Type[Posting]:
         raise NotImplementedError
 
-    def score(self, query: [str]) -> Iterator[Tuple[Posting, float]]:
+    def score(self, query: [str], mode: QueryMode = AND,
+              weights: Optional[TermWeights] = None) -> Iterator[Tuple[Posting, float]]:
         raise NotImplementedError
 
     def create_posting(self, document: str, result: TokenizeResult) -> [Tuple[str, Posting]]:
         raise NotImplementedError
 
-    def finalize_posting(self, iterator: PostingIterator):
+    def finalize_posting(self, iterator: PostingIterator, weighted: bool = True) -> PostingBlock:
+        """
+        Compute the weights of the postings of a key once every posting was written.
+        :param weighted: weight by idf over the documents of the scheme. Segments written incrementally store
+        unweighted postings and are weighted when they are searched.
+        """
+        raise NotImplementedError
+
+    def cursors(self, query: [str], factor: float = 1, champion: bool = False,
+                weights: Optional[TermWeights] = None, snapshot: Optional[Snapshot] = None,
+                stop: Callable[[], bool] = None) -> List[Cursor]:
+        """
+        :param snapshot: the snapshot acquired for the query, see acquire
+        :param stop: the stop of the query as block_max_wand takes it, for schemes that read postings before
+        returning the cursors
+        """
         raise NotImplementedError
 
+    def acquire(self) -> Optional[Snapshot]:
+        """
+        Hold what the scheme reads until release, so the cursors of a query stay readable while the index is rebuilt.
+        :return: the snapshot to pass to cursors and release
+        """
+        return None
+
+    def release(self, snapshot: Optional[Snapshot]):
+        pass
+
+    def has_champion(self) -> bool:
+        return False
+
+    def files(self) -> List[str]:
+        """
+        The files the scheme reads, so caches can be invalidated when they are rebuilt.
+        """
+        return []
+
+    def invalidate(self):
+        """
+        Drop anything the scheme cached from its files.
+        """
+        pass
+
+    def warm(self, queries: List[List[str]]):
+        """
+        Cache what the scheme reads for the tokenized queries, such as queries logged before a restart.
+        """
+        pass
+
+
+class SegmentedScoringScheme(QueryScoringScheme):
+    """
+    A scheme reading the segments of an index through a Snapshot, see posting.segment. Subclasses set lock before
+    opening their first snapshot.
+    """
+    snapshot: Optional[Snapshot] = None
+
+    def swap(self, snapshot: Snapshot):
+        """
+        Replace the snapshot queries start from. The previous one is closed once the queries reading it release it.
+        """
+        with self.lock:
+            previous, self.snapshot = self.snapshot, snapshot
+        if previous is not None:
+            previous.release()
+
+    def acquire(self) -> Snapshot:
+        with self.lock:
+            return self.snapshot.acquire()
+
+    def release(self, snapshot: Optional[Snapshot]):
+        if snapshot is not None:
+            snapshot.release()
+
+    @contextmanager
+    def pinned(self, snapshot: Optional[Snapshot] = None) -> Iterator[Snapshot]:
+        """
+        The snapshot a caller acquired, or the current one held until the block ends.
+        """
+        if snapshot is not None:
+            yield snapshot
+            return
+        snapshot = self.acquire()
+        try:
+            yield snapshot
+        finally:
+            snapshot.release()
+
+
+# the number of queries in flight per scheme when schemes are evaluated concurrently
+QUERY_WORKERS = 4
+# the number of documents each scheme returns when schemes are evaluated concurrently, as a multiple of the limit, so
+# documents ranked lower by one scheme can still be combined with the scores of the others
+SCHEME_DEPTH = 4
+# the time in seconds schemes are given past their deadline to return the documents they found
+DEADLINE_GRACE = 0.010
+# the number of recent queries latency percentiles are computed over
+LATENCY_WINDOW = 1000
+# the number of recent queries whose own statistics are kept
+RECENT_QUERIES = 100
+# the number of seconds between checks of whether the files of the schemes were rebuilt
+INDEX_CHECK_INTERVAL = 1.0
+# the time in seconds a base set scorer is given to score the links around the results of a query
+BASE_SET_BUDGET = 0.020
+
+
+class Deadline:
+    """
+    A point in time after which evaluation stops. It can also be cancelled before then.
+    """
+
+    def __init__(self, seconds: float):
+        self.end = time() + seconds
+        self.cancelled = Event()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def expired(self) -> bool:
+        return self.cancelled.is_set() or time() > self.end
+
+    def remaining(self) -> float:
+        return max(0.0, self.end - time())
+
+
+class QueryStatistics:
+    def __init__(self, tier: str, latency: float, fallback: bool, partial: bool = False):
+        """
+        The statistics of a single query.
+        :param tier: the tier the results came from, either "champion", "full" or "cache"
+        :param latency: the time taken by the query in seconds
+        :param fallback: whether the champion tier was searched but could not fill the results
+        :param partial: whether a scheme ran out of time, so the results may not be the exact top documents
+        """
+        self.tier = tier
+        self.latency = latency
+        self.fallback = fallback
+        self.partial = partial
+
+    def to_dict(self):
+        return {"tier": self.tier, "latency": self.latency, "fallback": self.fallback, "partial": self.partial}
+
+
+class TierStatistics:
+    """
+    Counters over every query searched by a MultiScoringScheme.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.queries = 0
+        self.champion_hits = 0
+        self.cache_hits = 0
+        self.fallbacks = 0
+        self.partials = 0
+        self.latency = 0.0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.recent = deque(maxlen=RECENT_QUERIES)
+
+    def record(self, query: str, statistics: QueryStatistics):
+        """
+        Count a query, and keep its own statistics among the last RECENT_QUERIES.
+        """
+        with self.lock:
+            self.queries += 1
+            self.champion_hits += statistics.tier == "champion"
+            self.cache_hits += statistics.tier == "cache"
+            self.fallbacks += statistics.fallback
+            self.partials += statistics.partial
+            self.latency += statistics.latency
+            self.latencies.append(statistics.latency)
+            self.recent.append({"query": query, **statistics.to_dict()})
+
+    def hit_rate(self) -> float:
+        return self.champion_hits / self.queries if self.queries else 0.0
+
+    def percentile(self, percentile: float) -> float:
+        """
+        The latency below which percentile percent of the last LATENCY_WINDOW queries finished.
+        """
+        latencies = sorted(self.latencies)
+        if not latencies:
+            return 0.0
+        return latencies[min(len(latencies) - 1, int(len(latencies) * percentile / 100))]
+
+    def to_dict(self):
+        with self.lock:
+            return {"queries": self.queries, "champion_hits": self.champion_hits, "cache_hits": self.cache_hits,
+                    "fallbacks": self.fallbacks,
+                    "partials": self.partials, "hit_rate": self.hit_rate(),
+                    "mean_latency": self.latency / self.queries if self.queries else 0.0,
+                    "p50_latency": self.percentile(50), "p99_latency": self.percentile(99),
+                    "recent": list(self.recent)}
+
 
 class MultiScoringScheme:
-    def score(self, query: str, limit: int = 10) -> List[Tuple[int, float]]:
-        # maps the id to the score and the number of
-        array = defaultdict(lambda: [0, 0])
-        # the total number of doc_ids intersected by all of them
-        total_filled = 0
+    def evaluate(self, cursors: List[Cursor], limit: int, mode: QueryMode) -> List[Tuple[int, float]]:
+        minimum = minimum_match(mode, len(cursors))
+        if not any(len(scores) for _, scores in self.fixed):
+            return block_max_wand(cursors, limit, minimum=minimum)
+        return block_max_wand(cursors, limit, False, self.fixed_score, self.fixed_bound(), minimum=minimum)
+
+    def fixed_score(self, doc_id: int) -> float:
+        """
+        The weighted sum of the query independent scores of a document.
+        """
+        return sum(weight * scores.get(doc_id) for weight, scores in self.fixed)
+
+    def fixed_scores(self, doc_ids: List[int]) -> np.ndarray:
+        """
+        The weighted sum of the query independent scores of many documents, looked up at once.
+        """
+        total = np.zeros(len(doc_ids))
+        for weight, scores in self.fixed:
+            total += weight * scores.scores_for(doc_ids)
+        return total
+
+    def fixed_bound(self) -> float:
+        """
+        The largest value fixed_score can return.
+        """
+        bound = 0.0
+        for weight, scores in self.fixed:
+            if len(scores):
+                low, high = scores.bounds()
+                bound += max(0.0, weight * low, weight * high)
+        return bound
+
+    def search(self, query: str, limit: int = 10, mode: QueryMode = OR, timeout: Optional[float] = None,
+               weights: Optional[TermWeights] = None) -> Tuple[List[Tuple[int, float]], QueryStatistics]:
+        """
+        The exact top documents over every scheme, found with Block-Max WAND over the cursors of all schemes. When
+        a scheme has a champion tier, the champion tiers are searched first, together with the full postings of the
+        schemes without one, and the full postings of every scheme are only searched when that finds fewer than limit
+        documents. Results are cached by the tokens each tokenizer makes of the query and by whether they were exact,
+        so results of concurrent evaluation are never served to exact searches. Results cut short by a deadline are
+        not cached.
+        :param mode: the number of terms a document has to match, counted over the terms of every scheme
+        :param timeout: evaluate the schemes concurrently with a deadline of timeout seconds instead, see
+        search_concurrent
+        :param weights: multiplies the weight of the terms each tokenizer makes of a word of the query
+        :return: the documents and the statistics of the query
+        """
         start = time()
+        # the base set scorer reranks the top SCHEME_DEPTH times limit documents
+        depth = limit * SCHEME_DEPTH if self.base_set is not None else limit
+        queries = [(factor, tokenizer.tokenizer_query(query), scheme, self.term_weights(tokenizer, weights))
+                   for factor, tokenizer, scheme in self.schemes]
+        key = (tuple(tuple(tq) if tq else () for _, tq, _, _ in queries), limit, mode,
+               tuple(sorted(weights.items())) if weights else (), timeout is None)
+        self.check_indexes()
+        if self.cache is not None:
+            results = self.cache.get(key)
+            if results is not None:
+                statistics = QueryStatistics("cache", time() - start, False)
+                self.statistics.record(query, statistics)
+                return results, statistics
+
+        queries = [entry for entry in queries if entry[1]]
+        if timeout is None:
+            results, tier, fallback, partial = self.__exact__(queries, depth, mode)
+        else:
+            results, tier, fallback, partial = self.__concurrent__(queries, depth, mode, timeout)
+        if self.base_set is not None:
+            results, stopped = self.__rerank__(results, limit)
+            partial |= stopped
+        if self.cache is not None and not partial:
+            self.cache.put(key, results)
+        statistics = QueryStatistics(tier, time() - start, fallback, partial)
+        self.statistics.record(query, statistics)
+        return results, statistics
+
+    def __rerank__(self, results: List[Tuple[int, float]], limit: int) -> Tuple[List[Tuple[int, float]], bool]:
+        """
+        Add the weighted base set scores of the results, scored within base_set_budget seconds.
+        :return: the top limit results and whether the base set scorer ran out of time
+        """
+        weight, scorer = self.base_set
+        deadline = Deadline(self.base_set_budget)
+        scores, stopped = scorer.score_base_set([doc_id for doc_id, _ in results], deadline.expired)
+        results = [(doc_id, score + weight * scores.get(doc_id, 0.0)) for doc_id, score in results]
+        return nlargest(limit, results, key=lambda x: (x[1], -x[0])), stopped
+
+    @staticmethod
+    def term_weights(tokenizer: Tokenizer, weights: Optional[TermWeights]) -> Optional[TermWeights]:
+        """
+        Map weights of query words to weights of the terms a tokenizer makes of them.
+        """
+        if not weights:
+            return None
+        return {term: weight for word, weight in weights.items() for term in tokenizer.tokenizer_query(word) or []}
+
+    def __exact__(self, queries: List[Tuple[float, List[str], QueryScoringScheme, Optional[TermWeights]]],
+                  limit: int, mode: QueryMode) -> Tuple[List[Tuple[int, float]], str, bool, bool]:
+        snapshots = [scheme.acquire() for _, _, scheme, _ in queries]
+        try:
+            # schemes without a champion tier, such as positional scoring, are searched in full in both passes
+            champions = [scheme.has_champion() for _, _, scheme, _ in queries]
+            tiered = any(champions)
+            results = []
+            if tiered:
+                cursors = [cursor for (factor, tq, scheme, weights), snapshot, champion
+                           in zip(queries, snapshots, champions)
+                           for cursor in scheme.cursors(tq, factor, champion, weights, snapshot)]
+                results = self.evaluate(cursors, limit, mode)
+            fallback = tiered and len(results) < limit
+            if not tiered or fallback:
+                cursors = [cursor for (factor, tq, scheme, weights), snapshot in zip(queries, snapshots)
+                           for cursor in scheme.cursors(tq, factor, False, weights, snapshot)]
+                results = self.evaluate(cursors, limit, mode)
+        finally:
+            for (_, _, scheme, _), snapshot in zip(queries, snapshots):
+                scheme.release(snapshot)
+        return results, "champion" if tiered and not fallback else "full", fallback, False
+
+    def search_concurrent(self, query: str, limit: int = 10, mode: QueryMode = OR, timeout: float = 0.2,
+                          weights: Optional[TermWeights] = None) -> Tuple[List[Tuple[int, float]], QueryStatistics]:
+        """
+        The top documents over every scheme, with each scheme evaluated on its own worker. A scheme still running at
+        the deadline stops and returns the best documents it found, so a slow scheme does not hold back the others
+        and the latency of a query is bounded by timeout. The documents of every scheme are combined as they arrive.
+        Unlike search, a document only scores in the schemes that rank it within SCHEME_DEPTH times limit.
+        :param mode: the number of terms a document has to match, counted over the terms of each scheme
+        :param timeout: the time in seconds the schemes are given
+        :param weights: multiplies the weight of the terms each tokenizer makes of a word of the query
+        :return: the documents and the statistics of the query
+        """
+        return self.search(query, limit, mode, timeout, weights)
+
+    def __concurrent__(self, queries: List[Tuple[float, List[str], QueryScoringScheme, Optional[TermWeights]]],
+                       limit: int, mode: QueryMode, timeout: float) -> Tuple[List[Tuple[int, float]], str, bool, bool]:
+        deadline = Deadline(timeout)
+        futures = [self.executor.submit(self.evaluate_scheme, factor, tq, scheme, limit * SCHEME_DEPTH, mode,
+                                        deadline, weights) for factor, tq, scheme, weights in queries]
+        scores = defaultdict(float)
+        tiers = []
+        fallback = partial = False
+        try:
+            for future in as_completed(futures, timeout=deadline.remaining() + DEADLINE_GRACE):
+                results, tier, scheme_fallback, scheme_partial = future.result()
+                for doc_id, score in results:
+                    scores[doc_id] += score
+                tiers.append(tier)
+                fallback |= scheme_fallback
+                partial |= scheme_partial
+        except TimeoutError:
+            partial = True
+        deadline.cancel()
+        for future in futures:
+            future.cancel()
+        if any(len(fixed) for _, fixed in self.fixed):
+            doc_ids = list(scores)
+            for doc_id, score in zip(doc_ids, self.fixed_scores(doc_ids).tolist()):
+                scores[doc_id] += score
+        results = nlargest(limit, scores.items(), key=lambda x: (x[1], -x[0]))
+        tier = "champion" if tiers and all(tier == "champion" for tier in tiers) else "full"
+        return results, tier, fallback, partial
+
+    def check_indexes(self):
+        """
+        Invalidate the caches when a file of a scheme was rebuilt since the last check. Files are checked at most once
+        every INDEX_CHECK_INTERVAL seconds.
+        """
+        now = time()
+        if now - self.checked < INDEX_CHECK_INTERVAL:
+            return
+        self.checked = now
+        versions = self.__versions__()
+        if versions != self.versions:
+            self.versions = versions
+            self.invalidate()
+
+    def __versions__(self) -> List[Optional[float]]:
+        files = [file for _, _, scheme in self.schemes for file in scheme.files()]
+        if self.store is not None:
+            files.append(self.store.file_name)
+        return [os.path.getmtime(file) if os.path.exists(file) else None for file in files]
+
+    def invalidate(self):
+        if self.cache is not None:
+            self.cache.invalidate()
+        # the store is reopened first, so the schemes weight new segments over the documents added with them
+        if self.store is not None:
+            self.store.reopen()
+        for _, _, scheme in self.schemes:
+            scheme.invalidate()
+
+    def warm(self, queries: Iterable[str]):
+        """
+        Warm the caches of every scheme with queries, such as the recent queries of a query log. The results of the
+        queries are not cached.
+        """
+        queries = list(queries)
+        for _, tokenizer, scheme in self.schemes:
+            scheme.warm([tq for tq in map(tokenizer.tokenizer_query, queries) if tq])
+
+    @staticmethod
+    def evaluate_scheme(factor: float, tq: [str], scheme: QueryScoringScheme, limit: int, mode: QueryMode,
+                        deadline: Deadline,
+                        weights: Optional[TermWeights] = None) -> Tuple[List[Tuple[int, float]], str, bool, bool]:
+        """
+        The top documents of a single scheme, searching its champion tier first as search does.
+        :return: the documents, the tier they came from, whether the champion tier fell back and whether the deadline
+        expired
+        """
+        snapshot = scheme.acquire()
+        try:
+            tiered = scheme.has_champion()
+            results = []
+            if tiered:
+                cursors = scheme.cursors(tq, factor, True, weights, snapshot, deadline.expired)
+                results = block_max_wand(cursors, limit, stop=deadline.expired,
+                                         minimum=minimum_match(mode, len(cursors)))
+            fallback = tiered and len(results) < limit and not deadline.expired()
+            if not tiered or fallback:
+                cursors = scheme.cursors(tq, factor, False, weights, snapshot, deadline.expired)
+                results = block_max_wand(cursors, limit, stop=deadline.expired,
+                                         minimum=minimum_match(mode, len(cursors)))
+        finally:
+            scheme.release(snapshot)
+        return results, "champion" if tiered and not fallback else "full", fallback, deadline.expired()
+
+    def top(self, query: str, limit: int = 10, mode: QueryMode = OR, timeout: Optional[float] = None,
+            weights: Optional[TermWeights] = None) -> List[Tuple[int, float]]:
+        return self.search(query, limit, mode, timeout, weights)[0]
 
-        iterators = dict()
-        factors = dict()
-        tqs = dict()
-        counter = 0
-        for factor, tokenizer, scheme in self.schemes:
-            tq = tokenizer.tokenizer_query(query)
-            if not tq:
-                continue
-            tqs[counter] = tq
-            iterators[counter] = scheme.score(tq)
-            factors[counter] = factor
-            counter += 1
-
-        while total_filled < 40 and time() - start < 0.200 and len(array) < 200 and len(iterators) > 0:
-            to_delete = []
-            for i, it in iterators.items():
-                try:
-                    doc_id, score = next(it)
-                    array[doc_id][0] += factors[i] * score
-                    array[doc_id][1] += 1
-                    if array[doc_id][1] == len(iterators):
-                        total_filled += 1
-                except StopIteration:
-                    to_delete.append(i)
-            for i in to_delete:
-                del iterators[i]
-        if len(array) < 10:
-            tq = tqs[0][0]
-            if tq:
-                for doc, score in self.schemes[0][2].score(tq):
-                    if time() - start > 0.26:
-                        break
-                    array[doc][0] += self.schemes[0][0] * score
-        if self.fixed:
-            for doc_id in array:
-                if doc_id in self.fixed.keys:
-                    array[doc_id][0] += self.fixed[doc_id]
-        return nlargest(limit, [(item[0], item[1][0]) for item in array.items()], key=lambda x: x[1])
-
-    def __init__(self, fixed: FixedScoreDictionary, *schemes: Tuple[int, Tokenizer, QueryScoringScheme]):
+    def __init__(self, fixed: Optional[Union[FixedScoreDictionary, FixedScores]],
+                 *schemes: Tuple[int, Tokenizer, QueryScoringScheme], cache: Optional[LRUCache] = None,
+                 base_set: Optional[Tuple[float, BaseSetScorer]] = None, base_set_budget: float = BASE_SET_BUDGET,
+                 store: Optional[ReopeningDocumentStore] = None):
         """
         Scoring multiple schemes simultaneously
-        :param document_id:
+        :param fixed: the query independent scores added to the score of every document, either a single score or a
+        weight for each score, such as PageRank and HITS authorities
         :param schemes:
+        :param cache: the results of recent queries, invalidated when the files of a scheme are rebuilt
+        :param base_set: the weight of a scorer of the links around the results of each query, such as HITS on the
+        base set, which reranks the results
+        :param base_set_budget: the time in seconds base_set is given for each query, on top of the time the schemes
+        take. Once it runs out the scores found so far are used.
+        :param store: the documents the schemes share, reopened with the schemes when an update rewrote it
         """
-        self.fixed = fixed
+        self.fixed: FixedScores = [(1.0, fixed)] if isinstance(fixed, FixedScoreDictionary) else list(fixed or [])
+        self.base_set = base_set
+        self.base_set_budget = base_set_budget
         self.schemes = schemes
+        self.statistics = TierStatistics()
+        self.cache = cache
+        self.store = store
+        self.checked = 0.0
+        self.versions = self.__versions__()
+        # the workers of search_concurrent, only started once it is used
+        self.executor = ThreadPoolExecutor(max_workers=max(1, QUERY_WORKERS * len(schemes)))
 
 
 def score_word(scheme: Callable[[DocumentIdDictionary, PostingIterator], List[Tuple[int, float]]], word: str,
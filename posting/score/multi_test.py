@@ -0,0 +1,285 @@
+import os
+import shutil
+import time
+import unittest
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+from doc import DocumentIdDictionary, from_document_store
+from fixed import BaseSetScorer, FixedScoreDictionary
+from fixed.graph import LinkGraph, base_set_hits
+from posting.cache import LRUCache
+from posting.segment import MAIN, Manifest, write_manifest, write_statistics
+from posting.segment_test import write_segment
+from posting.tokenizer import Tokenizer
+from . import Deadline, MultiScoringScheme, QueryScoringScheme
+from .tf_idf import TfIdfScoring
+
+
+class SplitTokenizer(Tokenizer):
+    def tokenizer_query(self, query: str):
+        return query.split()
+
+
+class GraphScorer(BaseSetScorer):
+    """
+    HITS.score_base_set over a link graph built in memory.
+    """
+
+    def __init__(self, links: Dict[int, Dict[int, int]]):
+        self.graph = LinkGraph.from_links(links)
+        self.reverse = self.graph.transpose()
+
+    def score_base_set(self, roots: List[int], stop: Callable[[], bool]) -> Tuple[Dict[int, float], bool]:
+        return base_set_hits(self.graph, self.reverse, roots, stop=stop)
+
+
+class SlowScoring(QueryScoringScheme):
+    """
+    The cursors of another scheme, returned after a delay.
+    """
+
+    def __init__(self, scheme: QueryScoringScheme, delay: float):
+        self.scheme = scheme
+        self.delay = delay
+
+    def cursors(self, query: [str], factor: float = 1, champion: bool = False, weights=None, snapshot=None,
+                stop=None):
+        time.sleep(self.delay)
+        return self.scheme.cursors(query, factor, champion, weights)
+
+
+def urls(store, results):
+    """
+    The urls of the results as query.query_results finds them, leaving out documents the store does not know yet.
+    """
+    return [store.find_url_by_id(doc_id) for doc_id, _ in results if doc_id in store]
+
+
+class IncrementalQueryTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dictionary = DocumentIdDictionary("multi.test", [])
+        for doc_id in range(4):
+            self.dictionary.generate_doc_id(f"{doc_id}.json", f"https://example.com/{doc_id}")
+        write_segment("multi.test/schemed", range(4), range(4))
+        write_statistics("multi.test", 4)
+        write_manifest("multi.test", Manifest(1, [MAIN], None, 4))
+        self.dictionary.flush()
+        self.store = from_document_store("multi.test", reopening=True)
+        self.scheme = TfIdfScoring(self.store, "multi.test/schemed")
+        self.multi = MultiScoringScheme(None, (1, SplitTokenizer(), self.scheme), store=self.store)
+
+    def test_delta(self):
+        results = self.multi.top("date", 10)
+        self.assertEqual(sorted(doc_id for doc_id, _ in results), [2, 3])
+        self.assertEqual(urls(self.store, results), [f"https://example.com/{doc_id}" for doc_id, _ in results])
+
+        # document 4 is indexed into a delta segment, which is committed before the store is rewritten
+        write_segment("multi.test/segments/4/schemed", [4], None)
+        write_statistics("multi.test/segments/4", 1, weighted=False, first=4)
+        write_manifest("multi.test", Manifest(2, [MAIN, "segments/4"], None, 5))
+        self.multi.checked = 0.0
+        results = self.multi.top("date", 10)
+        self.assertIn(4, [doc_id for doc_id, _ in results])
+        self.assertEqual(len(urls(self.store, results)), 2)
+
+        self.dictionary.generate_doc_id("4.json", "https://example.com/4")
+        self.dictionary.flush()
+        self.multi.checked = 0.0
+        results = self.multi.top("date", 10)
+        self.assertEqual(len(self.store), 5)
+        self.assertEqual(self.scheme.collection_size(), 5)
+        self.assertIn("https://example.com/4", urls(self.store, results))
+        # the scores are the ones of an index built over the five documents at once
+        write_segment("single.test/schemed", range(5), range(5))
+        write_statistics("single.test", 5)
+        single = TfIdfScoring(list(range(5)), "single.test/schemed")
+        expected = single.search(["date"], 10, "or")
+        for (doc_id, score), (expected_id, expected_score) in zip(results, expected):
+            self.assertEqual(doc_id, expected_id)
+            self.assertAlmostEqual(score, expected_score)
+        self.assertEqual(len(results), len(expected))
+
+    def tearDown(self) -> None:
+        self.store.close()
+        for name in ("multi.test", "single.test"):
+            shutil.rmtree(name, ignore_errors=True)
+
+
+class TierTest(unittest.TestCase):
+    def setUp(self) -> None:
+        write_segment("tiers.test/schemed", range(6), range(6))
+        write_segment("tiers.test/champion", [0, 2, 4], range(6))
+        write_statistics("tiers.test", 6)
+        self.schemes = [TfIdfScoring(list(range(6)), "tiers.test/schemed", "tiers.test/champion"),
+                        TfIdfScoring(list(range(6)), "tiers.test/schemed"),
+                        TfIdfScoring(list(range(6)), "tiers.test/schemed")]
+
+    def test_champion(self):
+        multi = MultiScoringScheme(None, (1, SplitTokenizer(), self.schemes[0]))
+        full = MultiScoringScheme(None, (1, SplitTokenizer(), self.schemes[1]))
+        # both documents with apple are champions, so the champion tier fills the results
+        results, statistics = multi.search("apple", 2)
+        self.assertEqual((statistics.tier, statistics.fallback), ("champion", False))
+        self.assertEqual(results, full.top("apple", 2))
+        # only two of the five documents with cherry or date are champions, so the full index is searched
+        results, statistics = multi.search("cherry date", 4)
+        self.assertEqual((statistics.tier, statistics.fallback), ("full", True))
+        self.assertEqual(results, full.top("cherry date", 4))
+        aggregate = multi.statistics.to_dict()
+        self.assertEqual((aggregate["queries"], aggregate["champion_hits"], aggregate["fallbacks"]), (2, 1, 1))
+        self.assertEqual(aggregate["hit_rate"], 0.5)
+        self.assertEqual([(query["query"], query["tier"], query["fallback"]) for query in aggregate["recent"]],
+                         [("apple", "champion", False), ("cherry date", "full", True)])
+
+    def test_mixed(self):
+        # the second scheme has no champion tier, which does not keep the first from searching its own
+        multi = MultiScoringScheme(None, *[(1, SplitTokenizer(), scheme) for scheme in self.schemes[:2]])
+        full = MultiScoringScheme(None, *[(1, SplitTokenizer(), scheme) for scheme in self.schemes[1:]])
+        results, statistics = multi.search("apple", 2)
+        self.assertEqual((statistics.tier, statistics.fallback), ("champion", False))
+        self.assertEqual(results, full.top("apple", 2))
+        # the champion tier only holds document 2 of the three with cherry
+        results, statistics = multi.search("cherry", 4)
+        self.assertEqual((statistics.tier, statistics.fallback), ("full", True))
+        self.assertEqual(results, full.top("cherry", 4))
+        self.assertEqual(full.search("apple", 2)[1].tier, "full")
+
+    def tearDown(self) -> None:
+        for scheme in self.schemes:
+            scheme.snapshot.release()
+        shutil.rmtree("tiers.test", ignore_errors=True)
+
+
+class MultiScoringTest(unittest.TestCase):
+    def setUp(self) -> None:
+        write_segment("multi.test/schemed", range(6), range(6))
+        write_statistics("multi.test", 6)
+        self.scheme = TfIdfScoring(list(range(6)), "multi.test/schemed")
+        self.scores = dict(self.scheme.search(["apple", "banana"], 10, "or"))
+        # 4 is linked to by the other documents with banana, which makes it the authority of their base set
+        self.scorer = GraphScorer({0: {4: 1}, 1: {4: 1}, 5: {4: 1}})
+
+    def test_base_set(self):
+        multi = MultiScoringScheme(None, (1, SplitTokenizer(), self.scheme), base_set=(1.0, self.scorer),
+                                   base_set_budget=10.0)
+        results, statistics = multi.search("banana", 3)
+        self.assertFalse(statistics.partial)
+        self.assertEqual(results[0][0], 4)
+        # the results of the schemes are reranked by their scores over the base set added with its weight
+        ranked = self.scheme.search(["banana"], 10, "or")
+        authorities, stopped = self.scorer.score_base_set([doc_id for doc_id, _ in ranked], lambda: False)
+        self.assertFalse(stopped)
+        expected = sorted(((doc_id, score + authorities.get(doc_id, 0.0)) for doc_id, score in ranked),
+                          key=lambda x: (-x[1], x[0]))[:3]
+        self.assertEqual([doc_id for doc_id, _ in results], [doc_id for doc_id, _ in expected])
+        np.testing.assert_allclose([score for _, score in results], [score for _, score in expected])
+
+    def test_budget(self):
+        cache = LRUCache(10)
+        multi = MultiScoringScheme(None, (1, SplitTokenizer(), self.scheme), cache=cache,
+                                   base_set=(1.0, self.scorer), base_set_budget=0.0)
+        # the base set is not scored within the budget, so the results are partial and are not cached
+        for _ in range(2):
+            results, statistics = multi.search("banana", 3)
+            self.assertTrue(statistics.partial)
+            self.assertNotEqual(statistics.tier, "cache")
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(multi.statistics.partials, 2)
+        multi.base_set_budget = 10.0
+        results, statistics = multi.search("banana", 3)
+        self.assertFalse(statistics.partial)
+        cached, statistics = multi.search("banana", 3)
+        self.assertEqual((cached, statistics.tier), (results, "cache"))
+
+    def test_fixed(self):
+        first, second = FixedScoreDictionary("first.test"), FixedScoreDictionary("second.test")
+        first.update(np.array([0, 1, 2, 5]), np.array([0.01, 0.08, 0.0, 0.02]))
+        second.update(np.array([2, 4, 5]), np.array([0.1, -0.02, 0.04]))
+        expected = {doc_id: score + first.get(doc_id) + 0.5 * second.get(doc_id)
+                    for doc_id, score in self.scores.items()}
+        expected = sorted(expected.items(), key=lambda x: (-x[1], x[0]))[:3]
+        multi = MultiScoringScheme([(1.0, first), (0.5, second)], (1, SplitTokenizer(), self.scheme))
+        for timeout in (None, 10.0):
+            results = multi.top("apple banana", 3, timeout=timeout)
+            self.assertEqual([doc_id for doc_id, _ in results], [doc_id for doc_id, _ in expected])
+            np.testing.assert_allclose([score for _, score in results], [score for _, score in expected], rtol=1e-6)
+        # a single score is weighted 1
+        single = MultiScoringScheme(first, (1, SplitTokenizer(), self.scheme))
+        self.assertEqual(single.fixed, [(1.0, first)])
+
+    def tearDown(self) -> None:
+        self.scheme.snapshot.release()
+        for name in ("multi.test", "first.test", "second.test"):
+            shutil.rmtree(name, ignore_errors=True)
+
+
+class ConcurrentTest(unittest.TestCase):
+    def setUp(self) -> None:
+        write_segment("concurrent.test/schemed", range(6), range(6))
+        write_statistics("concurrent.test", 6)
+        self.scheme = TfIdfScoring(list(range(6)), "concurrent.test/schemed")
+        self.cache = LRUCache(10)
+        self.multi = MultiScoringScheme(None, (1, SplitTokenizer(), self.scheme),
+                                        (1, SplitTokenizer(), SlowScoring(self.scheme, 0.5)), cache=self.cache)
+
+    def test_deadline(self):
+        deadline = Deadline(10.0)
+        self.assertFalse(deadline.expired())
+        self.assertGreater(deadline.remaining(), 9.0)
+        deadline.cancel()
+        self.assertTrue(deadline.expired())
+        deadline = Deadline(0.01)
+        time.sleep(0.02)
+        self.assertTrue(deadline.expired())
+        self.assertEqual(deadline.remaining(), 0.0)
+
+    def test_in_time(self):
+        results, statistics = self.multi.search_concurrent("apple banana", 3, timeout=5.0)
+        self.assertFalse(statistics.partial)
+        # both schemes score the same documents, so they add up to twice the exact scores
+        expected = self.scheme.search(["apple", "banana"], 3, "or")
+        self.assertEqual([doc_id for doc_id, _ in results], [doc_id for doc_id, _ in expected])
+        np.testing.assert_allclose([score for _, score in results], [2 * score for _, score in expected])
+        # the results were complete, so they are cached
+        start = time.time()
+        cached, statistics = self.multi.search_concurrent("apple banana", 3, timeout=5.0)
+        self.assertEqual((cached, statistics.tier), (results, "cache"))
+        self.assertLess(time.time() - start, 0.1)
+        # concurrent results only score the documents each scheme ranks, so exact searches do not use them
+        self.assertNotEqual(self.multi.search("apple banana", 3)[1].tier, "cache")
+        self.assertEqual(self.multi.search("apple banana", 3)[1].tier, "cache")
+
+    def test_expired(self):
+        start = time.time()
+        results, statistics = self.multi.search_concurrent("apple banana", 3, timeout=0.05)
+        # the slow scheme is left behind at the deadline, and the results of the other one are returned
+        self.assertLess(time.time() - start, 0.3)
+        self.assertTrue(statistics.partial)
+        self.assertEqual(results, self.scheme.search(["apple", "banana"], 3, "or"))
+        self.assertEqual(len(self.cache), 0)
+        self.assertNotEqual(self.multi.search_concurrent("apple banana", 3, timeout=0.05)[1].tier, "cache")
+
+    def test_check_indexes(self):
+        self.multi.search("apple", 3)
+        self.assertEqual(self.multi.search("apple", 3)[1].tier, "cache")
+        # the scheme is rebuilt, which is only noticed once INDEX_CHECK_INTERVAL passed since the last check
+        write_segment("concurrent.test/schemed", range(4), range(4))
+        modified = os.path.getmtime("concurrent.test/schemed.index") + 5
+        os.utime("concurrent.test/schemed.index", (modified, modified))
+        self.assertEqual(self.multi.search("apple", 3)[1].tier, "cache")
+        self.multi.checked -= 10
+        results, statistics = self.multi.search("apple", 3)
+        self.assertEqual(statistics.tier, "full")
+        self.assertEqual(self.multi.versions[0], modified)
+        self.assertEqual({doc_id for doc_id, _ in results}, {0, 2})
+
+    def tearDown(self) -> None:
+        self.multi.executor.shutdown(wait=True)
+        self.scheme.snapshot.release()
+        shutil.rmtree("concurrent.test", ignore_errors=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,282 @@
+import math
+import os
+from collections import defaultdict
+from threading import Lock
+from typing import Callable, Iterator, List, Optional, Tuple, Type
+
+from doc.doc_id import DocumentIdDictionary
+from doc.store import DocumentStore
+from posting import create_posting_type
+from posting.cache import CachedPostingIterator, DecodedBlock, PostingCache
+from posting.codec import BLOCK_SIZE
+from posting.io import PostingIterator
+from posting.post import Posting, PostingBlock
+from posting.score import SegmentedScoringScheme, TermWeights
+from posting.segment import MANIFEST, Snapshot
+from posting.tokenizer import TokenizeResult
+from posting.wand import AND, STOP_INTERVAL, Cursor, QueryMode, block_max_wand, minimum_match
+
+# the number of consecutive query words matched as one phrase by cursors. 3 serves the phrases the trigram index did.
+PHRASE_LENGTH = 3
+
+# the documents matching a phrase, scored by the tf-idf of the phrase
+PHRASE_POSTING = create_posting_type("phrase", {"count": int, "tf_idf": float}, impact="tf_idf")
+
+
+def intersect_positions(starts: List[int], positions: List[int], offset: int) -> List[int]:
+    """
+    Keep the starts that positions has a position offset after, merging the two sorted lists.
+    """
+    matched = []
+    i = j = 0
+    while i < len(starts) and j < len(positions):
+        target = starts[i] + offset
+        if positions[j] < target:
+            j += 1
+        elif positions[j] > target:
+            i += 1
+        else:
+            matched.append(starts[i])
+            i += 1
+            j += 1
+    return matched
+
+
+def phrase_starts(positions: List[List[int]]) -> List[int]:
+    """
+    Find where the terms of a phrase occur one after the other.
+    :param positions: the sorted positions of each term of the phrase in one document, in phrase order
+    :return: the position of the first term of each occurrence of the phrase
+    """
+    starts = positions[0]
+    for offset in range(1, len(positions)):
+        if not starts:
+            break
+        starts = intersect_positions(starts, positions[offset], offset)
+    return starts
+
+
+def window_count(positions: List[List[int]], window: int) -> int:
+    """
+    Count the occurrences of the terms within window consecutive positions of each other, in any order. Each position
+    ends at most one occurrence, the shortest span of every term ending there.
+    :param positions: the sorted positions of each term in one document
+    """
+    events = sorted((position, term) for term, term_positions in enumerate(positions) for position in term_positions)
+    last = [None] * len(positions)
+    seen = 0
+    count = 0
+    for position, term in events:
+        if last[term] is None:
+            seen += 1
+        last[term] = position
+        if seen == len(positions) and position - min(last) < window:
+            count += 1
+    return count
+
+
+def intersect_iterators(iterators: List[PostingIterator],
+                        stop: Callable[[], bool] = None) -> Iterator[List[Posting]]:
+    """
+    Find the documents every iterator has a posting for, skipping through the iterators with advance_to.
+    :param stop: called every STOP_INTERVAL steps. Once it returns True, no more documents are found.
+    :return: the posting of each iterator for each common document in doc_id order
+    """
+    postings = [next(iterator, None) for iterator in iterators]
+    steps = 0
+    while all(posting is not None for posting in postings):
+        steps += 1
+        if stop and steps % STOP_INTERVAL == 0 and stop():
+            return
+        doc = max(posting.doc_id for posting in postings)
+        if all(posting.doc_id == doc for posting in postings):
+            yield postings
+            postings = [next(iterator, None) for iterator in iterators]
+        else:
+            postings = [posting if posting.doc_id >= doc else iterator.advance_to(doc)
+                        for posting, iterator in zip(postings, iterators)]
+
+
+def phrase_iterator(key: str, doc_ids: List[int], counts: List[int], scores: List[float]) -> PostingIterator:
+    """
+    Wrap the matches of a phrase in an iterator with block bounds, so they can be searched with Block-Max WAND like
+    the postings of a term.
+    """
+    blocks = []
+    for start in range(0, len(doc_ids), BLOCK_SIZE):
+        postings = [PHRASE_POSTING(doc_id, [count, score]) for doc_id, count, score in
+                    zip(doc_ids[start:start + BLOCK_SIZE], counts[start:start + BLOCK_SIZE],
+                        scores[start:start + BLOCK_SIZE])]
+        blocks.append(DecodedBlock(postings, postings[-1].doc_id, max(scores[start:start + BLOCK_SIZE])))
+    return CachedPostingIterator(key, blocks, PHRASE_POSTING, len(doc_ids))
+
+
+class PositionalScoring(SegmentedScoringScheme):
+    def __init__(self, dictionary: DocumentIdDictionary or DocumentStore, file: Optional[str],
+                 phrase_length: int = PHRASE_LENGTH, window: Optional[int] = None,
+                 cache: Optional[PostingCache] = None):
+        """
+        Score documents by the phrases of the query they contain, read from a positional index. A positional index
+        serves phrases of any length, so it replaces separate n-gram indexes.
+        :param dictionary: the documents of the index
+        :param file: the base name of the schemed posting file, or None when only building postings
+        :param phrase_length: the number of consecutive query words cursors match as one phrase
+        :param window: match the words of a phrase within window consecutive positions in any order instead of
+        one after the other
+        :param cache: decoded postings of hot words, which can be shared by several schemes
+        """
+        self.posting_type = create_posting_type("positional", {"count": int, "positions": list, "tf": float,
+                                                               "tf_idf": float}, impact="tf_idf")
+        self.dictionary = dictionary
+        self.phrase_length = phrase_length
+        self.window = window
+        self.file = file
+        self.cache = cache
+        self.lock = Lock()
+        self.open()
+
+    def open(self):
+        """
+        Open the segments of the index, like TfIdfScoring.open.
+        """
+        self.swap(Snapshot.open(self.file, None, self.posting_type))
+
+    def get_posting_type(self) -> Type[Posting]:
+        return self.posting_type
+
+    def create_posting(self, document: str, result: TokenizeResult) -> [Tuple[str, Posting]]:
+        postings = []
+        for token in result.tokens:
+            postings.append((token.word,
+                             self.posting_type(self.dictionary.find_doc_id(document),
+                                               {"count": token.count,
+                                                "positions": token.properties["positions"],
+                                                "tf": float(token.count) / result.total_count,
+                                                "tf_idf": 0})))
+        return postings
+
+    def finalize_posting(self, iterator: PostingIterator, weighted: bool = True) -> PostingBlock:
+        postings = iterator.read_block()
+        idf = math.log10(len(self.dictionary) / len(postings)) if weighted else 1.0
+        postings.set_column("tf_idf", [idf * math.log10(1 + tf) for tf in postings.column("tf")])
+        return postings
+
+    def matches(self, words: List[str], window: Optional[int] = None, snapshot: Optional[Snapshot] = None,
+                stop: Callable[[], bool] = None) -> Tuple[List[int], List[int], List[float]]:
+        """
+        Find the documents containing a phrase by intersecting the postings of its words and then their positions.
+        A single word matches every document containing it.
+        :param window: match the words within window consecutive positions in any order instead of one after the other
+        :param snapshot: the snapshot acquired for the query, or the current one held while matching if not given
+        :param stop: see intersect_iterators. Once it returns True, the documents matched so far are returned.
+        :return: the doc_ids, the number of occurrences of the phrase in each and its tf-idf weight in each
+        """
+        with self.pinned(snapshot) as snapshot:
+            assert snapshot.segments, "Did not provide a reader at initialization"
+            doc_ids, counts, tfs = [], [], []
+            iterators = [self.iterator(word, snapshot) for word in words]
+            if any(iterator is None for iterator in iterators):
+                return doc_ids, counts, []
+            positions = self.posting_type.INDEX["positions"]
+            for postings in intersect_iterators(iterators, stop):
+                occurrences = [posting.properties[positions] for posting in postings]
+                if window is not None:
+                    count = window_count(occurrences, window)
+                else:
+                    count = len(phrase_starts(occurrences))
+                if count:
+                    doc_ids.append(postings[0].doc_id)
+                    counts.append(count)
+                    # the tf of a word is its count over the length of the document
+                    tfs.append(count * postings[0].tf / postings[0].count)
+            if not doc_ids:
+                return doc_ids, counts, []
+            idf = math.log10(len(self.dictionary) / len(doc_ids))
+            return doc_ids, counts, [idf * math.log10(1 + tf) for tf in tfs]
+
+    def iterator(self, word: str, snapshot: Optional[Snapshot] = None) -> Optional[PostingIterator]:
+        """
+        The postings of word over the segments without deleted documents, or None if no segment has the word.
+        :param snapshot: the snapshot acquired for the query. The current one is read if not given.
+        """
+        snapshot = snapshot or self.snapshot
+        return snapshot.iterator(word, [self.cache.get_iterator(segment.reader, word) if self.cache
+                                        else segment.reader.get_iterator(word)
+                                        for segment in snapshot.segments if word in segment.reader])
+
+    def phrases(self, query: [str]) -> List[List[str]]:
+        """
+        Split a query into its phrases of phrase_length consecutive words. Shorter queries are a single phrase, and a
+        single word is not a phrase, so it is left to the schemes scoring words.
+        """
+        if len(query) < 2:
+            return []
+        if len(query) <= self.phrase_length:
+            return [query]
+        return [query[i:i + self.phrase_length] for i in range(len(query) - self.phrase_length + 1)]
+
+    def cursors(self, query: [str], factor: float = 1, champion: bool = False,
+                weights: Optional[TermWeights] = None, snapshot: Optional[Snapshot] = None,
+                stop: Callable[[], bool] = None) -> List[Cursor]:
+        """
+        Create a cursor for each phrase of the query over the documents containing it, weighted like the words of
+        TfIdfScoring. The matches are decoded, so the cursors do not read the snapshot.
+        :param champion: ignored, the positional index has no champion tier
+        :param weights: multiplies the weight of a phrase, keyed by its words joined by spaces
+        :param stop: see matches. Phrases are not matched once it returned True.
+        """
+        phrases = self.phrases(query)
+        counts = defaultdict(int)
+        for phrase in phrases:
+            counts[" ".join(phrase)] += 1
+        cursors = []
+        for key, count in counts.items():
+            if stop and stop():
+                break
+            doc_ids, occurrences, scores = self.matches(key.split(" "), self.window, snapshot, stop)
+            if not doc_ids:
+                continue
+            weight = (weights.get(key, 1.0) if weights else 1.0) * math.log10(1 + count / len(phrases))
+            weight *= math.log10(len(self.dictionary) / len(doc_ids))
+            cursors.append(Cursor(phrase_iterator(key, doc_ids, occurrences, scores), weight, max(scores)))
+        norm = math.sqrt(sum(cursor.weight ** 2 for cursor in cursors))
+        if not norm:
+            return []
+        for cursor in cursors:
+            cursor.weight *= factor / norm
+            cursor.bound *= factor / norm
+        return cursors
+
+    def search(self, query: [str], limit: int = 10, mode: QueryMode = AND,
+               weights: Optional[TermWeights] = None) -> List[Tuple[int, float]]:
+        """
+        The exact top documents for the phrases of the query, found with Block-Max WAND.
+        :param mode: the number of the phrases of the query a document has to contain
+        """
+        cursors = self.cursors(query, weights=weights)
+        return block_max_wand(cursors, limit, minimum=minimum_match(mode, len(cursors)))
+
+    def phrase(self, query: [str], limit: int = 10) -> List[Tuple[int, float]]:
+        """
+        The top documents containing the whole query as a phrase, or within window positions when a window is set.
+        """
+        doc_ids, _, scores = self.matches(query, self.window)
+        return sorted(zip(doc_ids, scores), key=lambda x: (-x[1], x[0]))[:limit]
+
+    def files(self) -> List[str]:
+        if not self.file:
+            return []
+        return [f"{self.file}.index", os.path.join(os.path.dirname(self.file), MANIFEST)]
+
+    def warm(self, queries: List[List[str]]):
+        if self.cache:
+            words = [word for query in queries for word in query]
+            with self.pinned() as snapshot:
+                for segment in snapshot.segments:
+                    self.cache.warm(segment.reader, words)
+
+    def invalidate(self):
+        if self.cache:
+            self.cache.invalidate()
+        if self.file:
+            self.open()
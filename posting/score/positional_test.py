@@ -0,0 +1,99 @@
+import glob
+import os
+import unittest
+
+from posting.cache import PostingCache, posting_size
+from posting.io import PostingWriter
+from posting.wand import STOP_INTERVAL
+from .positional import PositionalScoring, intersect_iterators, phrase_iterator, phrase_starts, window_count
+
+DOCUMENTS = {
+    0: "the quick brown fox jumps over the lazy dog",
+    1: "the brown quick fox",
+    2: "quick brown fox quick brown fox",
+    3: "a lazy brown dog",
+}
+
+
+class PositionTest(unittest.TestCase):
+    def test_phrase(self):
+        self.assertEqual(phrase_starts([[1, 5, 9], [2, 7, 10], [3, 11]]), [1, 9])
+        self.assertEqual(phrase_starts([[1], [3]]), [])
+
+    def test_window(self):
+        self.assertEqual(window_count([[1, 20], [3]], 3), 1)
+        self.assertEqual(window_count([[1, 20], [3]], 2), 0)
+        # the order of the terms does not matter
+        self.assertEqual(window_count([[5], [3]], 3), 1)
+
+
+class PositionalScoringTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        scheme = PositionalScoring(list(DOCUMENTS), None)
+        positions = dict()
+        for doc_id, text in DOCUMENTS.items():
+            words = text.split()
+            for position, word in enumerate(words):
+                positions.setdefault(word, dict()).setdefault(doc_id, []).append(position)
+        writer = PostingWriter("positional.test")
+        for word in sorted(positions):
+            writer.write_key(word)
+            writer.write(*[scheme.posting_type(doc_id, {"count": len(occurrences), "positions": occurrences,
+                                                        "tf": len(occurrences) / len(DOCUMENTS[doc_id].split()),
+                                                        "tf_idf": 0.0})
+                           for doc_id, occurrences in sorted(positions[word].items())])
+        writer.close()
+
+    def setUp(self) -> None:
+        self.scheme = PositionalScoring(list(DOCUMENTS), "positional.test")
+
+    def test_positions(self):
+        postings = list(self.scheme.iterator("fox"))
+        self.assertEqual([posting.positions for posting in postings], [[3], [3], [2, 5]])
+
+    def test_matches(self):
+        doc_ids, counts, _ = self.scheme.matches(["quick", "brown", "fox"])
+        self.assertEqual((doc_ids, counts), ([0, 2], [1, 2]))
+        doc_ids, counts, _ = self.scheme.matches(["brown", "quick"], window=2)
+        self.assertEqual((doc_ids, counts), ([0, 1, 2], [1, 1, 2]))
+        self.assertEqual(self.scheme.matches(["quick", "missing"]), ([], [], []))
+
+    def test_stop(self):
+        self.assertEqual(self.scheme.cursors(["quick", "brown", "fox"], stop=lambda: True), [])
+        doc_ids = list(range(0, 1000, 2))
+        iterators = [phrase_iterator(key, doc_ids, [1] * len(doc_ids), [1.0] * len(doc_ids)) for key in ("a", "b")]
+        calls = []
+        matched = list(intersect_iterators(iterators, lambda: calls.append(True) or True))
+        # the documents before the first call to stop were matched
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([postings[0].doc_id for postings in matched], doc_ids[:STOP_INTERVAL - 1])
+
+    def test_cache(self):
+        cache = PostingCache(1000 * posting_size(self.scheme.posting_type), admit=1)
+        scheme = PositionalScoring(list(DOCUMENTS), "positional.test", cache=cache)
+        try:
+            self.assertEqual(scheme.matches(["quick", "brown", "fox"]), self.scheme.matches(["quick", "brown", "fox"]))
+            self.assertIn(("positional.test", "quick"), cache.cache)
+            self.assertEqual(scheme.matches(["quick", "brown", "fox"]), self.scheme.matches(["quick", "brown", "fox"]))
+            self.assertGreater(cache.cache.hits, 0)
+        finally:
+            scheme.snapshot.release()
+
+    def test_search(self):
+        self.scheme.phrase_length = 2
+        self.assertEqual([doc_id for doc_id, _ in self.scheme.search(["quick", "brown", "fox"], 10)], [2, 0])
+        self.assertEqual(self.scheme.phrase(["lazy", "dog"]), self.scheme.phrase(["lazy", "dog"], 1))
+        self.assertEqual(self.scheme.phrase(["lazy", "dog"])[0][0], 0)
+
+    def tearDown(self) -> None:
+        self.scheme.snapshot.release()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        for g in glob.glob("positional.test.*"):
+            os.remove(g)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,13 +1,20 @@
-from posting.post import Posting
+from posting.post import Posting, PostingBlock
 from posting.io import PostingIterator, PostingReader
 from doc.doc_id import DocumentIdDictionary
+from doc.store import DocumentStore
 import math
-from typing import List, Tuple, Type, Optional
+import os
+import numpy as np
+from typing import Callable, Dict, Iterator, List, Tuple, Type, Optional
 from collections import defaultdict
-from posting.score import QueryScoringScheme
+from threading import Lock
+from posting.score import SegmentedScoringScheme
 from posting.tokenizer import TokenizeResult
-from posting import create_posting_type, intersect
-from statistics import mean, stdev
+from posting import create_posting_type
+from posting.cache import PostingCache
+from posting.segment import MANIFEST, Snapshot, rescale
+from posting.column import PostingColumns, intersect_columns, read_intersecting, top_k
+from posting.wand import AND, Cursor, QueryMode, block_max_wand, minimum_match
 
 
 def get_normalized_vector(v: List[float]):
@@ -21,49 +28,249 @@ def score_cosine(a: List[float], b: List[float]):
         i * j for i, j in zip(get_normalized_vector(a), get_normalized_vector(b)) if i is not None and j is not None)
 
 
-class TfIdfScoring(QueryScoringScheme):
-    def __init__(self, dictionary: DocumentIdDictionary, file: Optional[str]):
-        self.posting_type = create_posting_type("tf_idf", {"count": int, "tf": float, "tf_idf": float})
+def score_cosine_columns(query: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """
+    The cosine similarity of the query with each row of weights, as score_cosine computes for a single document.
+    A query without weight, such as one of words in every document, scores every row 0.
+    """
+    norm = np.sqrt(np.dot(query, query))
+    if not norm:
+        return np.zeros(len(weights))
+    query = query / norm
+    weights = weights.astype(np.float64)
+    norms = np.sqrt(np.einsum('ij,ij->i', weights, weights))
+    return np.divide(weights @ query, norms, out=np.zeros(len(weights)), where=norms > 0)
+
+
+class TfIdfScoring(SegmentedScoringScheme):
+    def __init__(self, dictionary: DocumentIdDictionary or DocumentStore, file: Optional[str],
+                 champion: Optional[str] = None, cache: Optional[PostingCache] = None):
+        """
+        :param dictionary: the documents of the index. Schemes that only score queries can share a DocumentStore.
+        :param file: the base name of the schemed posting file, or None when only building postings. The segments
+        named by the manifest in the same directory are searched with it, see posting.segment.
+        :param champion: the base name of the champion posting file written by indexer.champion
+        :param cache: decoded postings of hot words, which can be shared by several schemes
+        """
+        self.cache = cache
+        self.posting_type = create_posting_type("tf_idf", {"count": int, "tf": float, "tf_idf": float},
+                                                impact="tf_idf")
         self.dictionary = dictionary
-        if file:
-            self.reader = PostingReader(file, self.posting_type)
-        else:
-            self.reader = None
+        self.file = file
+        self.champion = champion
+        self.lock = Lock()
+        self.open()
+
+    def open(self):
+        """
+        Open the segments of the index at the generation of its manifest. The readers that are replaced are closed
+        once the queries still running on the previous snapshot finish.
+        """
+        self.swap(Snapshot.open(self.file, self.champion, self.posting_type))
 
     def get_posting_type(self) -> Type[Posting]:
         return self.posting_type
 
-    def score(self, query: [str]) -> List[Tuple[int, float]]:
-        assert self.reader is not None, "Did not provide a reader at initialization"
-        query_vec = []
-        word_dict = defaultdict(int)
-        counts = [self.reader.count(word) if word in self.reader.keys else 0 for word in query]
-        avg = mean(counts)
-        if len(query) > 2:
-            std = stdev(counts)
-            for word in query:
-                if word not in self.reader.keys:
+    def __contains__(self, word: str):
+        with self.pinned() as snapshot:
+            return word in snapshot
+
+    def count(self, word: str, snapshot: Optional[Snapshot] = None) -> int:
+        """
+        The number of documents containing word over every segment, including deleted documents that have not been
+        merged away yet.
+        """
+        with self.pinned(snapshot) as snapshot:
+            return snapshot.count(word)
+
+    def collection_size(self, snapshot: Optional[Snapshot] = None) -> int:
+        """
+        The number of documents idf is computed over. Like count, it includes deleted documents that have not been
+        merged away yet, so idf stays positive.
+        """
+        with self.pinned(snapshot) as snapshot:
+            return len(self.dictionary) + len(snapshot.tombstones)
+
+    def scales(self, word: str, snapshot: Optional[Snapshot] = None) -> List[float]:
+        """
+        The factors that turn the weights stored for word in each segment into tf-idf weights over the live documents
+        of every segment. Weighted segments store tf-idf over their own documents, others store unweighted term
+        frequencies. A weighted segment that weighted word by 0 keeps scoring it 0 until it is merged.
+        """
+        with self.pinned(snapshot) as snapshot:
+            if len(snapshot.segments) == 1 and snapshot.segments[0].weighted and not snapshot.tombstones:
+                return [1.0]
+            idf = math.log10(self.collection_size(snapshot) / snapshot.count(word))
+            scales = []
+            for segment in snapshot.segments:
+                if not segment.weighted:
+                    scales.append(idf)
                     continue
-                if self.reader.count(word) <= avg + 2 * std:
-                    word_dict[word] += 1
-        else:
+                count = segment.reader.count(word) if word in segment.reader else 0
+                documents = segment.documents if segment.documents is not None else len(self.dictionary)
+                segment_idf = math.log10(documents / count) if count else 0.0
+                scales.append(idf / segment_idf if segment_idf else 0.0)
+            return scales
+
+    def query_vector(self, query: [str], weights: Optional[Dict[str, float]] = None,
+                     snapshot: Optional[Snapshot] = None) -> Tuple[List[str], List[float]]:
+        """
+        Weight the words of the query that are in the index. Frequent words are kept: their low idf bounds their
+        contribution, so top-k retrieval skips most of their postings.
+        :param weights: multiplies the weight of a word, 1 for words not given. Weights must not be negative.
+        :return: the words and the tf-idf weight of each
+        """
+        with self.pinned(snapshot) as snapshot:
+            word_dict = defaultdict(int)
             for word in query:
-                if word not in self.reader.keys:
-                    continue
-                word_dict[word] += 1
-        for word in word_dict:
-            inverse_document_frequency = math.log10(len(self.dictionary) / self.reader.count(word))
-            query_vec.append((math.log10(1 + word_dict[word] / len(query))) * inverse_document_frequency)
-        iterators = []
-        for word in word_dict:
-            if word in self.reader.keys:
-                self.reader.seek(word)
-                iterators.append(self.reader.get_iterator())
-            else:
-                iterators.append(None)
-        iterator = intersect(*iterators)
-        for posting in iterator:
-            yield (posting.doc_id, score_cosine(query_vec, posting.get_properties("tf_idf")))
+                if word in snapshot:
+                    word_dict[word] += 1
+            query_vec = []
+            for word in word_dict:
+                inverse_document_frequency = math.log10(self.collection_size(snapshot) / snapshot.count(word))
+                weight = weights.get(word, 1.0) if weights else 1.0
+                query_vec.append(weight * math.log10(1 + word_dict[word] / len(query)) * inverse_document_frequency)
+            return list(word_dict), query_vec
+
+    def score_all(self, query: [str], mode: QueryMode = AND,
+                  weights: Optional[Dict[str, float]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Score every document matching the query words in a mode by the cosine of its weights for the words with the
+        query vector. Conjunctive queries intersect the postings. Other modes accumulate the weights of every
+        document term at a time. Segments hold disjoint documents, so each is scored on its own.
+        :return: the doc_ids in increasing order and their scores
+        """
+        with self.pinned() as snapshot:
+            assert snapshot.segments, "Did not provide a reader at initialization"
+            words, query_vec = self.query_vector(query, weights, snapshot)
+            minimum = minimum_match(mode, len(words))
+            if not words:
+                return np.zeros(0, dtype=np.int32), np.zeros(0)
+            scales = [self.scales(word, snapshot) for word in words]
+            results = [self.__segment__(segment.reader, words, [scale[i] for scale in scales], minimum)
+                       for i, segment in enumerate(snapshot.segments)]
+            doc_ids = np.concatenate([doc_ids for doc_ids, _ in results])
+            weights = np.concatenate([weights for _, weights in results])
+            if snapshot.tombstones:
+                live = np.array([doc_id not in snapshot.tombstones for doc_id in doc_ids.tolist()], dtype=bool)
+                doc_ids, weights = doc_ids[live], weights[live]
+            return doc_ids, score_cosine_columns(np.array(query_vec), weights)
+
+    @staticmethod
+    def __segment__(reader: PostingReader, words: List[str], scales: List[float],
+                    minimum: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        The documents of one segment matching minimum of the words, with their weight for each word.
+        """
+        present = [word in reader for word in words]
+        if sum(present) < minimum:
+            return np.zeros(0, dtype=np.int32), np.zeros((0, len(words)), dtype=np.float32)
+        if minimum == len(words):
+            postings = read_intersecting(reader, words)
+            doc_ids, index = intersect_columns(*postings)
+            weights = np.column_stack([posting["tf_idf"][idx] * scale
+                                       for posting, idx, scale in zip(postings, index, scales)])
+            return doc_ids, weights
+        postings = [PostingColumns.from_reader(reader, word) for word, found in zip(words, present) if found]
+        columns = [column for column, found in enumerate(present) if found]
+        doc_ids, inverse = np.unique(np.concatenate([posting.doc_ids for posting in postings]), return_inverse=True)
+        accumulators = np.zeros((len(doc_ids), len(words)), dtype=np.float32)
+        position = 0
+        for column, posting in zip(columns, postings):
+            accumulators[inverse[position:position + len(posting)], column] = posting["tf_idf"] * scales[column]
+            position += len(posting)
+        matched = np.bincount(inverse, minlength=len(doc_ids)) >= minimum
+        return doc_ids[matched], accumulators[matched]
+
+    def score(self, query: [str], mode: QueryMode = AND,
+              weights: Optional[Dict[str, float]] = None) -> Iterator[Tuple[int, float]]:
+        doc_ids, scores = self.score_all(query, mode, weights)
+        order = np.argsort(-scores, kind='stable')
+        yield from zip(doc_ids[order].tolist(), scores[order].tolist())
+
+    def top(self, query: [str], limit: int = 10, mode: QueryMode = AND,
+            weights: Optional[Dict[str, float]] = None) -> List[Tuple[int, float]]:
+        doc_ids, scores = self.score_all(query, mode, weights)
+        return top_k(doc_ids, scores, limit)
+
+    def has_champion(self) -> bool:
+        return any(segment.champion is not None for segment in self.snapshot.segments)
+
+    def files(self) -> List[str]:
+        if not self.file:
+            return []
+        files = [f"{file}.index" for file in (self.file, self.champion) if file]
+        return files + [os.path.join(os.path.dirname(self.file), MANIFEST)]
+
+    def invalidate(self):
+        if self.cache:
+            self.cache.invalidate()
+        if self.file:
+            self.open()
+
+    def warm(self, queries: List[List[str]]):
+        if self.cache:
+            words = [word for query in queries for word in query]
+            with self.pinned() as snapshot:
+                for segment in snapshot.segments:
+                    for reader in (segment.reader, segment.champion):
+                        if reader:
+                            self.cache.warm(reader, words)
+
+    def cursors(self, query: [str], factor: float = 1, champion: bool = False,
+                weights: Optional[Dict[str, float]] = None, snapshot: Optional[Snapshot] = None,
+                stop: Callable[[], bool] = None) -> List[Cursor]:
+        """
+        Create a cursor for each selected query word. A document scores the sum of its tf-idf weights for the words
+        weighted by the normalized query vector, which is the cosine numerator and can be bounded per block. The
+        cursor of a word reads the segments of one snapshot in doc_id order, skipping deleted documents.
+        :param champion: read the champion tier of the segments that have one. Words are still selected and weighted
+        by the full postings.
+        :param snapshot: the snapshot acquired for the query. The current one is read if not given, which the cursors
+        may outlive once the index is rebuilt.
+        :param stop: ignored, the cursors read their postings as they are searched
+        """
+        snapshot = snapshot or self.snapshot
+        assert snapshot.segments, "Did not provide a reader at initialization"
+        words, query_vec = self.query_vector(query, weights, snapshot)
+        norm = math.sqrt(sum(weight ** 2 for weight in query_vec))
+        if not norm:
+            return []
+        cursors = []
+        impact = self.posting_type.INDEX["tf_idf"]
+        for word, weight in zip(words, query_vec):
+            scales = self.scales(word, snapshot)
+            readers = [(segment.champion if champion and segment.champion else segment.reader, scale)
+                       for segment, scale in zip(snapshot.segments, scales)]
+            readers = [(reader, scale) for reader, scale in readers if word in reader]
+            if not readers:
+                continue
+            # impacts are read on the scale of the first segment that weights the word, and the other segments are
+            # rescaled to it
+            scale = next((scale for _, scale in readers if scale > 0), 1.0)
+            iterators = []
+            bound = 0.0
+            for reader, segment_scale in readers:
+                if segment_scale != scale:
+                    iterators.append(rescale(reader.get_iterator(word), impact, segment_scale / scale))
+                elif self.cache:
+                    iterators.append(self.cache.get_iterator(reader, word))
+                else:
+                    iterators.append(reader.get_iterator(word))
+                bound = max(bound, reader.impact(word) * segment_scale / scale)
+            cursors.append(Cursor(snapshot.iterator(word, iterators), factor * weight / norm * scale, bound))
+        return cursors
+
+    def search(self, query: [str], limit: int = 10, mode: QueryMode = AND,
+               weights: Optional[Dict[str, float]] = None) -> List[Tuple[int, float]]:
+        """
+        The exact top documents for the query, found with Block-Max WAND.
+        :param mode: the number of the query words a document has to contain
+        :param weights: multiplies the weight of a word, 1 for words not given
+        """
+        with self.pinned() as snapshot:
+            cursors = self.cursors(query, weights=weights, snapshot=snapshot)
+            return block_max_wand(cursors, limit, minimum=minimum_match(mode, len(cursors)))
 
     def create_posting(self, document: str, result: TokenizeResult) -> [Tuple[str, Posting]]:
         postings = []
@@ -75,11 +282,10 @@ class TfIdfScoring(QueryScoringScheme):
                                                 "count": token.count})))
         return postings
 
-    def finalize_posting(self, iterator: PostingIterator) -> [Posting]:
-        postings = list(iterator)
-        idf = math.log10(len(self.dictionary.doc_id) / len(postings))
-        for posting in postings:
-            posting.set_property("tf_idf", idf * math.log10(1 + posting.get_property("tf")))
+    def finalize_posting(self, iterator: PostingIterator, weighted: bool = True) -> PostingBlock:
+        postings = iterator.read_block()
+        idf = math.log10(len(self.dictionary) / len(postings)) if weighted else 1.0
+        postings.set_column("tf_idf", [idf * math.log10(1 + tf) for tf in postings.column("tf")])
         return postings
 
 
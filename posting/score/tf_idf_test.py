@@ -0,0 +1,104 @@
+import math
+import os
+import random
+import shutil
+import unittest
+
+import numpy as np
+
+from posting.io import PostingWriter
+from posting.segment import write_statistics
+from posting.wand import AND, OR, block_max_wand, minimum_match
+from .tf_idf import TfIdfScoring, score_cosine_columns
+
+WORDS = ["a", "b", "c", "d", "e", "f"]
+
+
+class CosineTest(unittest.TestCase):
+    def test_columns(self):
+        weights = np.array([[3.0, 4.0], [0.0, 0.0], [1.0, 0.0]], dtype=np.float32)
+        np.testing.assert_allclose(score_cosine_columns(np.array([1.0, 0.0]), weights), [0.6, 0.0, 1.0])
+        self.assertEqual(score_cosine_columns(np.zeros(2), weights).tolist(), [0.0, 0.0, 0.0])
+
+
+class ScoreAllTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        generator = random.Random(5)
+        documents = [[generator.choice(WORDS[:generator.randint(1, len(WORDS))])
+                      for _ in range(generator.randint(1, 12))] for _ in range(400)]
+        scheme = TfIdfScoring([], None)
+        # the tf-idf weight of each word in each document containing it
+        cls.weights = [dict() for _ in documents]
+        os.makedirs("taat.test", exist_ok=True)
+        writer = PostingWriter("taat.test/schemed")
+        for word in WORDS:
+            containing = [doc_id for doc_id, tokens in enumerate(documents) if word in tokens]
+            idf = math.log10(len(documents) / len(containing))
+            writer.write_key(word)
+            postings = []
+            for doc_id in containing:
+                count = documents[doc_id].count(word)
+                tf = count / len(documents[doc_id])
+                cls.weights[doc_id][word] = idf * math.log10(1 + tf)
+                postings.append(scheme.posting_type(doc_id, [count, tf, cls.weights[doc_id][word]]))
+            writer.write(*postings)
+        writer.close()
+        write_statistics("taat.test", len(documents))
+        cls.documents = len(documents)
+
+    def setUp(self) -> None:
+        self.scheme = TfIdfScoring(list(range(self.documents)), "taat.test/schemed")
+
+    def reference(self, query, mode):
+        """
+        The scores of every matching document computed directly: the cosine numerator block_max_wand ranks by and the
+        cosine score_all returns.
+        """
+        words, query_vec = self.scheme.query_vector(query)
+        query_vec = np.array(query_vec) / np.linalg.norm(query_vec)
+        minimum = minimum_match(mode, len(words))
+        numerators, cosines = dict(), dict()
+        for doc_id, weights in enumerate(self.weights):
+            vector = np.array([weights.get(word, 0.0) for word in words])
+            if np.count_nonzero(vector) >= max(minimum, 1):
+                numerators[doc_id] = float(vector @ query_vec)
+                cosines[doc_id] = numerators[doc_id] / float(np.linalg.norm(vector))
+        return numerators, cosines
+
+    @staticmethod
+    def ranked(scores, limit):
+        return sorted(scores.values(), reverse=True)[:limit]
+
+    def test_modes(self):
+        for query in (["a", "b"], ["b", "c", "e"], ["a", "d", "d", "f"], ["c", "e", "f", "b"]):
+            for mode in (AND, OR, 2):
+                numerators, cosines = self.reference(query, mode)
+                doc_ids, scores = self.scheme.score_all(query, mode)
+                self.assertEqual(doc_ids.tolist(), sorted(cosines))
+                np.testing.assert_allclose(scores, [cosines[doc_id] for doc_id in doc_ids.tolist()], rtol=1e-5)
+                # both evaluators select the same documents, and rank them by their own score
+                cursors = self.scheme.cursors(query)
+                everything = block_max_wand(cursors, self.documents, minimum=minimum_match(mode, len(cursors)))
+                self.assertEqual(sorted(doc_id for doc_id, _ in everything), doc_ids.tolist())
+                for limit in (1, 5, 20):
+                    top = self.scheme.top(query, limit, mode)
+                    np.testing.assert_allclose([score for _, score in top], self.ranked(cosines, limit), rtol=1e-5)
+                    for doc_id, score in top:
+                        self.assertAlmostEqual(score, cosines[doc_id], places=5)
+                    wand = self.scheme.search(query, limit, mode)
+                    np.testing.assert_allclose([score for _, score in wand], self.ranked(numerators, limit),
+                                               rtol=1e-5)
+                    for doc_id, score in wand:
+                        self.assertAlmostEqual(score, numerators[doc_id], places=5)
+
+    def tearDown(self) -> None:
+        self.scheme.snapshot.release()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        shutil.rmtree("taat.test", ignore_errors=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,454 @@
+import json
+import os
+import shutil
+import tempfile
+from threading import Lock
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .cache import CachedPostingIterator, DecodedBlock, decode
+from .io import PostingIterator, PostingReader
+from .post import Posting, PostingBlock
+
+# the live segments of an index and its tombstones at one generation. Renaming a new manifest over the old one commits
+# every change to the index at once.
+MANIFEST = "manifest.json"
+# the directory segments written after the full build are kept in, one subdirectory per segment
+SEGMENTS = "segments"
+# the segment written by a full build, whose files are in the directory of the index itself
+MAIN = "."
+# the bitmap of the doc_ids deleted from the segments of an index, suffixed by the generation that wrote it
+TOMBSTONES = "tombstones"
+# the number of documents the schemed files of a segment were weighted with and the first doc_id of the segment
+STATISTICS = "statistics.json"
+# the files of the main segment, removed once it is merged into another segment
+MAIN_FILES = ("finalized", "schemed", "champion", "statistics")
+
+# the number of adjacent segments of a tier merged at once
+MERGE_FACTOR = 4
+# the number of live documents below which segments are all in the smallest tier
+MERGE_FLOOR = 1000
+# the fraction of deleted documents at which a segment is merged on its own to drop them
+DELETED_RATIO = 0.5
+
+
+class Tombstones:
+    """
+    The doc_ids deleted from an index, stored as a bitmap with one bit per doc_id. Postings of deleted documents stay
+    in their segment until it is merged, and are skipped by SegmentedPostingIterator.
+    """
+
+    def __init__(self, bitmap: bytes = b""):
+        self.bitmap = bytearray(bitmap)
+        self.count = sum(bin(byte).count("1") for byte in self.bitmap)
+
+    @classmethod
+    def load(cls, file_name: str) -> "Tombstones":
+        """
+        Read the tombstones of an index, or none if the index has no deleted documents.
+        """
+        if not os.path.exists(file_name):
+            return cls()
+        with open(file_name, 'rb') as f:
+            return cls(f.read())
+
+    def save(self, file_name: str):
+        """
+        Write the bitmap under a temporary name and rename it over file_name, so readers never see a partial bitmap.
+        """
+        with open(f"{file_name}.tmp", 'wb') as f:
+            f.write(self.bitmap)
+        os.replace(f"{file_name}.tmp", file_name)
+
+    def add(self, doc_id: int):
+        if doc_id >> 3 >= len(self.bitmap):
+            self.bitmap.extend(bytes((doc_id >> 3) + 1 - len(self.bitmap)))
+        if not self.bitmap[doc_id >> 3] & (1 << (doc_id & 7)):
+            self.bitmap[doc_id >> 3] |= 1 << (doc_id & 7)
+            self.count += 1
+
+    def remove(self, doc_id: int):
+        if doc_id in self:
+            self.bitmap[doc_id >> 3] &= ~(1 << (doc_id & 7)) & 0xFF
+            self.count -= 1
+
+    def __contains__(self, doc_id: int):
+        return doc_id >> 3 < len(self.bitmap) and bool(self.bitmap[doc_id >> 3] & (1 << (doc_id & 7)))
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self) -> Iterable[int]:
+        for index, byte in enumerate(self.bitmap):
+            for bit in range(8):
+                if byte & (1 << bit):
+                    yield index * 8 + bit
+
+
+def read_statistics(name: str) -> Optional[Dict[str, int]]:
+    """
+    Read the statistics a segment was written with, or None for segments written without them.
+    :param name: the directory of the segment
+    """
+    if not os.path.exists(f"{name}/{STATISTICS}"):
+        return None
+    with open(f"{name}/{STATISTICS}") as f:
+        return json.load(f)
+
+
+def write_statistics(name: str, documents: int, weighted: bool = True, first: int = 0):
+    """
+    :param documents: the number of documents of the segment, which its tf-idf weights were computed over
+    :param weighted: whether the schemed postings hold tf-idf weights or unweighted term frequencies
+    :param first: the first doc_id of the segment. Segments hold consecutive ranges of doc_ids.
+    """
+    with open(f"{name}/{STATISTICS}.tmp", 'w') as f:
+        json.dump({"documents": documents, "weighted": weighted, "first": first}, f)
+    os.replace(f"{name}/{STATISTICS}.tmp", f"{name}/{STATISTICS}")
+
+
+def rescale(iterator: PostingIterator, impact: int, scale: float) -> PostingIterator:
+    """
+    Decode the postings of a key and multiply their impacts by scale, for small segments whose weights are on another
+    scale than the segment they are searched with.
+    """
+    blocks = []
+    for block in decode(iterator):
+        postings = []
+        for posting in block.postings:
+            properties = list(posting.properties)
+            properties[impact] *= scale
+            postings.append(iterator.posting(posting.doc_id, properties))
+        blocks.append(DecodedBlock(postings, block.last_doc_id, block.block_max * scale))
+    return CachedPostingIterator(iterator.current, blocks, iterator.posting, iterator.count)
+
+
+class SegmentedPostingIterator(PostingIterator):
+    """
+    The postings of a key over several segments, skipping deleted documents. Each segment holds larger doc_ids than
+    the ones before it, so the iterators are read one after the other and stay in doc_id order.
+    """
+
+    def __init__(self, key: str, iterators: List[PostingIterator], tombstones: Tombstones):
+        self.iterators = iterators
+        self.tombstones = tombstones
+        self.index = 0
+        self.posting = iterators[0].posting
+        self.current = key
+        self.count = sum(iterator.count or 0 for iterator in iterators)
+        self.end = False
+
+    def __live__(self, posting: Optional[Posting]) -> Optional[Posting]:
+        """
+        Skip deleted postings, moving to the next segment when a segment ends.
+        """
+        while self.index < len(self.iterators):
+            while posting is not None and posting.doc_id in self.tombstones:
+                posting = next(self.iterators[self.index], None)
+            if posting is not None:
+                return posting
+            self.index += 1
+            if self.index < len(self.iterators):
+                posting = next(self.iterators[self.index], None)
+        self.end = True
+        return None
+
+    def __next__(self) -> Posting:
+        if self.index >= len(self.iterators):
+            raise StopIteration
+        posting = self.__live__(next(self.iterators[self.index], None))
+        if posting is None:
+            raise StopIteration
+        return posting
+
+    def advance_to(self, doc_id: int) -> Optional[Posting]:
+        while self.index < len(self.iterators):
+            posting = self.iterators[self.index].advance_to(doc_id)
+            if posting is not None:
+                return self.__live__(posting)
+            self.index += 1
+        self.end = True
+        return None
+
+    def block_bound(self, doc_id: int) -> Optional[Tuple[int, float]]:
+        while self.index < len(self.iterators):
+            bound = self.iterators[self.index].block_bound(doc_id)
+            if bound is not None:
+                return bound
+            self.index += 1
+        return None
+
+    def read_block(self) -> PostingBlock:
+        """
+        Read the remaining live postings of every segment into a PostingBlock.
+        """
+        block = PostingBlock(self.posting)
+        while self.index < len(self.iterators):
+            read = self.iterators[self.index].read_block()
+            live = [i for i, doc_id in enumerate(read.doc_ids) if doc_id not in self.tombstones]
+            if len(live) < len(read):
+                read = read.take(live)
+            block.extend(read.doc_ids, read.columns)
+            self.index += 1
+        self.end = True
+        return block
+
+
+class Manifest:
+    def __init__(self, generation: int = 0, segments: Optional[List[str]] = None, tombstones: Optional[str] = None,
+                 counter: int = 0):
+        """
+        The segments of an index at one generation.
+        :param segments: the directories of the segments relative to the index, in doc_id order
+        :param tombstones: the file of the deleted doc_ids relative to the index, or None if none were deleted
+        :param counter: the doc_id of the next document added to the index. Doc_ids of deleted documents are not
+        reused, so segments added later hold larger doc_ids.
+        """
+        self.generation = generation
+        self.segments = segments if segments is not None else [MAIN]
+        self.tombstones = tombstones
+        self.counter = counter
+
+    def to_dict(self):
+        return {"generation": self.generation, "segments": self.segments, "tombstones": self.tombstones,
+                "counter": self.counter}
+
+
+def read_manifest(name: str) -> Manifest:
+    """
+    Read the manifest of an index. Indexes built before manifests are the main segment alone.
+    :param name: the directory of the index
+    """
+    if not os.path.exists(os.path.join(name, MANIFEST)):
+        return Manifest()
+    with open(os.path.join(name, MANIFEST)) as f:
+        manifest = json.load(f)
+    return Manifest(manifest["generation"], manifest["segments"], manifest["tombstones"], manifest["counter"])
+
+
+def write_manifest(name: str, manifest: Manifest):
+    """
+    Commit a manifest. It is synced to disk under a temporary name and renamed over the old manifest, so after a crash
+    the index is at either generation and never sees a segment that was not completely written.
+    """
+    with open(f"{name}/{MANIFEST}.tmp", 'w') as f:
+        json.dump(manifest.to_dict(), f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(f"{name}/{MANIFEST}.tmp", f"{name}/{MANIFEST}")
+
+
+# serializes the commits of the updates and merges of each index within a process
+COMMIT_LOCKS: Dict[str, Lock] = dict()
+COMMIT_LOCKS_LOCK = Lock()
+
+
+def commit_lock(name: str) -> Lock:
+    """
+    The lock held while reading, changing and writing the manifest of an index, so an update and a merge committing at
+    the same time do not lose each other's changes.
+    """
+    with COMMIT_LOCKS_LOCK:
+        return COMMIT_LOCKS.setdefault(os.path.abspath(name), Lock())
+
+
+def save_tombstones(name: str, generation: int, tombstones: Tombstones) -> Optional[str]:
+    """
+    Write the tombstones of a generation next to the manifest that names them.
+    :return: the file name to put in the manifest
+    """
+    if not tombstones:
+        return None
+    tombstones.save(f"{name}/{TOMBSTONES}.{generation}")
+    return f"{TOMBSTONES}.{generation}"
+
+
+def new_segment(name: str) -> str:
+    """
+    Create an empty directory for a segment that no manifest names yet.
+    :return: the directory relative to the index
+    """
+    os.makedirs(f"{name}/{SEGMENTS}", exist_ok=True)
+    return os.path.relpath(tempfile.mkdtemp(dir=f"{name}/{SEGMENTS}"), name)
+
+
+def recover(name: str) -> Manifest:
+    """
+    Remove the files of an index that its manifest does not name: segments and tombstones of older generations and
+    whatever a crashed update or merge left half written. Only call it when no update or merge of the index is running.
+    """
+    manifest = read_manifest(name)
+    live = set(manifest.segments)
+    if os.path.isdir(f"{name}/{SEGMENTS}"):
+        for segment in os.listdir(f"{name}/{SEGMENTS}"):
+            if f"{SEGMENTS}/{segment}" not in live:
+                shutil.rmtree(f"{name}/{SEGMENTS}/{segment}", ignore_errors=True)
+    for file in os.listdir(name):
+        if file.startswith(TOMBSTONES) and file != manifest.tombstones or file.endswith(".tmp"):
+            os.remove(f"{name}/{file}")
+        elif MAIN not in live and file.split(".")[0] in MAIN_FILES:
+            os.remove(f"{name}/{file}")
+    return manifest
+
+
+class Segment:
+    def __init__(self, name: str, reader: PostingReader, champion: Optional[PostingReader],
+                 statistics: Optional[Dict]):
+        """
+        A segment of an index opened for reading. Each segment has its own postings and term dictionary.
+        :param name: the directory of the segment relative to the index
+        :param champion: the champion tier of the segment, if it has one
+        :param statistics: see write_statistics, or None for main segments written before statistics
+        """
+        self.name = name
+        self.reader = reader
+        self.champion = champion
+        self.documents = statistics["documents"] if statistics else None
+        self.weighted = statistics["weighted"] if statistics else True
+        self.first = statistics.get("first", 0) if statistics else 0
+
+
+class Snapshot:
+    def __init__(self, generation: int, segments: List[Segment], tombstones: Tombstones):
+        """
+        The segments of an index at one generation, opened for reading. Schemes replace their snapshot with a single
+        assignment when the manifest changes, and every query reads the snapshot it started with, so queries keep
+        being served from the old generation while segments are merged. The scheme and each query reading the
+        snapshot hold a reference to it, and the readers are closed once the last one is released.
+        """
+        self.generation = generation
+        self.segments = segments
+        self.tombstones = tombstones
+        self.references = 1
+        self.lock = Lock()
+
+    @classmethod
+    def open(cls, file: Optional[str], champion: Optional[str], posting: type) -> "Snapshot":
+        """
+        Open the segments named by the manifest next to the main segment.
+        :param file: the base name of the schemed posting file of the main segment, or None for an empty snapshot
+        :param champion: the base name of the champion posting file of the main segment
+        """
+        if file is None:
+            return cls(0, [], Tombstones())
+        directory = os.path.dirname(file)
+        while True:
+            manifest = read_manifest(directory)
+            try:
+                return cls.__open__(directory, manifest, file, champion, posting)
+            except FileNotFoundError:
+                # a merge committed and its inputs were removed since the manifest was read
+                if read_manifest(directory).generation == manifest.generation:
+                    raise
+
+    @classmethod
+    def __open__(cls, directory: str, manifest: Manifest, file: str, champion: Optional[str],
+                 posting: type) -> "Snapshot":
+        segments = []
+        for name in manifest.segments:
+            if name == MAIN:
+                schemed, champion_file = file, champion
+            else:
+                schemed, champion_file = os.path.join(directory, name, "schemed"), None
+                if os.path.exists(os.path.join(directory, name, "champion.index")):
+                    champion_file = os.path.join(directory, name, "champion")
+            reader = PostingReader(schemed, posting, memory_map=True)
+            champion_reader = PostingReader(champion_file, posting, memory_map=True) if champion_file else None
+            segments.append(Segment(name, reader, champion_reader,
+                                    read_statistics(os.path.join(directory, name))))
+        tombstones = Tombstones()
+        if manifest.tombstones is not None:
+            with open(os.path.join(directory, manifest.tombstones), 'rb') as f:
+                tombstones = Tombstones(f.read())
+        return cls(manifest.generation, segments, tombstones)
+
+    def acquire(self) -> "Snapshot":
+        """
+        Take a reference for a query, so the readers stay open until it releases the snapshot.
+        """
+        with self.lock:
+            assert self.references > 0, "The snapshot was closed"
+            self.references += 1
+        return self
+
+    def release(self):
+        """
+        Drop a reference, closing the readers of the segments with the last one.
+        """
+        with self.lock:
+            self.references -= 1
+            closed = self.references == 0
+        if closed:
+            for segment in self.segments:
+                segment.reader.close()
+                if segment.champion is not None:
+                    segment.champion.close()
+
+    def __contains__(self, key: str):
+        return any(key in segment.reader for segment in self.segments)
+
+    def count(self, key: str) -> int:
+        """
+        The number of postings of key over every segment, including the ones of deleted documents.
+        """
+        return sum(segment.reader.count(key) for segment in self.segments if key in segment.reader)
+
+    def iterator(self, key: str, iterators: List[PostingIterator]) -> Optional[PostingIterator]:
+        """
+        Chain the iterators of key over the segments, skipping deleted documents.
+        :param iterators: the iterator of each segment that has key, in segment order
+        """
+        if not iterators:
+            return None
+        if len(iterators) > 1 or self.tombstones:
+            return SegmentedPostingIterator(key, iterators, self.tombstones)
+        return iterators[0]
+
+
+def load_tombstones(name: str, manifest: Manifest) -> Tombstones:
+    return Tombstones.load(f"{name}/{manifest.tombstones}") if manifest.tombstones else Tombstones()
+
+
+def segment_sizes(name: str, manifest: Manifest) -> List[Tuple[int, int]]:
+    """
+    :return: the number of documents and deleted documents of each segment of the manifest
+    """
+    tombstones = load_tombstones(name, manifest)
+    statistics = [read_statistics(os.path.join(name, segment)) or {"documents": 0, "first": 0}
+                  for segment in manifest.segments]
+    firsts = [segment.get("first", 0) for segment in statistics]
+    deleted = [0] * len(statistics)
+    for doc_id in tombstones:
+        index = 0
+        while index + 1 < len(firsts) and firsts[index + 1] <= doc_id:
+            index += 1
+        deleted[index] += 1
+    return [(segment["documents"], count) for segment, count in zip(statistics, deleted)]
+
+
+def tiered_merge(sizes: List[Tuple[int, int]], factor: int = MERGE_FACTOR,
+                 floor: int = MERGE_FLOOR) -> Optional[Tuple[int, int]]:
+    """
+    Pick the segments to merge next. Segments are in tiers by their number of live documents, each tier factor times
+    larger than the one below it, and factor adjacent segments of the same tier are merged into one of the next tier,
+    so each document is merged about log(documents / floor) / log(factor) times. Only adjacent segments are merged to
+    keep segments in doc_id order. The smallest tiers are merged first. A segment with DELETED_RATIO of its documents
+    deleted is merged on its own to drop them.
+    :param sizes: the number of documents and deleted documents of each segment, see segment_sizes
+    :return: the range of segments to merge, or None when the index is balanced
+    """
+    for index, (documents, deleted) in enumerate(sizes):
+        if documents and deleted >= DELETED_RATIO * documents:
+            return index, index + 1
+    tiers = []
+    for documents, deleted in sizes:
+        live, tier = documents - deleted, 0
+        while live >= floor * factor ** (tier + 1):
+            tier += 1
+        tiers.append(tier)
+    for tier in sorted(set(tiers)):
+        run = 0
+        for index, segment_tier in enumerate(tiers):
+            run = run + 1 if segment_tier == tier else 0
+            if run == factor:
+                return index + 1 - factor, index + 1
+    return None
@@ -0,0 +1,223 @@
+import math
+import os
+import shutil
+import unittest
+
+from .io import PostingReader, PostingWriter
+from .post import create_posting_type
+from .score.tf_idf import TfIdfScoring
+from .segment import MAIN, MANIFEST, Manifest, SegmentedPostingIterator, Tombstones, read_manifest, recover
+from .segment import save_tombstones, segment_sizes, tiered_merge, write_manifest, write_statistics
+
+SEGMENT_POSTING = create_posting_type("segment_type", {"count": int, "weight": float}, impact="weight")
+
+DOCUMENTS = {
+    0: "apple banana apple",
+    1: "banana cherry",
+    2: "apple cherry cherry date",
+    3: "date",
+    4: "apple date banana",
+    5: "cherry banana banana",
+}
+
+
+def write_segment(name: str, documents, collection):
+    """
+    Write the tf-idf postings of documents, weighted over collection, or unweighted when collection is None.
+    """
+    os.makedirs(os.path.dirname(name), exist_ok=True)
+    scheme = TfIdfScoring([], None)
+    words = dict()
+    for doc_id in documents:
+        tokens = DOCUMENTS[doc_id].split()
+        for word in sorted(set(tokens)):
+            words.setdefault(word, []).append((doc_id, tokens.count(word), tokens.count(word) / len(tokens)))
+    writer = PostingWriter(name)
+    for word in sorted(words):
+        idf = 1.0
+        if collection is not None:
+            idf = math.log10(len(collection) / sum(word in DOCUMENTS[doc].split() for doc in collection))
+        writer.write_key(word)
+        writer.write(*[scheme.posting_type(doc_id, [count, tf, idf * math.log10(1 + tf)])
+                       for doc_id, count, tf in words[word]])
+    writer.close()
+
+
+class TombstonesTest(unittest.TestCase):
+    def test_bitmap(self):
+        tombstones = Tombstones()
+        for doc_id in (3, 17, 3):
+            tombstones.add(doc_id)
+        self.assertEqual((len(tombstones), list(tombstones)), (2, [3, 17]))
+        self.assertIn(17, tombstones)
+        self.assertNotIn(4, tombstones)
+        self.assertNotIn(1000, tombstones)
+        tombstones.remove(3)
+        tombstones.remove(4)
+        self.assertEqual((len(tombstones), list(tombstones)), (1, [17]))
+        tombstones.add(3)
+        tombstones.save("tombstones.test")
+        self.assertEqual(list(Tombstones.load("tombstones.test")), [3, 17])
+        self.assertEqual(len(Tombstones.load("missing.test")), 0)
+        os.remove("tombstones.test")
+
+
+class SegmentedPostingIteratorTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        for name, doc_ids in (("main.test", range(0, 300, 2)), ("delta.test", range(300, 400, 3))):
+            writer = PostingWriter(name)
+            writer.write_key("a")
+            writer.write(*[SEGMENT_POSTING(doc_id, [1, 1.0]) for doc_id in doc_ids])
+            writer.close()
+
+    def setUp(self) -> None:
+        self.readers = [PostingReader(name, SEGMENT_POSTING, memory_map=True) for name in ("main.test", "delta.test")]
+        self.tombstones = Tombstones()
+        for doc_id in (0, 2, 298, 300, 303):
+            self.tombstones.add(doc_id)
+
+    def iterator(self) -> SegmentedPostingIterator:
+        return SegmentedPostingIterator("a", [reader.get_iterator("a") for reader in self.readers], self.tombstones)
+
+    def test_iterate(self):
+        expected = [doc_id for doc_id in [*range(0, 300, 2), *range(300, 400, 3)] if doc_id not in self.tombstones]
+        self.assertEqual([posting.doc_id for posting in self.iterator()], expected)
+
+    def test_advance(self):
+        iterator = self.iterator()
+        self.assertEqual(iterator.advance_to(297).doc_id, 306)
+        self.assertEqual(next(iterator).doc_id, 309)
+        self.assertIsNone(iterator.advance_to(400))
+
+    def test_read_block(self):
+        iterator = self.iterator()
+        self.assertEqual(iterator.advance_to(290).doc_id, 290)
+        block = iterator.read_block()
+        self.assertEqual(list(block.doc_ids), [292, 294, 296, *range(306, 400, 3)])
+        self.assertEqual([posting.doc_id for posting in block], list(block.doc_ids))
+        self.assertTrue(iterator.end)
+
+    def tearDown(self) -> None:
+        for reader in self.readers:
+            reader.close()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        for name in ("main.test", "delta.test"):
+            for extension in (".index", ".index.position"):
+                os.remove(name + extension)
+
+
+class SegmentedScoringTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        # documents 0 to 3 were indexed, 4 was added and then 5, and 1 was deleted
+        write_segment("segments.test/schemed", [0, 1, 2, 3], [0, 1, 2, 3])
+        write_statistics("segments.test", 4)
+        for doc_id in (4, 5):
+            write_segment(f"segments.test/segments/{doc_id}/schemed", [doc_id], None)
+            write_statistics(f"segments.test/segments/{doc_id}", 1, weighted=False, first=doc_id)
+        write_segment("single.test/schemed", list(DOCUMENTS), list(DOCUMENTS))
+        write_statistics("single.test", len(DOCUMENTS))
+        tombstones = Tombstones()
+        tombstones.add(1)
+        for name, segments in (("segments.test", [MAIN, "segments/4", "segments/5"]), ("single.test", [MAIN])):
+            write_manifest(name, Manifest(1, segments, save_tombstones(name, 1, tombstones), len(DOCUMENTS)))
+
+    def setUp(self) -> None:
+        live = [doc_id for doc_id in DOCUMENTS if doc_id != 1]
+        self.segments = TfIdfScoring(live, "segments.test/schemed")
+        self.single = TfIdfScoring(live, "single.test/schemed")
+
+    def test_consistent(self):
+        # the segments score every query as an index built over every document at once
+        for query in (["apple"], ["banana", "cherry"], ["apple", "date", "date"], ["cherry"]):
+            for mode in ("and", "or"):
+                expected = self.single.search(query, 10, mode)
+                actual = self.segments.search(query, 10, mode)
+                self.assertEqual([doc_id for doc_id, _ in actual], [doc_id for doc_id, _ in expected])
+                for (_, a), (_, b) in zip(actual, expected):
+                    self.assertAlmostEqual(a, b)
+                doc_ids, scores = self.segments.score_all(query, mode)
+                expected_ids, expected_scores = self.single.score_all(query, mode)
+                self.assertEqual(list(doc_ids), list(expected_ids))
+                for a, b in zip(scores, expected_scores):
+                    self.assertAlmostEqual(a, b)
+        self.assertNotIn(1, [doc_id for doc_id, _ in self.segments.search(["banana"], 10, "or")])
+
+    def test_snapshot(self):
+        expected = self.segments.search(["banana"], 10, "or")
+        snapshot = self.segments.snapshot
+        manifest = read_manifest("segments.test")
+        write_manifest("segments.test", Manifest(2, [MAIN], None, manifest.counter))
+        # queries read the snapshot they started with until the scheme is invalidated
+        self.assertIs(self.segments.snapshot, snapshot)
+        self.assertEqual(self.segments.search(["banana"], 10, "or"), expected)
+        self.assertIn("segments.test/manifest.json", self.segments.files())
+        self.segments.invalidate()
+        self.assertEqual(self.segments.snapshot.generation, 2)
+        self.assertIn(1, [doc_id for doc_id, _ in self.segments.search(["banana"], 10, "or")])
+        self.assertNotIn(4, [doc_id for doc_id, _ in self.segments.search(["banana"], 10, "or")])
+        write_manifest("segments.test", manifest)
+
+    def test_release(self):
+        scheme = TfIdfScoring([doc_id for doc_id in DOCUMENTS if doc_id != 1], "segments.test/schemed")
+        snapshot = scheme.acquire()
+        scheme.invalidate()
+        # a query holding the previous snapshot keeps reading it until it releases it
+        self.assertIsNot(scheme.snapshot, snapshot)
+        self.assertEqual(len(scheme.cursors(["banana"], snapshot=snapshot)), 1)
+        self.assertEqual(snapshot.count("banana"), 4)
+        readers = [segment.reader for segment in snapshot.segments]
+        snapshot.release()
+        self.assertTrue(all(reader.open.closed for reader in readers))
+        scheme.search(["banana", "cherry"], 10, "or")
+        scheme.score_all(["banana"], "or")
+        self.assertEqual(scheme.snapshot.references, 1)
+        readers = [segment.reader for segment in scheme.snapshot.segments]
+        scheme.invalidate()
+        self.assertTrue(all(reader.open.closed for reader in readers))
+
+    def test_sizes(self):
+        self.assertEqual(segment_sizes("segments.test", read_manifest("segments.test")), [(4, 1), (1, 0), (1, 0)])
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        shutil.rmtree("segments.test")
+        shutil.rmtree("single.test")
+
+
+class ManifestTest(unittest.TestCase):
+    def test_tiered(self):
+        self.assertIsNone(tiered_merge([(5000, 0), (10, 0), (10, 0), (10, 0)], factor=4, floor=100))
+        self.assertEqual(tiered_merge([(5000, 0), (10, 0), (10, 0), (10, 0), (10, 0)], factor=4, floor=100), (1, 5))
+        # segments are only merged with their neighbours
+        self.assertIsNone(tiered_merge([(10, 0), (10, 0), (5000, 0), (10, 0), (10, 0)], factor=4, floor=100))
+        # smaller tiers are merged first
+        sizes = [(500, 0)] * 4 + [(10, 0)] * 4
+        self.assertEqual(tiered_merge(sizes, factor=4, floor=100), (4, 8))
+        self.assertEqual(tiered_merge(sizes[:4], factor=4, floor=100), (0, 4))
+        # deleted documents do not count, and a segment with half of them deleted is merged alone
+        self.assertEqual(tiered_merge([(5000, 0), (500, 0), (80, 60)], factor=4, floor=100), (2, 3))
+        self.assertIsNone(tiered_merge([(5000, 0), (500, 100), (500, 0), (500, 0)], factor=4, floor=100))
+
+    def test_recover(self):
+        os.makedirs("recover.test/segments/live")
+        os.makedirs("recover.test/segments/crashed")
+        for file in ("schemed.index", "tombstones.1", "tombstones.2", f"{MANIFEST}.tmp", "doc_id.reference"):
+            open(f"recover.test/{file}", 'w').close()
+        write_manifest("recover.test", Manifest(2, [MAIN, "segments/live"], "tombstones.2", 10))
+        self.assertEqual(recover("recover.test").segments, [MAIN, "segments/live"])
+        self.assertEqual(sorted(os.listdir("recover.test")),
+                         ["doc_id.reference", MANIFEST, "schemed.index", "segments", "tombstones.2"])
+        self.assertEqual(os.listdir("recover.test/segments"), ["live"])
+        # the files of the main segment are removed once it was merged away
+        write_manifest("recover.test", Manifest(3, ["segments/live"], None, 10))
+        recover("recover.test")
+        self.assertEqual(sorted(os.listdir("recover.test")), ["doc_id.reference", MANIFEST, "segments"])
+        shutil.rmtree("recover.test")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,186 @@
+import mmap
+import os
+import struct
+from bisect import bisect_right
+from typing import Dict, IO, Iterator, List, Optional, Tuple
+
+from .codec import read_varint, write_varint
+
+TABLE_MAGIC = b"PTRM"
+TABLE_VERSION = 3
+
+# Table header: magic, format version, number of keys and number of keys per block
+TABLE_HEADER = struct.Struct("<4sBIH")
+# Offset of each block from the start of the file, in key order
+BLOCK_OFFSET = struct.Struct("<Q")
+# The position, count and largest impact of the postings of a key
+ENTRY_VALUE = struct.Struct("<QIf")
+
+# Keys are front coded in blocks of TERM_BLOCK keys. Each entry stores the length of the prefix it shares with the key
+# before it and the rest of the key as varints and bytes, followed by its value. The first key of a block shares
+# nothing, so a block can be decoded on its own.
+TERM_BLOCK = 16
+
+
+def write_term_table(file: IO, keys: Dict[str, list], block_size: int = TERM_BLOCK):
+    """
+    Write the position table of a posting file. Keys are sorted by their utf-8 encoding, which matches the order of
+    sorted() on the decoded strings, so the table can be binary searched without decoding.
+    :param file: a file opened in binary mode
+    :param keys: maps each key to its position in the posting file, the number of postings and their largest impact
+    :param block_size: the number of keys per front coded block
+    """
+    encoded = sorted((key.encode('utf-8'), value) for key, value in keys.items())
+    blocks = []
+    for start in range(0, len(encoded), block_size):
+        out = bytearray()
+        previous = b""
+        for key, (offset, count, impact) in encoded[start:start + block_size]:
+            shared = len(os.path.commonprefix([previous, key]))
+            write_varint(out, shared)
+            write_varint(out, len(key) - shared)
+            out += key[shared:]
+            out += ENTRY_VALUE.pack(offset, count, impact)
+            previous = key
+        blocks.append(out)
+    file.write(TABLE_HEADER.pack(TABLE_MAGIC, TABLE_VERSION, len(encoded), block_size))
+    position = TABLE_HEADER.size + BLOCK_OFFSET.size * len(blocks)
+    for block in blocks:
+        file.write(BLOCK_OFFSET.pack(position))
+        position += len(block)
+    for block in blocks:
+        file.write(block)
+
+
+def check_header(buffer, file_name: str) -> Tuple[int, int]:
+    """
+    :return: the number of keys and the number of keys per block
+    """
+    magic, version = struct.unpack_from("<4sB", buffer, 0)
+    if magic != TABLE_MAGIC:
+        raise ValueError(f"{file_name} is not a binary position table. Convert it with posting.text.convert")
+    if version != TABLE_VERSION:
+        raise ValueError(f"{file_name} has format version {version} but version {TABLE_VERSION} is required")
+    _, _, length, block_size = TABLE_HEADER.unpack_from(buffer, 0)
+    return length, block_size
+
+
+def read_term_table(file_name: str) -> Dict[str, list]:
+    """
+    Load a position table written by write_term_table into a dictionary.
+    """
+    table = TermTable(file_name)
+    keys = {key: list(value) for key, value in table.items()}
+    table.close()
+    return keys
+
+
+class TermTable:
+    """
+    A read-only view of a position table that is memory mapped instead of being loaded into a dictionary. Only the
+    first key of each block is held in memory. A lookup binary searches them and decodes a single block, so startup
+    and memory use grow with the number of blocks rather than the number of keys.
+    """
+
+    def __init__(self, file_name: str):
+        self.file = open(file_name, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.length, self.block_size = check_header(self.map, file_name)
+        self.blocks = -(-self.length // self.block_size)
+        self.first_keys: List[bytes] = [self.first_key(block) for block in range(self.blocks)]
+
+    def block_offset(self, block: int) -> int:
+        return BLOCK_OFFSET.unpack_from(self.map, TABLE_HEADER.size + BLOCK_OFFSET.size * block)[0]
+
+    def first_key(self, block: int) -> bytes:
+        position = self.block_offset(block)
+        # the first key shares nothing, so the prefix length is a single zero byte
+        size, position = read_varint(self.map, position + 1)
+        return self.map[position:position + size]
+
+    def entries(self, block: int) -> Iterator[Tuple[bytes, Tuple[int, int, float]]]:
+        """
+        Decode the keys and values of a block.
+        """
+        position = self.block_offset(block)
+        key = b""
+        for _ in range(min(self.block_size, self.length - block * self.block_size)):
+            shared, position = read_varint(self.map, position)
+            size, position = read_varint(self.map, position)
+            key = key[:shared] + self.map[position:position + size]
+            position += size
+            yield key, ENTRY_VALUE.unpack_from(self.map, position)
+            position += ENTRY_VALUE.size
+
+    def find(self, key: str) -> Optional[Tuple[int, int, float]]:
+        """
+        Find the value of the key in the table.
+        :return: the position, count and largest impact of the key or None if the key is not in the table
+        """
+        encoded = key.encode('utf-8')
+        block = bisect_right(self.first_keys, encoded) - 1
+        if block < 0:
+            return None
+        for entry, value in self.entries(block):
+            if entry == encoded:
+                return value
+            if entry > encoded:
+                return None
+        return None
+
+    def items(self, start: Optional[str] = None,
+              end: Optional[str] = None) -> Iterator[Tuple[str, Tuple[int, int, float]]]:
+        """
+        Iterate over the keys and values in key order.
+        :param start: the first key to include, or None to start at the first key
+        :param end: the first key to exclude, or None to continue to the last key
+        """
+        start = start.encode('utf-8') if start is not None else b""
+        end = end.encode('utf-8') if end is not None else None
+        for block in range(max(0, bisect_right(self.first_keys, start) - 1), self.blocks):
+            for key, value in self.entries(block):
+                if key < start:
+                    continue
+                if end is not None and key >= end:
+                    return
+                yield str(key, 'utf-8'), value
+
+    def prefix(self, prefix: str) -> Iterator[Tuple[str, Tuple[int, int, float]]]:
+        """
+        Iterate over the keys starting with prefix and their values in key order.
+        """
+        encoded = prefix.encode('utf-8')
+        for key, value in self.items(prefix):
+            if not key.encode('utf-8').startswith(encoded):
+                return
+            yield key, value
+
+    def count(self, key: str) -> int:
+        """
+        The number of postings of a key, or 0 if the key is not in the table.
+        """
+        value = self.find(key)
+        return value[1] if value is not None else 0
+
+    def __contains__(self, item: str):
+        return self.find(item) is not None
+
+    def __getitem__(self, item: str) -> Tuple[int, int, float]:
+        value = self.find(item)
+        if value is None:
+            raise KeyError(item)
+        return value
+
+    def __iter__(self) -> Iterator[str]:
+        for key, _ in self.items():
+            yield key
+
+    def __len__(self):
+        return self.length
+
+    def keys(self):
+        return self
+
+    def close(self):
+        self.map.close()
+        self.file.close()
@@ -0,0 +1,53 @@
+import os
+import random
+import unittest
+
+from .terms import TermTable, read_term_table, write_term_table
+
+
+class TermTableTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        generator = random.Random(3)
+        words = {"".join(generator.choice("abcé") for _ in range(generator.randint(1, 8))) for _ in range(2000)}
+        cls.keys = {word: [index * 10, index + 1, index / 4] for index, word in enumerate(sorted(words))}
+        with open("terms.test.position", 'wb') as f:
+            write_term_table(f, cls.keys)
+
+    def setUp(self) -> None:
+        self.table = TermTable("terms.test.position")
+
+    def test_lookup(self):
+        self.assertEqual(len(self.table), len(self.keys))
+        for key, value in self.keys.items():
+            self.assertEqual(list(self.table[key]), value)
+            self.assertEqual(self.table.count(key), value[1])
+        for missing in ("", "d", "aaaaaaaaa", "éééééééééé"):
+            self.assertNotIn(missing, self.table)
+            self.assertEqual(self.table.count(missing), 0)
+        self.assertRaises(KeyError, lambda: self.table["d"])
+
+    def test_iteration(self):
+        self.assertEqual(list(self.table), sorted(self.keys))
+        self.assertEqual(read_term_table("terms.test.position"), self.keys)
+
+    def test_prefix(self):
+        for prefix in ("a", "cé", "bab", "é", "z"):
+            self.assertEqual([key for key, _ in self.table.prefix(prefix)],
+                             sorted(key for key in self.keys if key.startswith(prefix)))
+
+    def test_range(self):
+        self.assertEqual([key for key, _ in self.table.items("b", "c")],
+                         sorted(key for key in self.keys if "b" <= key < "c"))
+        self.assertEqual([key for key, _ in self.table.items("cb")], sorted(key for key in self.keys if key >= "cb"))
+
+    def tearDown(self) -> None:
+        self.table.close()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        os.remove("terms.test.position")
+
+
+if __name__ == '__main__':
+    unittest.main()
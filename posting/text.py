@@ -0,0 +1,195 @@
+import os
+from collections import defaultdict
+from threading import RLock
+from typing import IO, Type
+
+from .codec import MAGIC
+from .io import PostingWriter
+from .post import Posting
+
+TOKENS = {'\n', '\t', '\v', '\f'}
+
+
+class TextPostingWriter:
+    """
+    TextPostingWriter enables you to write postings in the legacy text format and keep track of their indexes. Do not
+    write to the file the same key multiple times.
+    """
+
+    def __init__(self, file_name: str):
+        """
+        Initialize the writer pointed at the file name. This will be opened with w+ permissions so ensure that the file
+        is unique or disposable.
+        :param file_name: the base name of the file.
+        """
+        self.open = open(f"{file_name}.index", 'w+')
+        self.index = open(f"{file_name}.index.position", 'w+')
+        self.keys = defaultdict(lambda: list([0, 0]))
+        self.curr_key = None
+
+    def write_key(self, key: str):
+        """
+        Write a key at the current position.
+        :param key:
+        :return:
+        """
+        self.curr_key = key
+        if len(self.keys) > 0:
+            self.open.write('\n')
+        self.keys[key][0] = self.open.tell()
+        self.open.write(f"{key}")
+
+    def write_posting(self, posting: Posting):
+        self.keys[self.curr_key][1] += 1
+        self.open.write(f"\f{str(posting)}")
+
+    def write(self, *postings: Posting):
+        partition = "\f"
+        partition += "\f".join([str(posting) for posting in postings])
+        self.keys[self.curr_key][1] += len(postings)
+        self.open.write(partition)
+
+    def flush(self):
+        self.open.flush()
+
+    def close(self):
+        for key in sorted(self.keys):
+            self.index.write(f"{key}\t{self.keys[key][0]}\t{self.keys[key][1]}\n")
+        self.keys.clear()
+        self.index.close()
+        self.open.close()
+
+
+class TextPostingIterator:
+    BUFFER_SIZE = 16384
+
+    def __init__(self, lock: RLock, file: IO, posting: Type[Posting]):
+        self.lock = lock
+
+        self.file = file
+        self.posting = posting
+
+        self.posting_buffer = []
+
+        self.buffer = file.readline(TextPostingIterator.BUFFER_SIZE)
+
+        self.end = False
+        with self.lock:
+            buffer = self.buffer
+            while '\f' not in buffer and not buffer.endswith('\n') and not self.end:
+                buffer = self.file.readline(TextPostingIterator.BUFFER_SIZE)
+                if buffer.endswith('\n'):
+                    self.end = True
+                self.buffer += buffer
+            if self.buffer.endswith('\n'):
+                self.buffer = self.buffer.rstrip('\n')
+                self.end = True
+        self.position = file.tell()
+
+        parsed = self.buffer.split('\f')
+        self.current = parsed[0]
+        parsed = parsed[1:]
+        if self.end:
+            self.posting_buffer.extend([self.posting.parse(segment) for segment in parsed])
+        else:
+            self.buffer = parsed[-1]
+            parsed = parsed[:-1]
+            self.posting_buffer.extend([self.posting.parse(segment) for segment in parsed])
+
+    def __read__(self):
+        with self.lock:
+            buffer = self.buffer
+            self.file.seek(self.position)
+            while '\f' not in buffer and not buffer.endswith('\n') and not self.end:
+                buffer = self.file.readline(8096)
+                if buffer.endswith('\n') or len(buffer) == 0:
+                    self.end = True
+                self.buffer += buffer
+
+            self.position = self.file.tell()
+            if self.buffer.endswith('\n'):
+                self.buffer = self.buffer.rstrip('\n')
+                self.end = True
+            if not self.buffer:
+                return
+            parsed = self.buffer.split('\f')
+            if self.end:
+                self.posting_buffer.extend([self.posting.parse(segment) for segment in parsed])
+            else:
+                self.buffer = parsed[-1]
+                parsed = parsed[:-1]
+                self.posting_buffer.extend([self.posting.parse(segment) for segment in parsed])
+
+    def current_key(self):
+        return self.current
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> Posting:
+        if self.posting_buffer:
+            return self.posting_buffer.pop(0)
+        if not self.end:
+            self.__read__()
+            if self.posting_buffer:
+                return self.posting_buffer.pop(0)
+        raise StopIteration
+
+
+class TextPostingReader:
+    def __init__(self, file_name: str, posting: Type[Posting]):
+        self.open = open(f"{file_name}.index", 'r')
+        self.index = open(f"{file_name}.index.position", 'r')
+        keys = dict()
+        for row in self.index:
+            s = row.split('\t')
+            keys[s[0]] = [int(s[1]), int(s[2])]
+        self.index.close()
+
+        self.keys = keys
+
+        self.posting_type = posting
+        self.read_lock = RLock()
+
+    def __contains__(self, item):
+        return item in self.keys
+
+    def count(self, key: str):
+        return self.keys[key][1]
+
+    def get_iterator(self):
+        return TextPostingIterator(self.read_lock, self.open, self.posting_type)
+
+    def seek(self, position: int or str):
+        if type(position) is int:
+            self.open.seek(position)
+        else:
+            self.open.seek(self.keys[position][0])
+
+    def close(self):
+        self.open.close()
+
+
+def convert(file_name: str, posting: Type[Posting], destination: str = None):
+    """
+    Convert an index written in the legacy text format to the binary format read by PostingReader.
+    :param file_name: the base name of the text index
+    :param posting: the posting type stored in the index
+    :param destination: the base name of the binary index. If not given, the text index is replaced in place.
+    """
+    with open(f"{file_name}.index", 'rb') as f:
+        if f.read(len(MAGIC)) == MAGIC:
+            return
+    target = destination if destination else f"{file_name}.binary"
+    reader = TextPostingReader(file_name, posting)
+    writer = PostingWriter(target)
+    for key in sorted(reader.keys):
+        reader.seek(key)
+        writer.write_key(key)
+        writer.write(*reader.get_iterator())
+    writer.flush()
+    writer.close()
+    reader.close()
+    if not destination:
+        os.replace(f"{target}.index", f"{file_name}.index")
+        os.replace(f"{target}.index.position", f"{file_name}.index.position")
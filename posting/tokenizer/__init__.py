@@ -1,5 +1,8 @@
 import abc
-from typing import Dict, List, Optional
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+if TYPE_CHECKING:
+    from .document import Document
 
 
 class Token:
@@ -35,6 +38,17 @@ class TokenizeResult:
 
 class Tokenizer(abc.ABC):
     def tokenize(self, file_name: str) -> Optional[TokenizeResult]:
+        # imported here so the tokenizer interface does not require the HTML parser
+        from .document import analyze
+        document = analyze(file_name)
+        if document is None:
+            return None
+        return self.tokenize_document(document)
+
+    def tokenize_document(self, document: "Document") -> Optional[TokenizeResult]:
+        """
+        Tokenize a document that was already parsed, so that several tokenizers can share one parse.
+        """
         raise NotImplementedError
 
     def tokenizer_query(self, query: str):
@@ -0,0 +1,96 @@
+import json
+import re
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+from bs4 import BeautifulSoup
+from bs4.element import Comment
+from nltk.stem import PorterStemmer
+
+from .link import find_hrefs
+
+PERMITTED_ENCODINGS = {
+    "utf-8", "latin-1", "utf-16", "utf-32", "ascii", "ISO-8859-1".lower(), "UTF-8-SIG".lower(), "EUC-KR".lower(),
+    "EUC-JP".lower()
+}
+
+RE_MATCH = re.compile(r"\w+", re.ASCII)
+STEMMER = PorterStemmer()
+
+BOLD_TAGS = ('b', 'h1', 'h2', 'h3', 'h4')
+
+
+def tag_visible(element):
+    """
+    Snippet was obtained via https://stackoverflow.com/questions/1936466/beautifulsoup-grab-visible-webpage-text
+    """
+    if element.parent.name in ['style', 'script', 'head', 'title', 'meta', '[document]']:
+        return False
+    if isinstance(element, Comment):
+        return False
+    return True
+
+
+def tokenizer(text: Optional[str]) -> List[str]:
+    if text is None:
+        return []
+    return RE_MATCH.findall(text.strip())
+
+
+@lru_cache(maxsize=1 << 16)
+def process_token(token: str) -> str:
+    return STEMMER.stem(token.lower().strip())
+
+
+def process(text: Optional[str]) -> List[str]:
+    return [token for token in map(process_token, tokenizer(text)) if token]
+
+
+class Document:
+    def __init__(self, file_name: str, url: str, tokens: List[str], bold: List[str], title: List[str],
+                 links: List[Tuple[str, List[str]]], hrefs: List[str]):
+        """
+        A document parsed once and shared by every tokenizer.
+        :param file_name: the file the document was read from
+        :param url: the url of the document as crawled
+        :param tokens: the stemmed tokens of the visible text in order
+        :param bold: the stemmed tokens of bold text and headings
+        :param title: the stemmed tokens of the title
+        :param links: the href of each link with the stemmed tokens of its text
+        :param hrefs: the href of every anchor as find_hrefs finds them, which the link graph is built from
+        """
+        self.file_name = file_name
+        self.url = url
+        self.tokens = tokens
+        self.bold = bold
+        self.title = title
+        self.links = links
+        self.hrefs = hrefs
+
+
+def analyze(file_name: str) -> Optional[Document]:
+    """
+    Parse a crawled document.
+    :return: the document or None if it is not in a permitted encoding
+    """
+    with open(file_name, 'r') as f:
+        obj = json.load(f)
+    if obj["encoding"].lower() not in PERMITTED_ENCODINGS:
+        return None
+    document = BeautifulSoup(obj["content"], 'lxml', from_encoding=obj["encoding"])
+
+    tokens = []
+    for tag in filter(tag_visible, document.find_all(text=True)):
+        tokens.extend(process(tag.string))
+
+    bold = []
+    for tag in BOLD_TAGS:
+        for element in document.find_all(tag, text=True):
+            bold.extend(process(element.string))
+
+    title = process(document.title.string) if document.title else []
+
+    # Link finding taken from
+    # https://stackoverflow.com/questions/1080411/retrieve-links-from-web-page-using-python-and-beautifulsoup
+    links = [(element['href'], process(element.getText())) for element in document.find_all('a', href=True)]
+    return Document(file_name, obj["url"], tokens, bold, title, links, find_hrefs(obj["content"]))
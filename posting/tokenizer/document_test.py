@@ -0,0 +1,49 @@
+import json
+import os
+import unittest
+
+try:
+    from .document import analyze, process, tokenizer
+except ImportError:
+    # the HTML parser and the stemmer are not installed
+    analyze = None
+
+PAGE = ('<html><head><title>Example Page</title><style>p {color: red}</style></head><body><h1>Running Dogs</h1>'
+        '<p>The <b>quick</b> fox jumps<!-- a comment --></p><script>var x = 1;</script>'
+        '<a href="/next">Next page</a><a name="top">Top</a></body></html>')
+
+
+@unittest.skipIf(analyze is None, "bs4, lxml and nltk are required to parse documents")
+class AnalyzeTest(unittest.TestCase):
+    def write(self, encoding: str):
+        with open("document.test", 'w') as f:
+            json.dump({"url": "https://example.com/page", "content": PAGE, "encoding": encoding}, f)
+
+    def test_tokenizer(self):
+        self.assertEqual(tokenizer(" a-b c_d é "), ["a", "b", "c_d"])
+        self.assertEqual(tokenizer(None), [])
+        self.assertEqual(process("Running DOGS"), ["run", "dog"])
+
+    def test_analyze(self):
+        self.write("UTF-8")
+        document = analyze("document.test")
+        self.assertEqual((document.file_name, document.url), ("document.test", "https://example.com/page"))
+        # the title, styles, scripts and comments are not visible text
+        self.assertEqual(document.tokens, ["run", "dog", "the", "quick", "fox", "jump", "next", "page", "top"])
+        self.assertEqual(document.bold, ["quick", "run", "dog"])
+        self.assertEqual(document.title, ["exampl", "page"])
+        self.assertEqual(document.links, [("/next", ["next", "page"])])
+        # the link graph reads the same hrefs without the anchors BeautifulSoup skips
+        self.assertEqual(document.hrefs, ["/next"])
+
+    def test_encoding(self):
+        self.write("shift_jis")
+        self.assertIsNone(analyze("document.test"))
+
+    def tearDown(self) -> None:
+        if os.path.exists("document.test"):
+            os.remove("document.test")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+from html.parser import HTMLParser
+from typing import List
+
+
+class LinkParser(HTMLParser):
+    def __init__(self):
+        """
+        Collect the href of every anchor of a page without building a document tree, for passes that only need the
+        links. Hrefs are found in document order with character references resolved, as analyze finds them.
+        """
+        super().__init__()
+        self.hrefs: List[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag != 'a':
+            return
+        for name, value in attrs:
+            if name == 'href':
+                # an href without a value is empty, as BeautifulSoup reads it
+                self.hrefs.append(value if value is not None else "")
+                return
+
+
+def find_hrefs(content: str) -> List[str]:
+    """
+    :return: the href of each anchor of an html page in document order
+    """
+    parser = LinkParser()
+    parser.feed(content)
+    parser.close()
+    return parser.hrefs
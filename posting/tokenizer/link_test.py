@@ -0,0 +1,23 @@
+import unittest
+
+from .link import find_hrefs
+
+
+class FindHrefsTest(unittest.TestCase):
+    def test_order(self):
+        content = ('<html><body><a href="/b">b</a><p><a href="http://example.com/a?x=1&amp;y=2">a</a></p>'
+                   '<A HREF="C.html">c</A></body></html>')
+        self.assertEqual(find_hrefs(content), ["/b", "http://example.com/a?x=1&y=2", "C.html"])
+
+    def test_ignored(self):
+        content = ('<link href="style.css"><a name="top">top</a><area href="map.html">'
+                   '<script>document.write("<a href=\'script.html\'>")</script><a href>empty</a>')
+        self.assertEqual(find_hrefs(content), [""])
+
+    def test_malformed(self):
+        self.assertEqual(find_hrefs('<a href="first"><a href=second>unclosed'), ["first", "second"])
+        self.assertEqual(find_hrefs(""), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,28 @@
-
-from posting.tokenizer import Tokenizer, TokenizeResult
+from collections import defaultdict
 from typing import Optional
 
+from posting.tokenizer import Tokenizer, TokenizeResult, Token
+from posting.tokenizer.document import Document, RE_MATCH, process_token
+from posting.tokenizer.ngram import parse_int
+
+
 class PositionTokenizer(Tokenizer):
-    def tokenize(self, file_name: str) -> Optional[TokenizeResult]:
-        raise NotImplementedError
+    def tokenize_document(self, document: Document) -> Optional[TokenizeResult]:
+        """
+        Tokenize the words of a document with the positions they occur at. Positions count every token of the text,
+        including the ones that are skipped, so adjacent positions are adjacent words of the text.
+        """
+        positions = defaultdict(list)
+        token_count = 0
+        for position, token in enumerate(document.tokens):
+            if parse_int(token) and len(token) > 5:
+                continue
+            if token.count('-') > 3 or token.count("\\") > 3 or token.count('/') > 3:
+                continue
+            positions[token].append(position)
+            token_count += 1
+        return TokenizeResult(document.url, [Token(word, len(occurrences), {"positions": occurrences})
+                                             for word, occurrences in positions.items()], token_count)
 
     def tokenizer_query(self, query: str):
-        raise NotImplementedError
+        return list(map(process_token, RE_MATCH.findall(query)))
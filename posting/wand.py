@@ -0,0 +1,202 @@
+import math
+from heapq import heappush, heapreplace
+from typing import Callable, List, Optional, Tuple, Union
+
+from .io import PostingIterator
+from .post import Posting
+
+END = math.inf
+
+# query modes: a document matches when it contains every term, any term, or at least k terms when the mode is an
+# integer k
+AND = "and"
+OR = "or"
+QueryMode = Union[str, int]
+
+
+def minimum_match(mode: QueryMode, terms: int) -> int:
+    """
+    The number of the terms of a query a document has to contain in a mode.
+    """
+    if mode == AND:
+        return terms
+    if mode == OR:
+        return min(1, terms)
+    if type(mode) is int and mode > 0:
+        return min(mode, terms)
+    raise ValueError(f"{mode!r} is not a query mode")
+
+
+class Cursor:
+    """
+    The position of top-k retrieval in the postings of one query term. A posting adds weight times its impact property
+    to the score of its document, so weight times the impacts stored by the writer bounds the contribution of the term
+    and of each of its blocks.
+    """
+
+    def __init__(self, iterator: PostingIterator, weight: float, bound: float):
+        """
+        :param iterator: the postings of the term, of a posting type that declares an impact property
+        :param weight: the weight of the term in the query
+        :param bound: the largest impact of the term, as given by PostingReader.impact
+        """
+        self.iterator = iterator
+        self.weight = weight
+        self.bound = weight * bound
+        self.impact = iterator.posting.INDEX[iterator.posting.IMPACT]
+        self.posting: Optional[Posting] = None
+        self.doc = -1
+        self.next()
+
+    def move(self, posting: Optional[Posting]):
+        self.posting = posting
+        self.doc = posting.doc_id if posting is not None else END
+
+    def next(self):
+        self.move(next(self.iterator, None))
+
+    def advance(self, doc_id: int):
+        if self.doc < doc_id:
+            self.move(self.iterator.advance_to(doc_id))
+
+    def block(self, doc_id: int) -> Tuple[float, float]:
+        """
+        :return: the last doc_id of the block that would hold doc_id and the bound of the term within it
+        """
+        bound = self.iterator.block_bound(doc_id)
+        if bound is None:
+            return END, 0.0
+        return bound[0], self.weight * bound[1]
+
+    def score(self) -> float:
+        return self.weight * self.posting.properties[self.impact]
+
+
+class TopK:
+    """
+    The best documents seen so far. Ties are broken in favour of the smaller doc_id.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.heap: List[Tuple[float, int]] = []
+
+    def threshold(self) -> float:
+        """
+        The score a document has to beat to enter the top k.
+        """
+        if len(self.heap) < self.limit:
+            return -math.inf
+        return self.heap[0][0]
+
+    def push(self, doc_id: int, score: float):
+        item = (score, -doc_id)
+        if len(self.heap) < self.limit:
+            heappush(self.heap, item)
+        elif item > self.heap[0]:
+            heapreplace(self.heap, item)
+
+    def results(self) -> List[Tuple[int, float]]:
+        return [(-doc_id, score) for score, doc_id in sorted(self.heap, reverse=True)]
+
+
+# the number of steps block_max_wand takes between calls to stop
+STOP_INTERVAL = 64
+
+
+def block_max_wand(cursors: List[Cursor], limit: int, conjunctive: bool = False,
+                   fixed: Callable[[int], float] = None, fixed_bound: float = 0.0,
+                   stop: Callable[[], bool] = None, minimum: int = 1) -> List[Tuple[int, float]]:
+    """
+    Find the exact top k documents by the sum of the contributions of the cursors with Block-Max WAND. Documents and
+    runs of blocks whose bound cannot beat the current top k are skipped without being decoded.
+    :param cursors: one cursor per query term
+    :param limit: the number of documents to return
+    :param conjunctive: only score documents that contain every term instead of any term
+    :param fixed: a query independent score added to every matching document
+    :param fixed_bound: the largest value fixed can return
+    :param stop: called every STOP_INTERVAL steps. Once it returns True, the best documents found so far are returned
+    instead of the exact top k.
+    :param minimum: only score documents that contain at least minimum terms. Cursors are skipped past documents that
+    too few of them are positioned before, so a larger minimum reads less.
+    :return: the doc_ids and scores in decreasing order of score
+    """
+    top = TopK(limit)
+    if limit <= 0 or not cursors or minimum > len(cursors):
+        return []
+    if conjunctive or minimum == len(cursors):
+        return conjunctive_block_max_wand(cursors, top, fixed, fixed_bound, stop)
+
+    cursors = [cursor for cursor in cursors if cursor.doc != END]
+    steps = 0
+    while cursors:
+        steps += 1
+        if stop and steps % STOP_INTERVAL == 0 and stop():
+            break
+        cursors.sort(key=lambda c: c.doc)
+        threshold = top.threshold()
+
+        # the pivot is the first document that minimum cursors can reach and whose bound over the cursors up to it can
+        # beat the threshold
+        upper = fixed_bound
+        pivot = None
+        for i, cursor in enumerate(cursors):
+            upper += cursor.bound
+            if upper > threshold and i + 1 >= minimum:
+                pivot = i
+                break
+        if pivot is None:
+            break
+        doc = cursors[pivot].doc
+        while pivot + 1 < len(cursors) and cursors[pivot + 1].doc == doc:
+            pivot += 1
+
+        blocks = [cursor.block(doc) for cursor in cursors[:pivot + 1]]
+        if fixed_bound + sum(bound for _, bound in blocks) > threshold:
+            if cursors[0].doc == doc:
+                score = sum(cursor.score() for cursor in cursors[:pivot + 1])
+                if fixed:
+                    score += fixed(doc)
+                top.push(doc, score)
+                for cursor in cursors[:pivot + 1]:
+                    cursor.next()
+            else:
+                for cursor in cursors[:pivot]:
+                    cursor.advance(doc)
+        else:
+            # no document before the end of the shortest block can beat the threshold
+            target = min(last for last, _ in blocks) + 1
+            if pivot + 1 < len(cursors):
+                target = min(target, cursors[pivot + 1].doc)
+            for cursor in cursors[:pivot + 1]:
+                cursor.advance(target)
+        cursors = [cursor for cursor in cursors if cursor.doc != END]
+    return top.results()
+
+
+def conjunctive_block_max_wand(cursors: List[Cursor], top: TopK, fixed: Callable[[int], float],
+                               fixed_bound: float, stop: Callable[[], bool] = None) -> List[Tuple[int, float]]:
+    steps = 0
+    while True:
+        steps += 1
+        if stop and steps % STOP_INTERVAL == 0 and stop():
+            break
+        doc = max(cursor.doc for cursor in cursors)
+        if doc == END:
+            break
+        blocks = [cursor.block(doc) for cursor in cursors]
+        if fixed_bound + sum(bound for _, bound in blocks) <= top.threshold():
+            target = min(last for last, _ in blocks) + 1
+            for cursor in cursors:
+                cursor.advance(target)
+            continue
+        for cursor in cursors:
+            cursor.advance(doc)
+        if all(cursor.doc == doc for cursor in cursors):
+            score = sum(cursor.score() for cursor in cursors)
+            if fixed:
+                score += fixed(doc)
+            top.push(doc, score)
+            for cursor in cursors:
+                cursor.next()
+    return top.results()
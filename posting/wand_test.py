@@ -0,0 +1,93 @@
+import glob
+import os
+import random
+import unittest
+
+from .io import PostingReader, PostingWriter
+from .post import create_posting_type
+from .wand import AND, OR, Cursor, block_max_wand, minimum_match
+
+IMPACT_POSTING = create_posting_type("impact_type", {"count": int, "weight": float}, impact="weight")
+
+
+class WandTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        generator = random.Random(7)
+        cls.lists = dict()
+        writer = PostingWriter("wand.test")
+        for key, size in (("a", 3000), ("b", 800), ("c", 40)):
+            docs = sorted(generator.sample(range(5000), size))
+            cls.lists[key] = {doc: float(generator.randint(0, 1000)) / 8 for doc in docs}
+            writer.write_key(key)
+            writer.write(*[IMPACT_POSTING(doc, [1, weight]) for doc, weight in cls.lists[key].items()])
+        writer.flush()
+        writer.close()
+
+    def setUp(self) -> None:
+        self.reader = PostingReader("wand.test", IMPACT_POSTING, memory_map=True)
+
+    def cursors(self, weights):
+        return [Cursor(self.reader.get_iterator(key), weight, self.reader.impact(key))
+                for key, weight in weights.items()]
+
+    def expected(self, weights, limit, conjunctive, minimum=1):
+        scores = dict()
+        for key, weight in weights.items():
+            for doc, impact in self.lists[key].items():
+                scores.setdefault(doc, []).append(weight * impact)
+        results = [(doc, sum(values)) for doc, values in scores.items()
+                   if (not conjunctive or len(values) == len(weights)) and len(values) >= minimum]
+        return sorted(results, key=lambda x: (-x[1], x[0]))[:limit]
+
+    def test_bounds(self):
+        self.assertEqual(self.reader.impact("c"), max(self.lists["c"].values()))
+
+    def test_disjunctive(self):
+        weights = {"a": 0.5, "b": 1.0, "c": 2.0}
+        self.assertEqual(block_max_wand(self.cursors(weights), 10), self.expected(weights, 10, False))
+
+    def test_conjunctive(self):
+        weights = {"a": 0.25, "b": 1.0}
+        self.assertEqual(block_max_wand(self.cursors(weights), 20, conjunctive=True),
+                         self.expected(weights, 20, True))
+
+    def test_minimum(self):
+        weights = {"a": 0.25, "b": 1.0, "c": 4.0}
+        for minimum in (1, 2, 3):
+            self.assertEqual(block_max_wand(self.cursors(weights), 20, minimum=minimum),
+                             self.expected(weights, 20, False, minimum))
+        self.assertEqual(minimum_match(AND, 3), 3)
+        self.assertEqual(minimum_match(OR, 3), 1)
+        self.assertEqual(minimum_match(5, 3), 3)
+        self.assertRaises(ValueError, minimum_match, "xor", 3)
+
+    def test_fixed(self):
+        weights = {"b": 1.0, "c": 1.0}
+        fixed = {doc: float(doc % 7) for doc in range(5000)}
+        expected = sorted([(doc, score + fixed[doc]) for doc, score in self.expected(weights, 5000, False)],
+                          key=lambda x: (-x[1], x[0]))[:5]
+        self.assertEqual(block_max_wand(self.cursors(weights), 5, fixed=fixed.get, fixed_bound=6.0), expected)
+
+    def test_stop(self):
+        weights = {"a": 1.0, "b": 1.0}
+        calls = []
+        results = block_max_wand(self.cursors(weights), 10, stop=lambda: calls.append(True) or True)
+        self.assertEqual(len(calls), 1)
+        # the documents found before stopping keep their exact scores
+        scores = dict(self.expected(weights, 5000, False))
+        self.assertTrue(all(scores[doc] == score for doc, score in results))
+        self.assertEqual(block_max_wand(self.cursors(weights), 10, stop=lambda: False),
+                         self.expected(weights, 10, False))
+
+    def tearDown(self) -> None:
+        self.reader.close()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        for g in glob.glob("wand.test.*"):
+            os.remove(g)
+
+
+if __name__ == '__main__':
+    unittest.main()
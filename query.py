@@ -1,30 +1,89 @@
 import json
-from heapq import nlargest
+import os
+from collections import deque
+from threading import Lock
 from time import time
+from typing import List, Tuple
 
-from flask import Flask, render_template, request
+from flask import Flask, jsonify, render_template, request
 
-from doc import from_document_dictionary
-from fixed import FixedScoreDictionary
+from doc import from_document_store
+from fixed import FIXED_SCORES, FixedScoreDictionary
+from fixed.graph import GRAPH
+from fixed.hits import HITS
+from posting.cache import LRUCache, PostingCache
 from posting.score import MultiScoringScheme
+from posting.score.positional import PositionalScoring
 from posting.score.tf_idf import TfIdfScoring
 from posting.tokenizer.bold import BoldTokenizer
 from posting.tokenizer.ngram import WordTokenizer, BigramTokenizer
+from posting.tokenizer.position import PositionTokenizer
 
 app = Flask(__name__)
 
 INDEXES = {"indexes/default": (1, WordTokenizer()), "indexes/bigram": (4, BigramTokenizer()),
            "indexes/bold": (3, BoldTokenizer())}
-DICTIONARY = from_document_dictionary("indexes/default")
+# the indexes are built together and share doc_ids, so one store serves every scheme. It is reopened with the schemes
+# once an incremental update rewrote it.
+DICTIONARY = from_document_store("indexes/default", reopening=True)
 SCHEMES = dict()
 
+# decoded postings of hot words, 256MB shared by every scheme
+POSTING_CACHE = PostingCache(256 << 20)
+
 for index in INDEXES:
-    dictionary = from_document_dictionary(index)
-    scheme = TfIdfScoring(dictionary, f"{index}/schemed")
+    champion = f"{index}/champion" if os.path.exists(f"{index}/champion.index") else None
+    scheme = TfIdfScoring(DICTIONARY, f"{index}/schemed", champion, POSTING_CACHE)
     SCHEMES[index] = (INDEXES[index][0], INDEXES[index][1], scheme)
 
-FIXED = FixedScoreDictionary("indexes/page_rank", read=True)
-MULTIWAY = MultiScoringScheme(FIXED, *SCHEMES.values())
+# phrases of the query are matched in the positional index, which replaced the trigram index
+if os.path.exists("indexes/position/schemed.index") or os.path.exists("indexes/position/manifest.json"):
+    SCHEMES["indexes/position"] = (4, PositionTokenizer(),
+                                   PositionalScoring(DICTIONARY, "indexes/position/schemed", cache=POSTING_CACHE))
+
+# the query independent scores of documents and their weights
+FIXED = [(1.0, FixedScoreDictionary("indexes/page_rank", read=True))]
+if os.path.exists(f"indexes/hits/{FIXED_SCORES}"):
+    FIXED.append((0.5, FixedScoreDictionary("indexes/hits", read=True)))
+# the results are reranked by HITS over the links around them, when the link graph was extracted
+BASE_SET = None
+if os.path.exists(f"indexes/page_rank/{GRAPH}"):
+    BASE_SET = (0.5, HITS(DICTIONARY, None, graph_file=f"indexes/page_rank/{GRAPH}"))
+    BASE_SET[1].open()
+# the results of the last 10000 queries, kept for at most 10 minutes
+MULTIWAY = MultiScoringScheme(FIXED, *SCHEMES.values(), cache=LRUCache(10000, ttl=600), base_set=BASE_SET,
+                              store=DICTIONARY)
+# the time in seconds the schemes are given to answer a query
+QUERY_TIMEOUT = 0.2
+# every query is appended to the query log, and the last QUERY_LOG_WARM queries warm the posting cache at startup
+QUERY_LOG = "indexes/queries.log"
+QUERY_LOG_WARM = 10000
+QUERY_LOG_LOCK = Lock()
+# the query log is moved to QUERY_LOG.1 once it grows past QUERY_LOG_SIZE bytes, replacing the one moved before
+QUERY_LOG_SIZE = 16 << 20
+
+
+def log_query(query: str):
+    with QUERY_LOG_LOCK:
+        if os.path.exists(QUERY_LOG) and os.path.getsize(QUERY_LOG) >= QUERY_LOG_SIZE:
+            os.replace(QUERY_LOG, f"{QUERY_LOG}.1")
+        with open(QUERY_LOG, 'a', encoding='utf-8') as log:
+            log.write(" ".join(query.split()) + "\n")
+
+
+def recent_queries(limit: int) -> deque:
+    """
+    The last limit queries of the query log, read line by line so only limit of them are kept in memory.
+    """
+    queries = deque(maxlen=limit)
+    for file in (f"{QUERY_LOG}.1", QUERY_LOG):
+        if os.path.exists(file):
+            with open(file, 'r', encoding='utf-8') as log:
+                queries.extend(line.rstrip("\n") for line in log)
+    return queries
+
+
+MULTIWAY.warm(recent_queries(QUERY_LOG_WARM))
 
 
 class QueryResult:
@@ -33,18 +92,34 @@ class QueryResult:
         self.score = score
 
 
+def query_results(results: List[Tuple[int, float]]) -> List[QueryResult]:
+    """
+    Look up the urls of the results. Documents of a segment committed before the store was rewritten are not in the
+    store yet and are left out until the next check of the indexes reopens it.
+    """
+    return [QueryResult(DICTIONARY.find_url_by_id(doc_id), score) for doc_id, score in results if doc_id in DICTIONARY]
+
+
 @app.route("/", methods=["GET", "POST"])
 def search():
     start_time = time()
     if "query" in request.form:
-        top = [QueryResult(DICTIONARY.find_url_by_id(doc_id), score) for doc_id, score in
-               MULTIWAY.score(request.form['query'])]
+        log_query(request.form['query'])
+        results, query_statistics = MULTIWAY.search(request.form['query'], timeout=QUERY_TIMEOUT)
+        top = query_results(results)
         end_time = time()
-        return render_template("index.html", query_result=True, query_results=top, difference=end_time - start_time)
+        return render_template("index.html", query_result=True, query_results=top, difference=end_time - start_time,
+                               statistics=query_statistics)
     end_time = time()
     return render_template("index.html", query_result=False, query_results=[], difference=end_time - start_time)
 
 
+@app.route("/statistics", methods=["GET"])
+def statistics():
+    return jsonify({**MULTIWAY.statistics.to_dict(), "result_cache": MULTIWAY.cache.to_dict(),
+                    "posting_cache": POSTING_CACHE.to_dict()})
+
+
 if __name__ == "__main__":
     print("Starting the actual application")
     query_input = None
@@ -56,11 +131,11 @@ if __name__ == "__main__":
         start = time()
         query = tokenizer.tokenizer_query(query_input)
         print(query)
-        documents = nlargest(20, scheme.score(query), key=lambda x: x[1])
+        documents = scheme.top(query, 20)
         end = time()
         print("Result in " + str(end - start))
         for i, document in enumerate(documents):
             with open(dictionary.get_doc_file(document[0]), 'r') as f:
                 print(i, json.load(f)['url'], document[1])
     print("Starting the server")
-    app.run(port=8081)
+    app.run(port=8081, threaded=True)